@@ -15,19 +15,23 @@ from fastapi import FastAPI
 from fastapi.openapi.docs import get_swagger_ui_html
 from loguru._defaults import LOGURU_FORMAT
 from loguru import logger
-from starlette.staticfiles import StaticFiles
 
 from app.apis.v1 import v1
+from app.commons.response import RJSONResponse
+from app.commons.static import AssetStaticFiles
 from app.crud import BaseManager
 from app.models import BaseOrmTable, async_engine
+from app.models.schema_sync import PENDING, sync_schema
 from config import Settings, ROOT
 
 alden = FastAPI(
     title=Settings.APP_NAME,
     version=Settings.APP_VERSION,
-    docs_url=None)
+    docs_url=None,
+    default_response_class=RJSONResponse)
 
-alden.mount("/static", StaticFiles(directory=f"{ROOT}/static"), name="static")
+static_files = AssetStaticFiles(directory=f"{ROOT}/static", build_dir=Settings.STATIC_BUILD_DIR, prefix="/static")
+alden.mount("/static", static_files, name="static")
 
 
 @alden.get('/docs', include_in_schema=False)
@@ -35,15 +39,23 @@ async def custom_swagger_ui_html():
     return get_swagger_ui_html(
         openapi_url="/openapi.json",
         title=Settings.APP_NAME + " - Swagger UI",
-        swagger_js_url="/static/swagger-ui-bundle.js",
-        swagger_css_url="/static/swagger-ui.css"
+        swagger_js_url=static_files.url("swagger-ui-bundle.js"),
+        swagger_css_url=static_files.url("swagger-ui.css")
     )
 
 
 async def init_create_table():
-    # 根据映射创建库表（异步）
-    async with async_engine.begin() as conn:
-        await conn.run_sync(BaseOrmTable.metadata.create_all)
+    # 根据映射创建库表（异步）, 元数据指纹未变化时跳过
+    if Settings.SCHEMA_SYNC_MODE == "off":
+        return
+    status = await sync_schema(
+        async_engine,
+        BaseOrmTable.metadata,
+        apply=Settings.SCHEMA_SYNC_MODE == "auto",
+        lock_timeout=Settings.SCHEMA_SYNC_LOCK_TIMEOUT,
+    )
+    if status == PENDING:
+        logger.warning("schema fingerprint changed, run `python -m app.models.schema_sync` to apply")
 
 
 class InterceptHandler(logging.Handler):
@@ -8,10 +8,11 @@
 """
 from fastapi import APIRouter, Depends
 
+from app.commons.response import RRoute
 from app.crud.auth.user import UserManager
 from app.schemas.user import RegisterUserBody, UserIn
 
-router = APIRouter(prefix="/users", tags=["用户接口"])
+router = APIRouter(prefix="/users", tags=["用户接口"], route_class=RRoute)
 
 
 @router.post("/login", summary="用户登录")
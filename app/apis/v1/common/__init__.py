@@ -10,13 +10,21 @@ import asyncio
 import random
 import uuid
 
-from fastapi import APIRouter, File, UploadFile
+from fastapi import APIRouter, Depends, File, UploadFile
 from starlette.exceptions import WebSocketException
 from starlette.websockets import WebSocket
 
+from app.commons import R
+from app.commons.auth import admin_required
 from app.commons.client import MiNiOClient
+from app.commons.rate_limit import load_shedder, rate_limiter
+from app.commons.response import RRoute
+from app.crud.index_advisor import index_advisor
+from app.crud.instrumentation import query_stats
+from app.crud.routing import replica_router
+from app.models import async_engine
 
-router = APIRouter(prefix="", tags=["公共"])
+router = APIRouter(prefix="", tags=["公共"], route_class=RRoute)
 minio_C = MiNiOClient()
 
 
@@ -43,6 +51,33 @@ async def get_system_info(ws: WebSocket):
         await ws.close()
 
 
+@router.get("/metrics/queries", summary="SQL 耗时统计", dependencies=[Depends(admin_required)])
+async def query_metrics(reset: bool = False):
+    data = query_stats.snapshot()
+    if reset:
+        query_stats.reset()
+    return R.success(data=data)
+
+
+@router.get("/metrics/index-advice", summary="索引建议", dependencies=[Depends(admin_required)])
+async def index_advice(min_count: int = 1, use_primary: bool = False):
+    # EXPLAIN 与区分度采样默认在只读副本上执行, 没有健康副本时需显式传 use_primary=true 才在主库上执行
+    replica = replica_router.choose()
+    if replica is None and not use_primary:
+        return R.fail(message="没有可用的只读副本, 如需在主库上分析请传 use_primary=true")
+    engine = replica.engine if replica is not None else async_engine
+    recommendations = await index_advisor.analyze(engine, min_count=min_count)
+    return R.success(data={
+        "recommendations": [rec.to_dict() for rec in recommendations],
+        "ddl": [rec.ddl for rec in recommendations],
+    })
+
+
+@router.get("/metrics/admission", summary="限流与过载保护状态", dependencies=[Depends(admin_required)])
+async def admission_metrics():
+    return R.success(data={"rate_limit": rate_limiter.stats(), "load_shedding": load_shedder.stats()})
+
+
 @router.post("/upload", summary="上传文件")
 async def upload_file(file: UploadFile = File(..., description="上传的文件")):
     # 生成随机文件名
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/10 11:00
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import base64
+import hashlib
+import hmac
+import time
+from typing import Optional
+
+import orjson
+from fastapi import Header
+
+from app.exceptions.global_exception import AuthorizationException
+from config import Settings
+
+_ALGORITHMS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(signing_input: str) -> str:
+    digest = _ALGORITHMS[Settings.JWT_ALGORITHM]
+    return _b64encode(hmac.new(Settings.JWT_SECRET_KEY.encode(), signing_input.encode(), digest).digest())
+
+
+def create_token(payload: dict, expired_minutes: int = None) -> str:
+    """
+    签发 jwt
+    Args:
+        payload: 载荷, 权限等级放在 role 中(Settings.MEMBER/MANAGER/ADMIN)
+        expired_minutes: 过期分钟数, 默认 Settings.JWT_EXPIRED
+    """
+    expired = Settings.JWT_EXPIRED if expired_minutes is None else expired_minutes
+    claims = {"iss": Settings.JWT_ISS, "exp": int(time.time()) + expired * 60, **payload}
+    header = _b64encode(orjson.dumps({"alg": Settings.JWT_ALGORITHM, "typ": "JWT"}))
+    signing_input = f"{header}.{_b64encode(orjson.dumps(claims))}"
+    return f"{signing_input}.{_sign(signing_input)}"
+
+
+def decode_token(token: str) -> dict:
+    """ 校验签名、签发方与过期时间, 返回载荷; 校验失败抛出 AuthorizationException """
+    try:
+        header, payload, signature = token.split(".")
+        if orjson.loads(_b64decode(header)).get("alg") != Settings.JWT_ALGORITHM:
+            raise AuthorizationException()
+        if not hmac.compare_digest(signature, _sign(f"{header}.{payload}")):
+            raise AuthorizationException()
+        claims = orjson.loads(_b64decode(payload))
+    except (ValueError, TypeError, AttributeError, orjson.JSONDecodeError):
+        raise AuthorizationException()
+    if claims.get("iss") != Settings.JWT_ISS or claims.get("exp", 0) < time.time():
+        raise AuthorizationException()
+    return claims
+
+
+async def admin_required(authorization: Optional[str] = Header(None)) -> dict:
+    """
+    管理员权限依赖
+    Examples:
+        @router.get("/metrics/queries", dependencies=[Depends(admin_required)])
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise AuthorizationException()
+    claims = decode_token(token)
+    if not isinstance(claims.get("role"), int) or claims["role"] < Settings.ADMIN:
+        raise AuthorizationException()
+    return claims
@@ -9,10 +9,17 @@
 from datetime import timedelta
 from typing import BinaryIO
 
+import httpx
 from minio import Minio
 
+from app.commons.tracing import TracingTransport, tracer
 from config import Settings
 
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # pragma: no cover - redis 为可选依赖
+    aioredis = None
+
 
 class MiNiOClient:
     def __init__(self):
@@ -41,6 +48,7 @@ class MiNiOClient:
         """
         return self.client.bucket_exists(self.bucket_name)
 
+    @tracer.traced("minio.put_object", "client", component="minio")
     def upload_file(self, object_name: str, data: BinaryIO, part_size=10 * 1024 * 1024, **kwargs):
         """
         上传文件
@@ -54,6 +62,7 @@ class MiNiOClient:
             kwargs["length"] = -1
         return self.client.put_object(self.bucket_name, object_name, data, part_size=part_size, **kwargs)
 
+    @tracer.traced("minio.fput_object", "client", component="minio")
     def upload_file_v2(self, object_name: str, file_path: str):
         """
         上传文件v2
@@ -64,6 +73,7 @@ class MiNiOClient:
 
         return self.client.fput_object(self.bucket_name, object_name=object_name, file_path=file_path)
 
+    @tracer.traced("minio.fget_object", "client", component="minio")
     def download_file(self, object_name: str, file_name: str):
         """
         下载文件
@@ -73,6 +83,7 @@ class MiNiOClient:
         """
         return self.client.fget_object(self.bucket_name, object_name, file_name)
 
+    @tracer.traced("minio.remove_object", "client", component="minio")
     def delete_file(self, object_name: str):
         """
         删除文件
@@ -81,6 +92,7 @@ class MiNiOClient:
         """
         return self.client.remove_object(self.bucket_name, object_name)
 
+    @tracer.traced("minio.list_buckets", "client", component="minio")
     def get_bucket_list(self):
         """
         获取bucket列表
@@ -88,6 +100,7 @@ class MiNiOClient:
         """
         return self.client.list_buckets()
 
+    @tracer.traced("minio.list_objects", "client", component="minio")
     def list_bucket_object_list(self, bucket_name: str):
         """
         获取bucket下的文件列表
@@ -96,6 +109,7 @@ class MiNiOClient:
         """
         return self.client.list_objects(bucket_name)
 
+    @tracer.traced("minio.presigned_put_object", "client", component="minio")
     def pre_signature_put_object_url(self, object_name: str, expires: int = 7 * 24 * 60 * 60):
         """
         获取预签名url；前端通过该url上传文件到minio，无需经过后端
@@ -105,6 +119,7 @@ class MiNiOClient:
         expires = timedelta(seconds=expires)
         return self.client.presigned_put_object(self.bucket_name, object_name, expires)
 
+    @tracer.traced("minio.presigned_get_object", "client", component="minio")
     def pre_signature_get_object_url(self, object_name: str, expires: int = 7 * 24 * 60 * 60):
         """
         获取预签名url
@@ -112,3 +127,22 @@ class MiNiOClient:
         :param expires: 过期时间秒, 默认7天
         """
         return self.client.presigned_get_object(self.bucket_name, object_name, timedelta(seconds=expires))
+
+
+def create_http_client(**kwargs) -> httpx.AsyncClient:
+    """
+    创建出站 HTTP 异步客户端, 请求自动记录 span 并透传 traceparent
+    :param kwargs: httpx.AsyncClient 的参数, eg: base_url、timeout
+    :return: httpx.AsyncClient
+    """
+    return httpx.AsyncClient(transport=TracingTransport(), **kwargs)
+
+
+def create_redis_client():
+    """
+    根据 REDIS_DSN 创建 redis 异步客户端
+    :return: redis.asyncio.Redis, 未配置 REDIS_DSN 或未安装 redis 时返回 None
+    """
+    if not Settings.REDIS_DSN or aioredis is None:
+        return None
+    return aioredis.from_url(Settings.REDIS_DSN)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/8 20:40
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+import math
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.types import Scope
+
+from app.commons.response_cache import user_scope
+from app.exceptions.global_exception import LimiterResException
+from app.models import TimedQueuePool
+from config import Settings
+
+# (桶的键, 每秒补充令牌数, 桶容量)
+Bucket = Tuple[str, float, float]
+
+# 多个桶一次判断: 全部有足够令牌才同时扣减, 否则都不扣减并返回需要等待的毫秒数
+# 时间取 redis 服务端的 TIME, 不受各 worker 时钟偏差影响
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local tokens = {}
+local wait = 0
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', KEYS[i], 't', 'ts')
+    local t = tonumber(state[1])
+    if t == nil then
+        t = burst
+    else
+        t = math.min(burst, t + math.max(0, now - tonumber(state[2])) * rate / 1000)
+    end
+    tokens[i] = t
+    if t < cost then
+        wait = math.max(wait, (cost - t) * 1000 / rate)
+    end
+end
+if wait > 0 then
+    return {0, math.ceil(wait)}
+end
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', KEYS[i], 't', tostring(tokens[i] - cost), 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst * 1000 / rate) + 1000)
+end
+return {1, 0}
+"""
+
+
+class LocalTokenBuckets:
+    """ 进程内令牌桶, 按最近使用淘汰, 被淘汰的桶相当于重新装满 """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, buckets: Sequence[Bucket], cost: float = 1) -> float:
+        """ 返回 0 表示放行, 否则为需要等待的秒数 """
+        now = time.monotonic()
+        tokens_list = []
+        wait = 0.0
+        for key, rate, burst in buckets:
+            state = self._buckets.get(key)
+            tokens = burst if state is None else min(burst, state[0] + (now - state[1]) * rate)
+            tokens_list.append(tokens)
+            if tokens < cost:
+                wait = max(wait, (cost - tokens) / rate)
+        if wait:
+            return wait
+
+        for (key, _, _), tokens in zip(buckets, tokens_list):
+            self._buckets[key] = (tokens - cost, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return 0.0
+
+    def clear(self):
+        self._buckets.clear()
+
+
+class RateLimiter:
+    """
+    令牌桶限流
+    Notes:
+        维度: 客户端 IP、用户(Authorization 的摘要, 未登录的请求只按 IP)、路径前缀(所有调用方共用);
+        一次请求涉及的桶一起判断, 任一桶令牌不足则整体拒绝且不扣减其他桶;
+        bind_redis 后桶状态放在 redis, 由 Lua 脚本原子地补充与扣减, 多个 worker 共享额度;
+        redis 不可用时退回进程内令牌桶, 不阻断请求
+    """
+
+    key_prefix = "alden:rl"
+
+    def __init__(
+            self,
+            enabled: bool = True,
+            user_rate: float = 20,
+            user_burst: float = 40,
+            ip_rate: float = 50,
+            ip_burst: float = 100,
+            routes: Dict[str, Sequence[float]] = None,
+            trust_forwarded: bool = False,
+            local_maxsize: int = 100000,
+    ):
+        self.enabled = enabled
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        # 最长前缀优先
+        self.routes = sorted((routes or {}).items(), key=lambda item: len(item[0]), reverse=True)
+        self.trust_forwarded = trust_forwarded
+        self.local = LocalTokenBuckets(local_maxsize)
+        self.redis = None
+        self._script = None
+        self._redis_failed = False
+        self._stats = {"allowed": 0, "limited": 0}
+
+    def bind_redis(self, redis_client: Any):
+        """ 绑定 redis.asyncio.Redis 客户端, None 则只使用进程内令牌桶 """
+        self.redis = redis_client
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT) if redis_client is not None else None
+
+    def client_ip(self, scope: Scope) -> str:
+        if self.trust_forwarded:
+            forwarded = Headers(scope=scope).get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "-"
+
+    def buckets_for(self, scope: Scope) -> List[Bucket]:
+        """ 请求需要经过的令牌桶 """
+        buckets = []
+        if self.ip_rate > 0:
+            buckets.append((f"ip:{self.client_ip(scope)}", self.ip_rate, self.ip_burst))
+        if self.user_rate > 0:
+            user = user_scope(Request(scope))
+            if user != "anonymous":
+                buckets.append((f"user:{user}", self.user_rate, self.user_burst))
+        path = scope["path"]
+        for prefix, (rate, burst) in self.routes:
+            if path.startswith(prefix):
+                if rate > 0:
+                    buckets.append((f"route:{prefix}", rate, burst))
+                break
+        return buckets
+
+    async def acquire(self, buckets: Sequence[Bucket], cost: float = 1) -> float:
+        """ 从令牌桶中扣减 cost 个令牌, 返回 0 表示放行, 否则为建议的重试等待秒数 """
+        if not buckets:
+            return 0.0
+        if self._script is not None:
+            try:
+                allowed, wait_ms = await self._script(
+                    keys=[f"{self.key_prefix}:{key}" for key, _, _ in buckets],
+                    args=[cost, *(value for _, rate, burst in buckets for value in (rate, burst))],
+                )
+                if self._redis_failed:
+                    self._redis_failed = False
+                    logger.info("rate limiter redis recovered")
+                return self._count(0.0 if int(allowed) else int(wait_ms) / 1000)
+            except Exception as e:
+                # 只在状态变化时记录, 避免 redis 故障期间每个请求打一条日志
+                if not self._redis_failed:
+                    self._redis_failed = True
+                    logger.warning(f"rate limiter redis unavailable, fallback to local buckets: {e}")
+        return self._count(self.local.acquire(buckets, cost))
+
+    def _count(self, retry_after: float) -> float:
+        self._stats["limited" if retry_after else "allowed"] += 1
+        return retry_after
+
+    async def check(self, scope: Scope) -> float:
+        """ 按 IP、用户、路径前缀限流, 返回 0 表示放行, 否则为建议的重试等待秒数 """
+        if not self.enabled:
+            return 0.0
+        return await self.acquire(self.buckets_for(scope))
+
+    def limit(self, rate: float, burst: float, per: str = "user") -> Callable:
+        """
+        接口级限流依赖, 超出时抛出 LimiterResException(429)
+        Args:
+            rate: 每秒补充令牌数
+            burst: 桶容量
+            per: user 每个用户一个桶(未登录按 IP)、ip 每个 IP 一个桶、route 所有调用方共用一个桶
+
+        Examples:
+            @router.post("/upload", dependencies=[Depends(rate_limiter.limit(1, 5))])
+        """
+        if per not in ("user", "ip", "route"):
+            raise ValueError(f"unsupported rate limit dimension: {per}")
+
+        async def dependency(request: Request):
+            route_path = getattr(request.scope.get("route"), "path", request.url.path)
+            if per == "route":
+                who = "*"
+            elif per == "user" and (user := user_scope(request)) != "anonymous":
+                who = user
+            else:
+                who = self.client_ip(request.scope)
+            retry_after = await self.acquire([(f"api:{request.method} {route_path}:{who}", rate, burst)])
+            if retry_after:
+                raise LimiterResException(429, retry_after)
+
+        return dependency
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "backend": "redis" if self._script is not None and not self._redis_failed else "local",
+            "local_buckets": len(self.local._buckets),
+        }
+
+
+class LoadShedder:
+    """
+    自适应过载保护
+    Notes:
+        后台任务每 interval 秒采样一次事件循环延迟(sleep 的实际唤醒时间与预期之差),
+        以及该周期内从连接池取连接的最长等待, 两者分别做指数滑动平均;
+        任一指标超过阈值时按 (指标 - 阈值) / 阈值 的比例随机丢弃请求, 达到阈值两倍时全部丢弃;
+        没有新的取连接请求时等待时间随采样衰减为 0, 丢弃后能自动恢复;
+        enabled 为 False 或两个阈值都为 0 时不采样、不丢弃
+    """
+
+    def __init__(self, loop_lag_ms: float = 200, pool_wait_ms: float = 500, interval: float = 0.5,
+                 smoothing: float = 0.5, enabled: bool = True):
+        self._enabled = enabled
+        self.loop_lag_threshold = loop_lag_ms
+        self.pool_wait_threshold = pool_wait_ms
+        self.interval = interval
+        self.smoothing = smoothing
+        self.loop_lag = 0.0
+        self.pool_wait = 0.0
+        self.shed_count = 0
+        self._window_pool_wait = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and (self.loop_lag_threshold > 0 or self.pool_wait_threshold > 0)
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.interval * 2))
+
+    def instrument(self):
+        """ 接收 TimedQueuePool 上报的取连接等待 """
+        if self.pool_wait_threshold > 0 and self.observe_pool_wait not in TimedQueuePool.wait_observers:
+            TimedQueuePool.wait_observers.append(self.observe_pool_wait)
+
+    def observe_pool_wait(self, elapsed_ms: float):
+        if elapsed_ms > self._window_pool_wait:
+            self._window_pool_wait = elapsed_ms
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self.instrument()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.sample(max(0.0, (loop.time() - expected) * 1000))
+
+    def sample(self, loop_lag_ms: float):
+        """ 记录一个周期的采样 """
+        self.loop_lag += self.smoothing * (loop_lag_ms - self.loop_lag)
+        self.pool_wait += self.smoothing * (self._window_pool_wait - self.pool_wait)
+        self._window_pool_wait = 0.0
+
+    def shed_ratio(self) -> float:
+        """ 当前的丢弃比例 0~1 """
+        ratio = 0.0
+        for value, threshold in ((self.loop_lag, self.loop_lag_threshold), (self.pool_wait, self.pool_wait_threshold)):
+            if 0 < threshold < value:
+                ratio = max(ratio, (value - threshold) / threshold)
+        return min(1.0, ratio)
+
+    def should_shed(self) -> bool:
+        if not self.enabled:
+            return False
+        ratio = self.shed_ratio()
+        if ratio and (ratio >= 1 or random.random() < ratio):
+            self.shed_count += 1
+            return True
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "loop_lag_ms": round(self.loop_lag, 3),
+            "pool_wait_ms": round(self.pool_wait, 3),
+            "shed_ratio": round(self.shed_ratio(), 4),
+            "shed": self.shed_count,
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.observe_pool_wait in TimedQueuePool.wait_observers:
+            TimedQueuePool.wait_observers.remove(self.observe_pool_wait)
+
+
+rate_limiter = RateLimiter(
+    enabled=Settings.RATE_LIMIT_ENABLED,
+    user_rate=Settings.RATE_LIMIT_USER_RATE,
+    user_burst=Settings.RATE_LIMIT_USER_BURST,
+    ip_rate=Settings.RATE_LIMIT_IP_RATE,
+    ip_burst=Settings.RATE_LIMIT_IP_BURST,
+    routes=Settings.RATE_LIMIT_ROUTES,
+    trust_forwarded=Settings.RATE_LIMIT_TRUST_FORWARDED,
+)
+
+load_shedder = LoadShedder(
+    enabled=Settings.SHED_ENABLED,
+    loop_lag_ms=Settings.SHED_LOOP_LAG_MS,
+    pool_wait_ms=Settings.SHED_POOL_WAIT_MS,
+)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/30 20:30
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+import functools
+import gzip
+from decimal import Decimal
+from typing import Any, Callable
+
+import orjson
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.dependencies.models import Dependant
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from sqlalchemy.engine import Row, RowMapping
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from app.commons import R
+from app.models import BaseOrmTable
+from config import Settings
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def orjson_default(obj: Any) -> Any:
+    """ orjson 不能原生序列化的类型, datetime/date/UUID/Enum/dataclass 由 orjson 直接处理 """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, BaseOrmTable):
+        return obj.to_dict(exclude_none=False)
+    if isinstance(obj, Row):
+        return obj._asdict()
+    if isinstance(obj, RowMapping):
+        return dict(obj)
+    if isinstance(obj, tuple) and hasattr(obj, "_asdict"):
+        # 命名元组(如 query_all(as_tuples=True) 的结果)按字段名输出
+        return obj._asdict()
+    if isinstance(obj, Decimal):
+        # 与 jsonable_encoder 一致: 整数值输出 int, 否则 float
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if isinstance(content, R):
+        # 信封本身不走 model_dump, data 中的对象交给 orjson_default 一次序列化
+        content = {"code": content.code, "data": content.data, "message": content.message}
+    return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Accept-Encoding 是否接受 gzip
+    Notes:
+        按 q 值判断, gzip;q=0 表示拒绝; 未列出 gzip 时看通配符 *; q 值无法解析按拒绝处理
+    """
+    wildcard = False
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        coding = coding.lower()
+        if coding in ("gzip", "x-gzip"):
+            return quality > 0
+        if coding == "*":
+            wildcard = quality > 0
+    return wildcard
+
+
+class RJSONResponse(JSONResponse):
+    """
+    基于 orjson 的 JSON 响应
+    eg: RJSONResponse(content=R.success(data=users))
+    """
+
+    # 响应体达到该字节数且客户端接受 gzip 时压缩, 0 为关闭
+    gzip_min_size: int = Settings.GZIP_MIN_SIZE
+    gzip_level: int = Settings.GZIP_LEVEL
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+                self.gzip_min_size
+                and len(self.body) >= self.gzip_min_size
+                and "content-encoding" not in self.headers
+        ):
+            # 是否压缩取决于 Accept-Encoding, 不压缩的响应同样要带 Vary, 避免共享缓存把明文返回给支持 gzip 的客户端
+            if "accept-encoding" not in self.headers.get("vary", "").lower():
+                self.headers.append("vary", "Accept-Encoding")
+            if _accepts_gzip(Headers(scope=scope).get("accept-encoding", "")):
+                self.body = gzip.compress(self.body, compresslevel=self.gzip_level)
+                self.headers["content-encoding"] = "gzip"
+                self.headers["content-length"] = str(len(self.body))
+        await super().__call__(scope, receive, send)
+
+
+def _uses_response_param(dependant: Dependant) -> bool:
+    """ 接口或依赖中声明了 response: Response 参数(可能修改响应头/状态码) """
+    if dependant.response_param_name is not None:
+        return True
+    return any(_uses_response_param(sub_dependant) for sub_dependant in dependant.dependencies)
+
+
+def _wrap_endpoint(call: Callable, response_class: type[Response], status_code: int = None) -> Callable:
+    response_args = {"status_code": status_code} if status_code else {}
+
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def endpoint(**values):
+            ret = await call(**values)
+            return ret if isinstance(ret, Response) else response_class(ret, **response_args)
+    else:
+        @functools.wraps(call)
+        def endpoint(**values):
+            ret = call(**values)
+            return ret if isinstance(ret, Response) else response_class(ret, **response_args)
+
+    endpoint.__fast_json__ = True
+    return endpoint
+
+
+class RRoute(APIRoute):
+    """
+    快速序列化路由
+    Notes:
+        未声明 response_model 的接口, 返回值直接交给 RJSONResponse 用 orjson 序列化一次,
+        跳过 FastAPI 默认的 jsonable_encoder 遍历;
+        声明了 response_model 或使用 response 参数的接口保持 FastAPI 默认流程
+    """
+
+    def get_route_handler(self):
+        response_class = self.response_class
+        if isinstance(response_class, DefaultPlaceholder):
+            response_class = response_class.value
+        call = self.dependant.call
+        if (
+                self.response_model is None
+                and isinstance(response_class, type)
+                and issubclass(response_class, RJSONResponse)
+                and not getattr(call, "__fast_json__", False)
+                and not _uses_response_param(self.dependant)
+        ):
+            self.dependant.call = _wrap_endpoint(call, response_class, self.status_code)
+        return super().get_route_handler()
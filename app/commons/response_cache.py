@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/7 20:35
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import orjson
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.commons.response import RJSONResponse, dumps
+from config import Settings
+
+CacheEntry = Tuple[str, bytes]
+# (进程内标签版本, redis 标签版本)
+TagVersions = Tuple[tuple, Optional[List[int]]]
+
+
+class CachedJSONResponse(RJSONResponse):
+    """ 已序列化的 JSON 响应体, 跳过 render, 仍按 RJSONResponse 的规则 gzip """
+
+    def render(self, content: bytes) -> bytes:
+        return content
+
+
+def user_scope(request: Request) -> str:
+    """ 默认的用户维度: Authorization 请求头的摘要, 未登录的请求共用一份缓存 """
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return "anonymous"
+    return hashlib.blake2b(authorization.encode(), digest_size=8).hexdigest()
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """
+    接口级响应缓存
+    Notes:
+        缓存键为 路径 + 排序后的查询参数 + 用户维度, 缓存内容为序列化后的响应体与 ETag;
+        一级: 进程内 LRU; 二级: Redis(可选, bind_redis 后启用, 此时一级缓存最多保留 local_ttl 秒);
+        失效按标签: 每个标签一个版本号, 缓存条目记录写入时的版本, 版本变化即作废,
+        Redis 中条目与标签版本一次 MGET 读取. BaseManager 的写操作自动失效本表对应的标签
+    """
+
+    key_prefix = "alden:http"
+
+    def __init__(self, local_maxsize: int = 1024, local_ttl: float = 5):
+        self.local_maxsize = local_maxsize
+        self.local_ttl = local_ttl
+        self.redis = None
+        # 被缓存接口声明过的标签, 写操作只失效这些标签
+        self.tags: set = set()
+        self._local: "OrderedDict[str, Tuple[float, tuple, str, bytes]]" = OrderedDict()
+        self._local_versions: Dict[str, int] = {}
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def bind_redis(self, redis_client: Any):
+        """ 绑定 redis.asyncio.Redis 客户端, None 则只使用进程内缓存 """
+        self.redis = redis_client
+
+    @staticmethod
+    def tag_name(tag: Union[str, Any]) -> str:
+        """ 标签可以是字符串或 orm表映射类(取表名) """
+        return tag if isinstance(tag, str) else tag.__tablename__
+
+    def watched_tags(self, *tags: Union[str, Any]) -> List[str]:
+        names = (self.tag_name(tag) for tag in tags)
+        return [name for name in names if name in self.tags]
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.key_prefix}:tag:{tag}"
+
+    def _local_tag_versions(self, tags: Tuple[str, ...]) -> tuple:
+        return tuple(self._local_versions.get(tag, 0) for tag in tags)
+
+    async def get(self, key: str, tags: Tuple[str, ...]) -> Tuple[Optional[CacheEntry], TagVersions]:
+        """
+        读缓存
+        Returns: (缓存条目 or None, 读取时的标签版本)
+            未命中时回填需要带上读取时的版本, 期间发生的失效会让回填的条目直接作废
+        """
+        local_versions = self._local_tag_versions(tags)
+        cached = self._local.get(key)
+        if cached and cached[0] > time.monotonic() and cached[1] == local_versions:
+            self._local.move_to_end(key)
+            return (cached[2], cached[3]), (local_versions, None)
+
+        if self.redis is None:
+            return None, (local_versions, None)
+        redis_versions = None
+        try:
+            raw, *raw_versions = await self.redis.mget(key, *(self._tag_key(tag) for tag in tags))
+            redis_versions = [int(version or 0) for version in raw_versions]
+            if raw:
+                header, _, body = raw.partition(b"\n")
+                meta = orjson.loads(header)
+                if meta["v"] == redis_versions:
+                    self._set_local(key, local_versions, meta["e"], body, self.local_ttl)
+                    return (meta["e"], body), (local_versions, redis_versions)
+        except Exception as e:
+            logger.warning(f"读取响应缓存 {key} 失败: {e}")
+        return None, (local_versions, redis_versions)
+
+    def _set_local(self, key: str, local_versions: tuple, etag: str, body: bytes, ttl: float):
+        self._local[key] = (time.monotonic() + ttl, local_versions, etag, body)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_maxsize:
+            self._local.popitem(last=False)
+
+    async def set(self, key: str, versions: TagVersions, etag: str, body: bytes, ttl: int):
+        local_versions, redis_versions = versions
+        if self.redis is None:
+            self._set_local(key, local_versions, etag, body, ttl)
+            return
+        self._set_local(key, local_versions, etag, body, min(ttl, self.local_ttl))
+        if redis_versions is None:
+            # 读取 redis 失败时不回填, 避免写入版本未知的条目
+            return
+        try:
+            header = orjson.dumps({"v": redis_versions, "e": etag})
+            await self.redis.set(key, header + b"\n" + body, ex=int(ttl))
+        except Exception as e:
+            logger.warning(f"写入响应缓存 {key} 失败: {e}")
+
+    async def invalidate(self, tags: Iterable[Union[str, Any]]):
+        """ 失效标签下的全部缓存 """
+        names = [self.tag_name(tag) for tag in tags]
+        for name in names:
+            self._local_versions[name] = self._local_versions.get(name, 0) + 1
+        if self.redis is None or not names:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for name in names:
+                    pipe.incr(self._tag_key(name))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"失效响应缓存 {names} 失败: {e}")
+
+    def clear_local(self):
+        self._local.clear()
+
+    def stats(self) -> dict:
+        total = self._stats["hits"] + self._stats["misses"]
+        return {**self._stats, "hit_ratio": round(self._stats["hits"] / total, 4) if total else 0.0}
+
+    def _cache_key(self, request: Request, vary: Optional[Callable[[Request], str]]) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        scope = vary(request) if vary else "public"
+        return f"{self.key_prefix}:{request.url.path}?{query}#{scope}"
+
+    def __call__(
+            self,
+            ttl: int = 60,
+            tags: Iterable[Union[str, Any]] = (),
+            vary: Optional[Callable[[Request], str]] = user_scope,
+            max_age: int = 0,
+    ) -> Callable:
+        """
+        GET 接口的响应缓存装饰器
+        Args:
+            ttl: 服务端缓存秒数
+            tags: 失效标签, 字符串或 orm表映射类; 对应表的 BaseManager 写操作会自动失效
+            vary: 缓存的用户维度, 默认按 Authorization 区分; None 表示所有用户共用(公开数据)
+            max_age: 浏览器缓存秒数, 默认 0 即每次带 If-None-Match 协商, 未变化时返回 304
+
+        Notes:
+            命中时直接返回缓存的响应体, 不再经过 response_model 校验, 适用于返回 R 的接口;
+            只缓存 200 的 JSON 响应
+
+        Examples:
+            @router.get("/projects")
+            @response_cache(ttl=30, tags=[Project])
+            async def projects(page: int = 1):
+                ...
+        """
+        tag_names = tuple(sorted({self.tag_name(tag) for tag in tags}))
+        self.tags.update(tag_names)
+        cache_control = f"{'private' if vary else 'public'}, max-age={max_age}, must-revalidate"
+
+        def decorator(endpoint: Callable) -> Callable:
+            signature = inspect.signature(endpoint)
+            request_param = next(
+                (name for name, param in signature.parameters.items() if param.annotation is Request), None
+            )
+            is_coroutine = inspect.iscoroutinefunction(endpoint)
+
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                request: Request = kwargs[request_param] if request_param else kwargs.pop("_cache_request")
+                if request.method != "GET":
+                    return await self._call(endpoint, is_coroutine, args, kwargs)
+
+                key = self._cache_key(request, vary)
+                if_none_match = request.headers.get("if-none-match")
+                entry, versions = await self.get(key, tag_names)
+                if entry is None:
+                    self._stats["misses"] += 1
+                    ret = await self._call(endpoint, is_coroutine, args, kwargs)
+                    if isinstance(ret, Response):
+                        if ret.status_code != 200 or "json" not in (ret.media_type or ""):
+                            return ret
+                        body = ret.body
+                    else:
+                        body = dumps(ret)
+                    entry = (make_etag(body), body)
+                    await self.set(key, versions, entry[0], body, ttl)
+                else:
+                    self._stats["hits"] += 1
+
+                etag, body = entry
+                headers = {"etag": etag, "cache-control": cache_control}
+                if etag_matches(if_none_match, etag):
+                    self._stats["not_modified"] += 1
+                    return Response(status_code=304, headers=headers)
+                return CachedJSONResponse(body, headers=headers)
+
+            if request_param is None:
+                # 接口未声明 Request 参数时追加一个, 由 FastAPI 注入
+                params = list(signature.parameters.values())
+                position = len(params) - (params and params[-1].kind is inspect.Parameter.VAR_KEYWORD)
+                params.insert(
+                    position, inspect.Parameter("_cache_request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+                )
+                wrapper.__signature__ = signature.replace(parameters=params)
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    async def _call(endpoint: Callable, is_coroutine: bool, args: tuple, kwargs: dict):
+        if is_coroutine:
+            return await endpoint(*args, **kwargs)
+        return await run_in_threadpool(endpoint, *args, **kwargs)
+
+
+response_cache = ResponseCache(
+    local_maxsize=Settings.RESPONSE_CACHE_LOCAL_MAXSIZE,
+    local_ttl=Settings.RESPONSE_CACHE_LOCAL_TTL,
+)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/6 20:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import gzip
+import hashlib
+import os
+from dataclasses import dataclass, field
+from mimetypes import guess_type
+from typing import Dict, Optional
+
+from loguru import logger
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - requirements.txt 已固定 brotli, 未安装时只生成 gzip
+    brotli = None
+
+# 需要预压缩的文件类型
+COMPRESSIBLE_SUFFIXES = {".js", ".css", ".html", ".json", ".map", ".svg", ".txt"}
+# 协商时的优先级
+ENCODINGS = ("br", "gzip")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+@dataclass
+class AssetVariant:
+    path: str
+    stat_result: os.stat_result
+    # 文件不超过 memory_max_bytes 时常驻内存, 一次发送, 不再每次读盘
+    content: Optional[bytes] = None
+
+
+@dataclass
+class Asset:
+    name: str
+    url_name: str
+    digest: str
+    media_type: str
+    variants: Dict[str, AssetVariant] = field(default_factory=dict)
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def _fingerprint_name(name: str, digest: str) -> str:
+    stem, suffix = os.path.splitext(name)
+    return f"{stem}.{digest[:10]}{suffix}"
+
+
+def _write_atomic(path: str, content: bytes):
+    # 多个 worker 同时启动时先写临时文件再改名, 不会读到写了一半的文件
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _accepted_encodings(scope: Scope) -> set:
+    accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class AssetResponse(FileResponse):
+    """
+    静态资源响应
+    Notes:
+        常驻内存的资源一次发送, 其余按 FileResponse 分块读取后发送, 都不是零拷贝;
+        只有 ASGI 服务器在 scope["extensions"] 中声明 http.response.pathsend 时才把文件路径交给服务器发送,
+        本项目使用的 uvicorn(含 gunicorn 的 uvicorn worker)不支持该扩展, 不会走这条分支
+    """
+
+    def __init__(self, variant: AssetVariant, headers: Dict[str, str], media_type: str):
+        super().__init__(variant.path, headers=headers, media_type=media_type, stat_result=variant.stat_result)
+        self.content = variant.content
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+                self.content is None
+                or scope["method"].upper() == "HEAD"
+                or "http.response.pathsend" in scope.get("extensions", {})
+        ):
+            await super().__call__(scope, receive, send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.body", "body": self.content, "more_body": False})
+
+
+class AssetStaticFiles(StaticFiles):
+    """
+    预压缩、带指纹的静态资源
+    Notes:
+        启动时为 directory 下的文件计算内容摘要, 在 build_dir 生成指纹文件名的 gzip/brotli 预压缩文件(已存在则跳过);
+        指纹文件名 /static/name.<摘要>.js 长期缓存(immutable), 原文件名需要协商缓存;
+        ETag 为内容摘要, If-None-Match 命中返回 304; 其他文件沿用 StaticFiles
+    eg:
+        static_files = AssetStaticFiles(directory="static", build_dir="static/dist")
+        static_files.url("swagger-ui-bundle.js")  # /static/swagger-ui-bundle.1a2b3c4d5e.js
+    """
+
+    def __init__(self, *, directory: str, build_dir: str, prefix: str = "/static", min_size: int = 1024,
+                 memory_max_bytes: int = 8 * 1024 * 1024, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.build_dir = build_dir
+        self.prefix = prefix.rstrip("/")
+        self.min_size = min_size
+        self.memory_max_bytes = memory_max_bytes
+        self.assets: Dict[str, Asset] = {}
+        self.build()
+
+    def build(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+        build_dir = os.path.realpath(self.build_dir)
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if os.path.realpath(os.path.join(root, d)) != build_dir]
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                asset = self._build_asset(name, path)
+                self.assets[asset.name] = self.assets[asset.url_name] = asset
+        logger.info(f"static assets ready: {len(self.assets) // 2} files, build dir {self.build_dir}")
+
+    def _build_asset(self, name: str, path: str) -> Asset:
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()[:16]
+        asset = Asset(
+            name=name, url_name=_fingerprint_name(name, digest), digest=digest,
+            media_type=guess_type(name)[0] or "application/octet-stream"
+        )
+        asset.variants["identity"] = self._variant(path, content)
+
+        if os.path.splitext(name)[1] not in COMPRESSIBLE_SUFFIXES or len(content) < self.min_size:
+            return asset
+        compressors = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressors["br"] = lambda data: brotli.compress(data, quality=11)
+        for encoding, compress in compressors.items():
+            variant_path = os.path.join(self.build_dir, f"{asset.url_name}.{'br' if encoding == 'br' else 'gz'}")
+            if os.path.exists(variant_path):
+                with open(variant_path, "rb") as f:
+                    compressed = f.read()
+            else:
+                compressed = compress(content)
+                if len(compressed) >= len(content):
+                    continue
+                os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+                _write_atomic(variant_path, compressed)
+            asset.variants[encoding] = self._variant(variant_path, compressed)
+        return asset
+
+    def _variant(self, path: str, content: bytes) -> AssetVariant:
+        return AssetVariant(
+            path=path, stat_result=os.stat(path), content=content if len(content) <= self.memory_max_bytes else None
+        )
+
+    def url(self, name: str) -> str:
+        """ 指纹文件名的访问路径, 未登记的文件返回原路径 """
+        asset = self.assets.get(name)
+        return f"{self.prefix}/{asset.url_name if asset else name}"
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        asset = self.assets.get(path.replace(os.sep, "/"))
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        accepted = _accepted_encodings(scope)
+        encoding = next((e for e in ENCODINGS if e in accepted and e in asset.variants), "identity")
+        headers = {
+            "etag": asset.etag(encoding),
+            "cache-control": IMMUTABLE_CACHE_CONTROL if path == asset.url_name else REVALIDATE_CACHE_CONTROL,
+            "vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["content-encoding"] = encoding
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        if if_none_match:
+            etags = {asset.etag(e) for e in asset.variants}
+            if "*" in if_none_match or any(tag.strip().removeprefix("W/") in etags for tag in if_none_match.split(",")):
+                return NotModifiedResponse(Headers(headers))
+        return AssetResponse(asset.variants[encoding], headers, asset.media_type)
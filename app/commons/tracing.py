@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/5 20:10
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+import collections
+import functools
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import httpx
+import orjson
+from loguru import logger
+
+from config import Settings
+
+# W3C Trace Context: version-trace_id-parent_id-flags
+TRACEPARENT_PATTERN = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+def new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """ 解析 traceparent 请求头, 返回 (trace_id, parent_id, sampled), 格式不合法时返回 None """
+    if not value:
+        return None
+    matched = TRACEPARENT_PATTERN.match(value.strip().lower())
+    if matched is None:
+        return None
+    version, trace_id, parent_id, flags = matched.groups()
+    if version == "ff" or trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 0x01)
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    kind: str
+    start_ns: int
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    token: Optional[Token] = field(default=None, repr=False)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def incr(self, key: str, amount: float = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def record_error(self, exc: BaseException):
+        self.error = f"{type(exc).__name__}: {exc}"
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class SpanExporter:
+    """
+    批量异步导出
+    Notes:
+        结束的 span 放入有界队列(满了丢弃并计数), 后台任务每 interval 秒或攒够 batch_size 条导出一次;
+        写文件(JSON Lines)放到线程中执行, 文件超过 max_bytes 后按 .1 ~ .backups 滚动, 发送到采集端点时 POST JSON 数组
+    """
+
+    def __init__(self, file_path: str = None, endpoint: str = None, batch_size: int = 512,
+                 interval: float = 2.0, max_queue: int = 10000, max_bytes: int = 10 * 1024 * 1024,
+                 backups: int = 5):
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: Deque[Span] = collections.deque()
+        self.max_queue = max_queue
+        self.dropped = 0
+        self.exported = 0
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.file_path or self.endpoint)
+
+    def submit(self, span: Span):
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self.queue.append(span)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            if self.endpoint:
+                self._client = httpx.AsyncClient(timeout=5)
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        while self.queue:
+            batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            try:
+                await self._export(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning(f"export {len(batch)} spans failed: {e}")
+
+    async def _export(self, batch: List[Span]):
+        records = [span.to_dict() for span in batch]
+        if self.file_path:
+            lines = b"".join(orjson.dumps(record) + b"\n" for record in records)
+            await asyncio.to_thread(self._write_file, lines)
+        if self._client is not None:
+            response = await self._client.post(
+                self.endpoint, content=orjson.dumps(records), headers={"Content-Type": "application/json"}
+            )
+            response.raise_for_status()
+
+    def _write_file(self, lines: bytes):
+        try:
+            size = os.path.getsize(self.file_path)
+        except FileNotFoundError:
+            size = 0
+        if self.max_bytes and size and size + len(lines) > self.max_bytes:
+            self._rotate()
+        with open(self.file_path, "ab") as f:
+            f.write(lines)
+
+    def _rotate(self):
+        """ spans.jsonl -> spans.jsonl.1 -> ... -> spans.jsonl.{backups}, 最旧的删除 """
+        if self.backups <= 0:
+            os.remove(self.file_path)
+            return
+        for idx in range(self.backups - 1, 0, -1):
+            src = f"{self.file_path}.{idx}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.file_path}.{idx + 1}")
+        os.replace(self.file_path, f"{self.file_path}.1")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class Tracer:
+    """
+    进程内链路追踪
+    Notes:
+        请求入口按 traceparent 或采样率决定是否采样, 未采样的请求不创建任何 span;
+        子 span 只在存在当前 span 时创建, 上下文通过 contextvars 传递
+    """
+
+    def __init__(self, sample_rate: float = 0.1, exporter: SpanExporter = None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter or SpanExporter()
+
+    def start_request(self, name: str, traceparent: Optional[str] = None,
+                      attributes: Dict[str, Any] = None) -> Tuple[str, Optional[Span]]:
+        """
+        开始请求的根 span
+        Returns: (trace_id, span), 未采样时 span 为 None, trace_id 仍可用于日志关联
+        """
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = new_trace_id(), None
+            sampled = self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        if not sampled:
+            return trace_id, None
+        return trace_id, self._start(name, trace_id, parent_id, "server", attributes)
+
+    def start_span(self, name: str, kind: str = "internal", attributes: Dict[str, Any] = None) -> Optional[Span]:
+        """ 在当前 span 下开始子 span, 当前请求未采样时返回 None """
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        return self._start(name, parent.trace_id, parent.span_id, kind, attributes)
+
+    @staticmethod
+    def _start(name: str, trace_id: str, parent_id: Optional[str], kind: str,
+               attributes: Optional[Dict[str, Any]]) -> Span:
+        span = Span(
+            name=name, trace_id=trace_id, span_id=new_span_id(), parent_id=parent_id, kind=kind,
+            start_ns=time.time_ns(), attributes=attributes or {}
+        )
+        span.token = _current_span.set(span)
+        return span
+
+    def end_span(self, span: Span):
+        span.end_ns = time.time_ns()
+        _current_span.reset(span.token)
+        span.token = None
+        self.exporter.submit(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        span = self.start_span(name, kind, attributes)
+        if span is None:
+            yield None
+            return
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            self.end_span(span)
+
+    def traced(self, name: str = None, kind: str = "internal", **attributes) -> Callable:
+        """ 函数级 span 装饰器, 同时支持同步与异步函数 """
+
+        def decorator(func: Callable) -> Callable:
+            span_name = name or func.__qualname__
+
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.span(span_name, kind, **attributes):
+                        return await func(*args, **kwargs)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.span(span_name, kind, **attributes):
+                        return func(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def traceparent(span: Optional[Span] = None) -> Optional[str]:
+        """ 当前 span 的 traceparent, 用于透传给下游服务 """
+        span = span or _current_span.get()
+        if span is None:
+            return None
+        return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+class TracingTransport(httpx.AsyncHTTPTransport):
+    """
+    出站 HTTP 调用的 span, 并向下游透传 traceparent
+    eg: httpx.AsyncClient(transport=TracingTransport())
+    """
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        span = tracer.start_span(
+            f"HTTP {request.method}", "client",
+            {"component": "http", "http.method": request.method, "http.url": str(request.url.copy_with(query=None))}
+        )
+        if span is None:
+            return await super().handle_async_request(request)
+        request.headers["traceparent"] = tracer.traceparent(span)
+        try:
+            response = await super().handle_async_request(request)
+            span.set_attribute("http.status_code", response.status_code)
+            return response
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            tracer.end_span(span)
+
+
+tracer = Tracer(
+    sample_rate=Settings.TRACE_SAMPLE_RATE,
+    exporter=SpanExporter(
+        file_path=Settings.TRACE_EXPORT_FILE, endpoint=Settings.TRACE_EXPORT_ENDPOINT,
+        max_bytes=Settings.TRACE_EXPORT_FILE_MAX_BYTES, backups=Settings.TRACE_EXPORT_FILE_BACKUPS,
+    ),
+)
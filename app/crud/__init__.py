@@ -11,17 +11,33 @@ import functools
 
 from datetime import datetime
 from contextlib import asynccontextmanager
-from typing import Any, Optional, Callable, AsyncIterator, Type, Union, TypeVar, List
+from typing import Any, Dict, Optional, Callable, AsyncIterator, Type, Union, TypeVar, List
 
 from pydantic import BaseModel
-from sqlalchemy import ColumnElement, or_, Select, asc, desc
+from sqlalchemy import ColumnElement, or_, Select, asc, desc, bindparam
 from sqlalchemy.orm.util import AliasedClass
 
 from loguru import logger
-from sqlalchemy import Result, column, delete, func, select, text, update, URL
+from sqlalchemy import Result, column, delete, select, text, update
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from app.commons import SingletonMetaCls
+from app.commons.response_cache import response_cache
+from app.commons.tracing import current_span, tracer
+from app.crud.aggregation import freeze_metrics, group_expression, metric_expression
+from app.crud.bulk import insert_rows, normalize_rows, update_rows_by_pk, upsert_rows
+from app.crud.counting import CountStrategy, TotalCount, WindowCount, get_count_strategy, invalidate_cached_counts
+from app.crud.entity_cache import entity_cache, pk_ids_from_conds
+from app.crud.index_advisor import index_advisor
+from app.crud.instrumentation import query_stats
+from app.crud.loader import BatchLoader
+from app.crud.pagination import (decode_cursor, encode_cursor, keyset_condition, keyset_orders, parse_orders,
+                                 row_sort_values)
+from app.crud.projection import row_projection
+from app.crud.routing import is_replica_unavailable, replica_router
+from app.crud.statement_cache import StatementCache
+from app.crud.timeouts import StatementTimeout, mark_owned
+from app.crud.unit_of_work import current_unit_of_work
 from app.models import BaseOrmTable, async_session_maker
 
 T_BaseOrmTable = TypeVar("T_BaseOrmTable", bound=BaseOrmTable)
@@ -33,30 +49,138 @@ UpdateSchemaInternalType = TypeVar("UpdateSchemaInternalType", bound=BaseModel)
 DeleteSchemaType = TypeVar("DeleteSchemaType", bound=BaseModel)
 
 
-def with_session(method):
+async def _run_in_new_session(session_maker, method, db_manager, args, kwargs):
+    async with session_maker() as session:
+        mark_owned(session)
+        async with session.begin():
+            kwargs["session"] = session
+            return await method(db_manager, *args, **kwargs)
+
+
+async def _run_in_unit_of_work(session, read_only, method, db_manager, args, kwargs):
+    kwargs["session"] = session
+    if read_only:
+        return await method(db_manager, *args, **kwargs)
+    # 写操作包在 SAVEPOINT 中, 单次调用失败只回滚自身, 与独立事务时的语义一致
+    async with session.begin_nested():
+        return await method(db_manager, *args, **kwargs)
+
+
+async def _invalidate_after_write(db_manager, orm_table):
+    """ 写入提交后失效该表的缓存总数与响应缓存 """
+    invalidate_cached_counts(orm_table)
+    cache_tags = db_manager.response_cache_tags_for(orm_table)
+    if cache_tags:
+        await response_cache.invalidate(cache_tags)
+
+
+async def _gather_settled(*aws) -> list:
+    """
+    并发等待全部完成后再抛出第一个异常
+    Notes:
+        asyncio.gather 在第一个异常时立即返回, 另一个会话仍在执行, 随后关闭会话会触发 IllegalStateChangeError
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for ret in results:
+        if isinstance(ret, BaseException):
+            raise ret
+    return results
+
+
+def _in_unit_of_work(session) -> bool:
+    """ session 是否为当前请求级共享会话 """
+    uow = current_unit_of_work()
+    return uow is not None and session is not None and uow.session is session
+
+
+async def _invalidate_entities(session, orm_table, pk_ids):
+    """
+    失效实体缓存
+    Notes:
+        处于请求级共享会话时推迟到提交之后, 避免提交前的并发请求把旧数据重新写入缓存
+    """
+    if _in_unit_of_work(session):
+        current_unit_of_work().after_commit.append(functools.partial(entity_cache.invalidate, orm_table, pk_ids))
+    else:
+        await entity_cache.invalidate(orm_table, pk_ids)
+
+
+def with_session(method=None, *, read_only: bool = False):
     """
     兼容事务
     Args:
         method: orm 的 crud
+        read_only: 只读方法, 未传 session 时路由到只读副本
 
     Notes:
-        方法中没有带事务连接则，则构造
+        方法中没有带事务连接则，则构造; 处于 unit_of_work 中时复用请求级共享会话
+        调用时可传 use_primary=True 强制走主库; 副本连接失败时自动回退主库
 
     Returns:
     """
+    if method is None:
+        return functools.partial(with_session, read_only=read_only)
 
     @functools.wraps(method)
     async def wrapper(db_manager, *args, **kwargs):
+        use_primary = kwargs.pop("use_primary", False)
+        orm_table = kwargs.get("orm_table") or db_manager.orm_table
+        caller_token = None
+        if query_stats.enabled:
+            caller_token = query_stats.set_caller(f"{type(db_manager).__name__}.{method.__name__}")
+        # 只为最外层的 BaseManager 调用创建 span, 内部互相调用的耗时算在外层
+        in_uow = False
+        span = None
+        parent_span = current_span()
+        if parent_span is not None and parent_span.attributes.get("component") != "db":
+            span = tracer.start_span(
+                f"{type(db_manager).__name__}.{method.__name__}", "internal",
+                {"component": "db", "db.table": getattr(orm_table, "__tablename__", None), "db.read_only": read_only}
+            )
         try:
             session = kwargs.get("session") or None
             if session:
-                return await method(db_manager, *args, **kwargs)
+                ret = await method(db_manager, *args, **kwargs)
             else:
-                async with async_session_maker() as session:
-                    async with session.begin():
-                        kwargs["session"] = session
-                        return await method(db_manager, *args, **kwargs)
+                replica = replica_router.choose(orm_table, use_primary) if read_only else None
+                if replica is not None:
+                    try:
+                        return await _run_in_new_session(replica.session_maker, method, db_manager, args, kwargs)
+                    except Exception as e:
+                        if not is_replica_unavailable(e):
+                            raise
+                        replica_router.mark_down(replica, e)
+                uow = current_unit_of_work()
+                shared_session = uow.acquire() if uow is not None else None
+                if shared_session is not None:
+                    in_uow = True
+                    try:
+                        ret = await _run_in_unit_of_work(shared_session, read_only, method, db_manager, args, kwargs)
+                    finally:
+                        uow.release()
+                    if not read_only:
+                        uow.has_writes = True
+                else:
+                    ret = await _run_in_new_session(async_session_maker, method, db_manager, args, kwargs)
+            if not read_only:
+                replica_router.mark_write(orm_table)
+                # 本请求内随后的分页立即重新统计总数
+                invalidate_cached_counts(orm_table)
+                if in_uow:
+                    # 共享会话要等请求结束提交后再失效, 避免提交前的并发请求把旧数据重新写入缓存
+                    uow.after_commit.append(functools.partial(_invalidate_after_write, db_manager, orm_table))
+                else:
+                    await _invalidate_after_write(db_manager, orm_table)
+            return ret
+        except TimeoutError as e:
+            # 语句超时由调用方处理, 不能像其他异常一样吞掉后返回 None
+            if span is not None:
+                span.record_error(e)
+            logger.warning(f"操作 {db_manager.orm_table.__name__} 超时\n方法：{method.__name__}\n{e}\n")
+            raise
         except Exception as e:
+            if span is not None:
+                span.record_error(e)
             import traceback
             logger.exception(traceback.format_exc())
             logger.error(
@@ -65,10 +189,56 @@ def with_session(method):
                 f"方法：{method.__name__}\n"
                 f"{e}\n"
             )
+        finally:
+            if span is not None:
+                tracer.end_span(span)
+            if caller_token is not None:
+                query_stats.reset_caller(caller_token)
 
     return wrapper
 
 
+@asynccontextmanager
+async def snapshot_session(session_maker: async_sessionmaker = None) -> AsyncIterator[AsyncSession]:
+    """
+    一致性快照只读会话
+    Notes:
+        MySQL 下以 REPEATABLE READ 开启 START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY,
+        会话内的多条查询读取同一个快照; 其他方言退化为普通的单事务会话
+    """
+    async with (session_maker or async_session_maker)() as session:
+        async with session.begin():
+            if session.get_bind().dialect.name == "mysql":
+                conn = await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+                await conn.exec_driver_sql("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+            yield session
+
+
+@asynccontextmanager
+async def stream_session(db_manager, method_name: str, session: AsyncSession = None) -> AsyncIterator[AsyncSession]:
+    """
+    流式查询的会话
+    Notes:
+        异步生成器无法使用 with_session 装饰器, 这里按同样的规则复用或开启会话;
+        迭代中途出错会记录日志后继续抛出, 避免调用方拿到不完整的数据却无感知
+    """
+    try:
+        if session:
+            yield session
+        else:
+            async with replica_router.session_maker_for(db_manager.orm_table)() as session:
+                mark_owned(session)
+                async with session.begin():
+                    yield session
+    except Exception as e:
+        logger.exception(
+            f"操作 {db_manager.orm_table.__name__ if db_manager.orm_table else db_manager} 失败\n"
+            f"方法：{method_name}\n"
+            f"{e}\n"
+        )
+        raise
+
+
 def _extract_matching_columns_from_schema(
         model: Union[ModelType, AliasedClass],
         schema: Optional[type[BaseModel]],
@@ -130,9 +300,26 @@ def _extract_matching_columns_from_schema(
     return columns
 
 
+def _freeze(value: Any) -> Any:
+    """ list 转 tuple, 用作缓存键 """
+    return tuple(value) if isinstance(value, list) else value
+
+
 class BaseManager(metaclass=SingletonMetaCls):
     orm_table: Type[ModelType] = None
 
+    # 主键查询缓存的过期秒数, 设置后 query_by_id 走两级缓存(进程内 LRU + Redis), 写操作自动失效;
+    # 缓存整行数据, 含密码等敏感列的表不要开启
+    entity_cache_ttl: Optional[int] = None
+
+    # 写操作额外失效的响应缓存标签, 本表的标签总是失效
+    response_cache_tags: tuple = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.orm_table is not None and cls.entity_cache_ttl:
+            entity_cache.register(cls.orm_table, ttl=cls.entity_cache_ttl)
+
     # def __init__(self,
     #              model: Type[ModelType],
     #              is_deleted_column: str = "is_deleted",
@@ -162,6 +349,18 @@ class BaseManager(metaclass=SingletonMetaCls):
         "not_in": lambda column: column.not_in,
     }
 
+    # 查询语句模板缓存, 所有 Manager 共享
+    statement_cache = StatementCache(maxsize=512)
+
+    # 请求外使用的主键批量加载器(不缓存), 键为 orm表名
+    _id_loaders: Dict[str, BatchLoader] = {}
+
+    def response_cache_tags_for(self, orm_table) -> List[str]:
+        """ 写操作需要失效的响应缓存标签, 只包含被 @response_cache 声明过的标签 """
+        if not response_cache.tags:
+            return []
+        return response_cache.watched_tags(orm_table, *self.response_cache_tags)
+
     def _get_sqlalchemy_filter(
             self,
             operator: str,
@@ -172,13 +371,74 @@ class BaseManager(metaclass=SingletonMetaCls):
                 raise ValueError(f"<{operator}> filter must be tuple, list or set")
         return self._SUPPORTED_FILTERS.get(operator)
 
-    def _parse_filters(
-            self, model: Optional[Union[type[ModelType], AliasedClass]] = None, **kwargs
+    def _bind_filter_value(self, name: str, operator: str, value: Any, params: dict) -> tuple:
+        """
+        把过滤值拆成 (绑定方式, 参数名/字面量), 参数值写入 params
+        Notes:
+            None 以及 is/is_not 的取值会影响生成的 SQL(IS NULL), 作为字面量参与缓存键
+        """
+        self._get_sqlalchemy_filter(operator, value)
+        if value is None or operator in {"is", "is_not"}:
+            return "literal", value
+        if operator == "between":
+            params[f"{name}_0"], params[f"{name}_1"] = value
+            return "between", name
+        if operator in {"in", "not_in"}:
+            params[name] = list(value)
+            return "expanding", name
+        params[name] = value
+        return "bind", name
+
+    def _filter_shape(self, filter_kwargs: dict, prefix: str = "f") -> tuple[tuple, dict]:
+        """
+        解析 field__op 过滤参数的结构
+        Args:
+            filter_kwargs: 过滤参数
+            prefix: 绑定参数名前缀, 同一条语句中的多组过滤参数使用不同前缀
+
+        Returns: (结构, 参数值)
+            结构只包含字段、操作符与绑定方式, 作为语句模板的缓存键
+        """
+        shape, params = [], {}
+        for idx, (key, value) in enumerate(filter_kwargs.items()):
+            name = f"{prefix}{idx}"
+            if "__" in key:
+                field_name, op = key.rsplit("__", 1)
+                if op == "or":
+                    or_shape = tuple(
+                        (or_key, self._bind_filter_value(f"{name}_{or_idx}", or_key, or_value, params))
+                        for or_idx, (or_key, or_value) in enumerate(value.items())
+                    )
+                    shape.append((key, or_shape))
+                else:
+                    shape.append((key, self._bind_filter_value(name, op, value, params)))
+            else:
+                shape.append((key, self._bind_filter_value(name, "eq", value, params)))
+        return tuple(shape), params
+
+    def _bind_filter(self, column: Any, operator: str, spec: tuple) -> Optional[ColumnElement]:
+        """ 根据绑定方式构造以 bindparam 占位的过滤条件 """
+        kind, arg = spec
+        type_ = getattr(column, "type", None)
+        if kind == "literal":
+            value = arg
+        elif kind == "between":
+            return column.between(bindparam(f"{arg}_0", type_=type_), bindparam(f"{arg}_1", type_=type_))
+        else:
+            value = bindparam(arg, type_=type_, expanding=kind == "expanding")
+
+        if operator == "eq":
+            return column == value
+        sqlalchemy_filter = self._SUPPORTED_FILTERS.get(operator)
+        if sqlalchemy_filter:
+            return sqlalchemy_filter(column)(value)
+        return None
+
+    def _build_filters(
+            self, model: Union[type[ModelType], AliasedClass], shape: tuple
     ) -> list[ColumnElement]:
-        model = model or self.orm_table
         filters = []
-
-        for key, value in kwargs.items():
+        for key, spec in shape:
             if "__" in key:
                 field_name, op = key.rsplit("__", 1)
                 column = getattr(model, field_name, None)
@@ -186,27 +446,37 @@ class BaseManager(metaclass=SingletonMetaCls):
                     raise ValueError(f"Invalid filter column: {field_name}")
                 if op == "or":
                     or_filters = [
-                        sqlalchemy_filter(column)(or_value)
-                        for or_key, or_value in value.items()
-                        if (
-                               sqlalchemy_filter := self._get_sqlalchemy_filter(
-                                   or_key, value
-                               )
-                           )
-                           is not None
+                        or_filter
+                        for or_key, or_spec in spec
+                        if (or_filter := self._bind_filter(column, or_key, or_spec)) is not None
                     ]
                     filters.append(or_(*or_filters))
-                else:
-                    sqlalchemy_filter = self._get_sqlalchemy_filter(op, value)
-                    if sqlalchemy_filter:
-                        filters.append(sqlalchemy_filter(column)(value))
+                elif (sqlalchemy_filter := self._bind_filter(column, op, spec)) is not None:
+                    filters.append(sqlalchemy_filter)
             else:
                 column = getattr(model, key, None)
                 if column is not None:
-                    filters.append(column == value)
+                    filters.append(self._bind_filter(column, "eq", spec))
 
         return filters
 
+    def _parse_filters(
+            self, model: Optional[Union[type[ModelType], AliasedClass]] = None, **kwargs
+    ) -> list[ColumnElement]:
+        model = model or self.orm_table
+        shape, params = self._filter_shape(kwargs)
+        if index_advisor.enabled and hasattr(model, "__table__"):
+            index_advisor.record_filters(model, shape, params)
+
+        cache_key = ("filters", model, shape)
+        filters = self.statement_cache.get(cache_key)
+        if filters is None:
+            filters = self._build_filters(model, shape)
+            self.statement_cache.set(cache_key, filters)
+
+        # unique_params: 填充参数值并把参数名匿名化, 多组过滤条件组合时不会重名
+        return [sqlalchemy_filter.unique_params(params) for sqlalchemy_filter in filters]
+
     def _apply_sorting(
             self,
             stmt: Select,
@@ -304,7 +574,8 @@ class BaseManager(metaclass=SingletonMetaCls):
         object_dict = object.model_dump()
         db_object: ModelType = self.orm_table(**object_dict)
         session.add(db_object)
-        if commit:
+        # 共享会话由请求结束时统一提交, 这里提交会连同 SAVEPOINT 外的写入一起提前提交
+        if commit and not _in_unit_of_work(session):
             await session.commit()
         return db_object
 
@@ -358,16 +629,42 @@ class BaseManager(metaclass=SingletonMetaCls):
         Note:
             This method does not execute the generated SQL statement.
             Use `db.execute(stmt)` to run the query and fetch results.
+
+            Statements are cached per (orm_table, schema, filter keys and operators, sort spec) as templates with
+            bound parameters, so repeated query shapes skip filter parsing and hit SQLAlchemy's compiled cache.
+            See `BaseManager.statement_cache.stats()` for hit/miss statistics.
         """
-        to_select = _extract_matching_columns_from_schema(
-            model=self.orm_table, schema=schema_to_select
+        shape, params = self._filter_shape(kwargs)
+        if index_advisor.enabled:
+            index_advisor.record_filters(self.orm_table, shape, params, sort_columns, sort_orders)
+        cache_key = (
+            "select", self.orm_table, schema_to_select, shape, _freeze(sort_columns), _freeze(sort_orders)
         )
-        filters = self._parse_filters(**kwargs)
-        stmt = select(*to_select).filter(*filters)
+        stmt = self.statement_cache.get(cache_key)
+        if stmt is None:
+            to_select = _extract_matching_columns_from_schema(
+                model=self.orm_table, schema=schema_to_select
+            )
+            stmt = select(*to_select).filter(*self._build_filters(self.orm_table, shape))
 
-        if sort_columns:
-            stmt = self._apply_sorting(stmt, sort_columns, sort_orders)
-        return stmt
+            if sort_columns:
+                stmt = self._apply_sorting(stmt, sort_columns, sort_orders)
+            self.statement_cache.set(cache_key, stmt)
+
+        return stmt.unique_params(params)
+
+    @with_session(read_only=True)
+    async def execute_select(self, stmt: Select, *, session: AsyncSession = None) -> List[dict]:
+        """
+        执行 select() 构造的语句
+        Args:
+            stmt: select() 返回的语句
+            session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务, 默认路由到只读副本
+
+        Returns: 查询结果 [RowMapping, ...]
+        """
+        cursor_result = await session.execute(stmt)
+        return cursor_result.mappings().all()
 
     @with_session
     async def bulk_delete_by_ids(
@@ -472,6 +769,7 @@ class BaseManager(metaclass=SingletonMetaCls):
             delete_stmt = delete(orm_table).where(*conds)
 
         cursor_result = await session.execute(delete_stmt)
+        await _invalidate_entities(session, orm_table, pk_ids_from_conds(orm_table, conds))
 
         # 返回影响的记录数
         return cursor_result.rowcount
@@ -483,8 +781,11 @@ class BaseManager(metaclass=SingletonMetaCls):
             *,
             orm_table: Type[BaseOrmTable] = None,
             flush: bool = False,
+            core: bool = False,
+            chunk_size: int = 1000,
+            return_ids: bool = False,
             session: AsyncSession = None,
-    ) -> List[T_BaseOrmTable]:
+    ) -> Union[List[T_BaseOrmTable], List[int], int]:
         """
         批量插入
         Args:
@@ -492,12 +793,21 @@ class BaseManager(metaclass=SingletonMetaCls):
                 e.g. [UserTable(username="hui", age=18), ...] or [{"username": "hui", "age": 18}, ...]
             orm_table: orm表映射类
             flush: 刷新对象状态，默认不刷新
+            core: Core 批量插入模式, 按 chunk_size 分批 executemany, 不创建 orm 实例, 适合上万行的导入
+            chunk_size: core 模式每批行数
+            return_ids: core 模式是否返回生成的主键列表
             session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
 
         Returns:
             成功插入的对象列表
+            core 模式返回插入行数, return_ids=True 时返回主键列表(与 table_objs 顺序一致)
         """
         orm_table = orm_table or self.orm_table
+        if core:
+            table = orm_table.__table__
+            rows = normalize_rows(table, table_objs)
+            return await insert_rows(session, table, rows, chunk_size=chunk_size, return_ids=return_ids)
+
         if all(isinstance(table_obj, dict) for table_obj in table_objs):
             # 字典列表转成orm映射类实例列表处理
             table_objs = [orm_table(**table_obj) for table_obj in table_objs]
@@ -531,12 +841,12 @@ class BaseManager(metaclass=SingletonMetaCls):
         await session.flush(objects=[table_obj])  # 刷新对象状态，获取新增的id
         return table_obj.id
 
-    @with_session
     async def query_by_id(
             self,
             pk_id: int,
             *,
             orm_table: Type[BaseOrmTable] = None,
+            use_primary: bool = False,
             session: AsyncSession = None,
     ) -> Union[T_BaseOrmTable, None]:
         """
@@ -544,17 +854,100 @@ class BaseManager(metaclass=SingletonMetaCls):
         Args:
             pk_id: 主键id
             orm_table: orm表映射类
+            use_primary: 强制查主库(跳过缓存与只读副本)
             session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
 
+        Notes:
+            模型开启 entity_cache_ttl 且未传 session 时读两级缓存;
+            传入 session 时处于调用方事务中, 直接查库保证读到本事务的写入
+
         Returns:
             orm映射类的实例对象
         """
+        orm_table = orm_table or self.orm_table
+        uow = current_unit_of_work()
+        # 共享会话中有未提交的写入时不读写缓存, 避免缓存到随后被回滚的数据
+        pending_writes = uow is not None and uow.has_writes
+        if session is None and not use_primary and not pending_writes and entity_cache.enabled_for(orm_table):
+            return await entity_cache.get_or_load(
+                orm_table, pk_id, lambda: self._query_by_id(pk_id, orm_table=orm_table)
+            )
+        return await self._query_by_id(pk_id, orm_table=orm_table, use_primary=use_primary, session=session)
+
+    @with_session(read_only=True)
+    async def _query_by_id(
+            self,
+            pk_id: int,
+            *,
+            orm_table: Type[BaseOrmTable] = None,
+            session: AsyncSession = None,
+    ) -> Union[T_BaseOrmTable, None]:
         orm_table = orm_table or self.orm_table
         ret = await session.get(orm_table, pk_id)
         return ret
 
-    @with_session
-    async def _query(
+    def _id_loader(self, orm_table: Type[BaseOrmTable]) -> BatchLoader:
+        """ unit_of_work 中使用请求级带缓存的加载器, 否则使用只合并同一 tick 查询的全局加载器 """
+        table_name = orm_table.__tablename__
+        uow = current_unit_of_work()
+        loaders = uow.loaders if uow is not None else self._id_loaders
+        loader = loaders.get(table_name)
+        if loader is None:
+            loader = BatchLoader(
+                lambda pk_ids: self._query_by_ids(pk_ids, orm_table=orm_table), cache=uow is not None
+            )
+            loaders[table_name] = loader
+        return loader
+
+    async def load_by_id(
+            self,
+            pk_id: int,
+            *,
+            orm_table: Type[BaseOrmTable] = None,
+    ) -> Union[T_BaseOrmTable, None]:
+        """
+        根据主键id查询, 同一事件循环 tick 内的并发调用合并为一次 IN 查询
+        Args:
+            pk_id: 主键id
+            orm_table: orm表映射类
+
+        Notes:
+            unit_of_work(请求)内相同主键只查询一次; 写操作不会失效已加载的结果, 需要最新数据时用 query_by_id
+
+        Examples:
+            owner, executor = await asyncio.gather(
+                UserManager().load_by_id(report.created_by), UserManager().load_by_id(report.executor)
+            )
+
+        Returns:
+            orm映射类的实例对象
+        """
+        return await self._id_loader(orm_table or self.orm_table).load(pk_id)
+
+    async def load_by_ids(
+            self,
+            pk_ids: List[int],
+            *,
+            orm_table: Type[BaseOrmTable] = None,
+    ) -> List[Union[T_BaseOrmTable, None]]:
+        """
+        批量根据主键id查询, 结果与 pk_ids 一一对应, 不存在的为 None
+        """
+        return await self._id_loader(orm_table or self.orm_table).load_many(pk_ids)
+
+    @with_session(read_only=True)
+    async def _query_by_ids(
+            self,
+            pk_ids: List[int],
+            *,
+            orm_table: Type[BaseOrmTable] = None,
+            session: AsyncSession = None,
+    ) -> Dict[int, T_BaseOrmTable]:
+        orm_table = orm_table or self.orm_table
+        cursor_result = await session.execute(select(orm_table).where(orm_table.id.in_(pk_ids)))
+        return {orm_obj.id: orm_obj for orm_obj in cursor_result.scalars()}
+
+    def _build_query(
             self,
             *,
             cols: list = None,
@@ -563,28 +956,18 @@ class BaseManager(metaclass=SingletonMetaCls):
             orders: list = None,
             limit: int = None,
             offset: int = 0,
-            session: AsyncSession = None,
-    ) -> Result[Any]:
+    ) -> Select:
         """
-        通用查询
-        Args:
-            cols: 查询的列表字段
-            orm_table: orm表映射类
-            conds: 查询的条件列表
-            orders: 排序列表, 默认id升序
-            limit: 限制数量大小
-            offset: 偏移量
-            session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
-
-        Returns: 查询结果集
-            cursor_result
+        构造通用查询语句, 参数同 _query
         """
         cols = cols or []
         cols = [column(col_obj) if isinstance(col_obj, str) else col_obj for col_obj in cols]  # 兼容字符串列表
 
+        orm_table = orm_table or self.orm_table
+        if index_advisor.enabled:
+            index_advisor.record_conds(orm_table, conds, orders)
         conditions = conds or []
         orders = orders or [column("id")]
-        orm_table = orm_table or self.orm_table
 
         # 构造查询
         if cols:
@@ -596,12 +979,86 @@ class BaseManager(metaclass=SingletonMetaCls):
 
         if limit:
             query_sql = query_sql.limit(limit).offset(offset)
+        return query_sql
+
+    @with_session(read_only=True)
+    async def _query(
+            self,
+            *,
+            cols: list = None,
+            orm_table: BaseOrmTable = None,
+            conds: list = None,
+            orders: list = None,
+            limit: int = None,
+            offset: int = 0,
+            session: AsyncSession = None,
+    ) -> Result[Any]:
+        """
+        通用查询
+        Args:
+            cols: 查询的列表字段
+            orm_table: orm表映射类
+            conds: 查询的条件列表
+            orders: 排序列表, 默认id升序
+            limit: 限制数量大小
+            offset: 偏移量
+            session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
+
+        Returns: 查询结果集
+            cursor_result
+        """
+        query_sql = self._build_query(
+            cols=cols, orm_table=orm_table, conds=conds, orders=orders, limit=limit, offset=offset
+        )
 
         # 执行查询
         cursor_result = await session.execute(query_sql)
         return cursor_result
 
-    @with_session
+    async def stream_all(
+            self,
+            *,
+            cols: list = None,
+            orm_table: BaseOrmTable = None,
+            conds: list = None,
+            orders: list = None,
+            flat: bool = False,
+            batch_size: int = 1000,
+            session: AsyncSession = None,
+    ) -> AsyncIterator[list]:
+        """
+        流式查询多行, 基于服务端游标(session.stream + yield_per)按批返回, 内存占用与结果集大小无关
+        Args:
+            cols: 查询的列表字段
+            orm_table: orm表映射类
+            conds: 查询的条件列表
+            orders: 排序列表
+            flat: 单字段时扁平化处理
+            batch_size: 每批行数
+            session: 数据库会话对象，如果为 None，则在方法内部开启新的事务, 迭代结束或提前退出时关闭
+
+        Examples:
+            async for batch in OperationLogManager().stream_all(conds=[OperationLog.user_id == 1], batch_size=500):
+                writer.writerows(row.to_dict() for row in batch)
+                if done:
+                    break  # 提前退出会关闭游标并归还连接
+
+        Returns: 异步迭代器, 每次返回一批结果(格式同 query_all)
+        """
+        query_sql = self._build_query(cols=cols, orm_table=orm_table, conds=conds, orders=orders)
+        async with stream_session(self, "stream_all", session) as stream_db:
+            stream_result = await stream_db.stream(query_sql.execution_options(yield_per=batch_size))
+            try:
+                if cols and not (flat and len(cols) == 1):
+                    partitions = stream_result.mappings().partitions(batch_size)
+                else:
+                    partitions = stream_result.scalars().partitions(batch_size)
+                async for batch in partitions:
+                    yield batch
+            finally:
+                await stream_result.close()
+
+    @with_session(read_only=True)
     async def query_one(
             self,
             *,
@@ -661,7 +1118,7 @@ class BaseManager(metaclass=SingletonMetaCls):
             # eg: select id, username, age from user where id=1 => UserTable(id=1, username="hui", age=18)
             return cursor_result.scalar_one()
 
-    @with_session
+    @with_session(read_only=True)
     async def query_all(
             self,
             *,
@@ -672,6 +1129,8 @@ class BaseManager(metaclass=SingletonMetaCls):
             flat: bool = False,
             limit: int = None,
             offset: int = None,
+            schema_to_select: Optional[type[BaseModel]] = None,
+            as_tuples: bool = False,
             session: AsyncSession = None,
     ) -> Union[List[dict], List[T_BaseOrmTable], Any]:
         """
@@ -684,8 +1143,27 @@ class BaseManager(metaclass=SingletonMetaCls):
             flat: 单字段时扁平化处理
             limit: 限制数量大小
             offset: 偏移量
+            schema_to_select: 轻量投影, 只查询 schema 中的字段并直接构造 schema 实例(不做校验)
+            as_tuples: 轻量投影, 返回命名元组, 与 schema_to_select 同时传时只查询 schema 中的字段
             session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
+
+        Notes:
+            轻量投影走 Core 执行, 不创建 orm 实例、不进入 identity map, 适用于只读的列表接口
+
+        Examples:
+            rows = await UserManager().query_all(as_tuples=True, limit=100)
+            rows[0].username
+
+            users = await UserManager().query_all(schema_to_select=UserReadSchema, limit=100)
         """
+        if schema_to_select is not None or as_tuples:
+            if cols:
+                raise ValueError("cols cannot be used together with schema_to_select/as_tuples")
+            return await self._query_projection(
+                orm_table=orm_table, conds=conds, orders=orders, limit=limit, offset=offset,
+                schema_to_select=schema_to_select, as_tuples=as_tuples, session=session
+            )
+
         cursor_result = await self._query(
             cols=cols, orm_table=orm_table, conds=conds, orders=orders, limit=limit, offset=offset, session=session
         )
@@ -703,6 +1181,187 @@ class BaseManager(metaclass=SingletonMetaCls):
             # [User(id=1, username="hui", age=18), User(id=2, username="dbk", age=18)
             return cursor_result.scalars().all()
 
+    @with_session(read_only=True)
+    async def _query_projection(
+            self,
+            *,
+            orm_table: BaseOrmTable = None,
+            conds: list = None,
+            orders: list = None,
+            limit: int = None,
+            offset: int = 0,
+            schema_to_select: Optional[type[BaseModel]] = None,
+            as_tuples: bool = False,
+            session: AsyncSession = None,
+    ) -> list:
+        projection = row_projection(orm_table or self.orm_table, schema_to_select, as_tuples)
+        query_sql = self._build_query(
+            cols=list(projection.columns), orm_table=orm_table, conds=conds, orders=orders, limit=limit,
+            offset=offset or 0
+        )
+        # 直接在连接上执行, 跳过 ORM 的结果处理
+        conn = await session.connection()
+        cursor_result = await conn.execute(query_sql)
+        return projection.build(cursor_result.all())
+
+    @with_session(read_only=True)
+    async def count(
+            self,
+            *,
+            orm_table: Type[BaseOrmTable] = None,
+            conds: list = None,
+            strategy: Union[str, CountStrategy] = "exact",
+            session: AsyncSession = None,
+    ) -> TotalCount:
+        """
+        统计总数
+        Args:
+            orm_table: orm表映射类
+            conds: 查询的条件列表
+            strategy: 统计策略 exact/capped/estimated/cached/window 或 CountStrategy 实例
+            session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
+
+        Returns: 总数 TotalCount(int), 非精确结果带 capped/estimated 标记
+        """
+        orm_table = orm_table or self.orm_table
+        if index_advisor.enabled:
+            index_advisor.record_conds(orm_table, conds, None)
+        return await get_count_strategy(strategy).count(orm_table, conds or [], session)
+
+    @with_session(read_only=True)
+    async def aggregate(
+            self,
+            *,
+            metrics: Dict[str, str],
+            group_by: Optional[Union[str, List[str]]] = None,
+            orm_table: Type[BaseOrmTable] = None,
+            conds: list = None,
+            sort_columns: Optional[Union[str, List[str]]] = None,
+            sort_orders: Optional[Union[str, List[str]]] = None,
+            having: Dict[str, Any] = None,
+            limit: int = None,
+            session: AsyncSession = None,
+            **kwargs,
+    ) -> list:
+        """
+        服务端聚合, 编译成一条 GROUP BY 查询
+        Args:
+            metrics: 指标 {结果列名: "count" 或 "字段__count/count_distinct/sum/avg/min/max/p95"}
+                百分位仅在支持 percentile_cont 的数据库(postgresql/oracle)上可用
+            group_by: 分组字段, 支持 "字段__hour/day/month/year" 按时间粒度分组, 结果列名与传入一致
+            orm_table: orm表映射类
+            conds: 查询的条件列表, 与 **kwargs 过滤条件取交集
+            sort_columns: 排序的结果列名(分组字段或指标名), 默认按分组字段升序
+            sort_orders: 排序方向 asc/desc, 与 sort_columns 一一对应
+            having: 分组过滤, 写法同 **kwargs, 字段为指标名, eg: {"total__gte": 10, "failed__gt": 0}
+            limit: 限制分组数量
+            session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务, 默认路由到只读副本
+            **kwargs: 过滤条件, 写法与 select() 相同, eg: env=1、created_at__gte=start
+
+        Returns: [Row, ...] 紧凑行, 可按列名属性访问, _asdict() 转字典
+
+        Examples:
+            rows = await ReportManager().aggregate(
+                group_by=["env", "created_at__day"],
+                metrics={
+                    "total": "count",
+                    "success": "success_count__sum",
+                    "failed": "failed_count__sum",
+                    "error": "error_count__sum",
+                    "skipped": "skipped_count__sum",
+                },
+                created_at__gte=start_time,
+            )
+            rows[0].env, rows[0].success
+        """
+        if not metrics:
+            raise ValueError("metrics is required")
+        orm_table = orm_table or self.orm_table
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by or [])
+        if sort_columns is not None and not isinstance(sort_columns, list):
+            sort_columns = [sort_columns]
+        if sort_orders is not None and not isinstance(sort_orders, list):
+            sort_orders = [sort_orders] * len(sort_columns or [])
+
+        shape, params = self._filter_shape(kwargs)
+        having_shape, having_params = self._filter_shape(having or {}, prefix="h")
+        if index_advisor.enabled:
+            index_advisor.record_filters(orm_table, shape, params)
+            if conds:
+                index_advisor.record_conds(orm_table, conds, None)
+
+        dialect_name = session.get_bind().dialect.name
+        cache_key = (
+            "aggregate", orm_table, dialect_name, tuple(group_by), freeze_metrics(metrics), shape,
+            _freeze(sort_columns), _freeze(sort_orders), having_shape
+        )
+        stmt = self.statement_cache.get(cache_key)
+        if stmt is None:
+            stmt = self._build_aggregate(
+                orm_table, dialect_name, group_by, metrics, shape, sort_columns, sort_orders, having_shape
+            )
+            self.statement_cache.set(cache_key, stmt)
+
+        stmt = stmt.params({**params, **having_params})
+        if conds:
+            stmt = stmt.where(*conds)
+        if limit:
+            stmt = stmt.limit(limit)
+        conn = await session.connection()
+        cursor_result = await conn.execute(stmt)
+        return cursor_result.all()
+
+    def _build_aggregate(
+            self,
+            orm_table,
+            dialect_name: str,
+            group_by: List[str],
+            metrics: Dict[str, str],
+            shape: tuple,
+            sort_columns: Optional[List[str]],
+            sort_orders: Optional[List[str]],
+            having_shape: tuple = (),
+    ) -> Select:
+        group_cols = [group_expression(orm_table, spec, dialect_name) for spec in group_by]
+        metric_cols = [metric_expression(orm_table, alias, spec, dialect_name) for alias, spec in metrics.items()]
+        labeled = {col.name: col for col in group_cols + metric_cols}
+        if len(labeled) != len(group_cols) + len(metric_cols):
+            raise ValueError("metric names must not duplicate group by columns")
+
+        stmt = select(*group_cols, *metric_cols).filter(*self._build_filters(orm_table, shape))
+        if group_cols:
+            # 按结果列名分组, 时间粒度表达式中的格式参数在 SELECT 与 GROUP BY 中不必重复绑定
+            stmt = stmt.group_by(*[column(col.name) for col in group_cols])
+        if having_shape:
+            stmt = stmt.having(*self._build_having({col.name: col for col in metric_cols}, having_shape))
+
+        if sort_columns:
+            sort_orders = sort_orders or ["asc"] * len(sort_columns)
+            if len(sort_columns) != len(sort_orders):
+                raise ValueError("The length of sort_columns and sort_orders must match.")
+            for name, order in zip(sort_columns, sort_orders):
+                if name not in labeled:
+                    raise ValueError(f"Invalid sort column: {name}, must be a group by column or metric name")
+                if order not in ("asc", "desc"):
+                    raise ValueError(f"Invalid sort order: {order}. Only 'asc' or 'desc' are allowed.")
+                stmt = stmt.order_by(asc(labeled[name]) if order == "asc" else desc(labeled[name]))
+        elif group_cols:
+            stmt = stmt.order_by(*group_cols)
+        return stmt
+
+    def _build_having(self, metric_cols: Dict[str, ColumnElement], shape: tuple) -> list[ColumnElement]:
+        """ 分组过滤条件, 只能引用指标 """
+        filters = []
+        for key, spec in shape:
+            name, op = key.rsplit("__", 1) if "__" in key else (key, "eq")
+            if name not in metric_cols:
+                raise ValueError(f"Invalid having metric: {name}, must be one of {list(metric_cols)}")
+            having_filter = self._bind_filter(metric_cols[name], op, spec) if op != "or" else None
+            if having_filter is None:
+                raise ValueError(f"Invalid having operator: {op}")
+            filters.append(having_filter)
+        return filters
+
     async def list_page(
             self,
             cols: list = None,
@@ -711,6 +1370,11 @@ class BaseManager(metaclass=SingletonMetaCls):
             orders: list = None,
             curr_page: int = 1,
             page_size: int = 20,
+            cursor: str = None,
+            keyset: bool = False,
+            count_strategy: Union[str, CountStrategy] = "exact",
+            snapshot: bool = False,
+            use_primary: bool = False,
             session: AsyncSession = None,
     ):
         """
@@ -722,26 +1386,210 @@ class BaseManager(metaclass=SingletonMetaCls):
             orders: 排序列表
             curr_page: 页码
             page_size: 每页数量
-            session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
+            cursor: 游标分页时上一页返回的 next_cursor, 传入时自动开启游标分页
+            keyset: 游标分页(seek)模式, 不再使用 OFFSET, 深度翻页耗时与首页一致
+            count_strategy: 总数统计策略
+                exact: 精确 COUNT(*)
+                capped: 封顶统计, 超过上限展示为 "1000+"
+                estimated: MySQL 统计信息/EXPLAIN 估算
+                cached: 按过滤条件指纹缓存, 带 TTL; BaseManager 的写操作会失效该表的缓存, 其他途径的写入要等 TTL 过期
+                window: COUNT(*) OVER() 与分页数据同一条语句返回
+            snapshot: 总数与分页数据在同一个一致性快照中查询(同一连接顺序执行), 需要总数与数据严格一致时使用;
+                默认不传 session 时从连接池取两个连接、在两个事务中并发执行, 两次查询之间有写入提交时
+                total_count 可能与 data_list 不一致(如最后一页的条数与总数对不上);
+                处于 unit_of_work 中时总数与数据在请求级共享会话中顺序执行, 同样保持一致
+            use_primary: 强制查主库, 默认路由到只读副本
+            session: 数据库会话对象，传入时总数与分页数据在该会话中顺序执行
 
         Returns: total_count, data_list
+            游标分页模式返回 total_count, data_list, next_cursor, 没有下一页时 next_cursor 为 None
         """
         conds = conds or []
         orders = orders or [column("id")]
         orm_table = orm_table or self.orm_table
+        strategy = get_count_strategy(count_strategy)
+
+        if keyset or cursor:
+            return await self._list_page_by_cursor(
+                cols=cols, orm_table=orm_table, conds=conds, orders=orders, cursor=cursor, page_size=page_size,
+                strategy=strategy, snapshot=snapshot, use_primary=use_primary, session=session
+            )
 
         limit = page_size
         offset = (curr_page - 1) * page_size
-        total_count, data_list = await asyncio.gather(
-            self.query_one(cols=[func.count()], orm_table=orm_table, conds=conds, orders=orders, flat=True,
-                           session=session),
-            self.query_all(
-                cols=cols, orm_table=orm_table, conds=conds, orders=orders, limit=limit, offset=offset, session=session
+        if strategy.single_round_trip:
+            return await self._list_page_with_window_count(
+                cols=cols, orm_table=orm_table, conds=conds, orders=orders, limit=limit, offset=offset,
+                strategy=strategy, use_primary=use_primary, session=session
+            )
+
+        total_count, data_list = await self._gather_page(
+            lambda page_session: self.count(
+                orm_table=orm_table, conds=conds, strategy=strategy, session=page_session
             ),
+            lambda page_session: self.query_all(
+                cols=cols, orm_table=orm_table, conds=conds, orders=orders, limit=limit, offset=offset,
+                session=page_session
+            ),
+            orm_table=orm_table,
+            snapshot=snapshot,
+            use_primary=use_primary,
+            session=session,
         )
 
         return total_count, data_list
 
+    async def _gather_page(
+            self,
+            count_query: Callable[[AsyncSession], Any],
+            data_query: Callable[[AsyncSession], Any],
+            *,
+            orm_table: BaseOrmTable = None,
+            snapshot: bool = False,
+            use_primary: bool = False,
+            session: AsyncSession = None,
+    ):
+        """
+        执行分页的总数查询与数据查询
+        Args:
+            count_query: 接收 session 的总数查询
+            data_query: 接收 session 的分页数据查询
+            orm_table: orm表映射类, 用于只读副本路由
+            snapshot: 在同一个一致性快照中顺序执行
+            use_primary: 强制查主库
+            session: 调用方的会话对象
+
+        Notes:
+            AsyncSession 同一时刻只能执行一条语句:
+                传入 session 时在该会话中顺序执行;
+                处于 unit_of_work 且共享会话空闲时在共享会话中顺序执行, 能读到本请求未提交的写入;
+                snapshot=True 时在一致性快照只读事务中顺序执行, 总数与数据严格一致;
+                否则两个查询各自从连接池取连接并发执行, 耗时取两者较大值, 总数与数据不保证一致
+
+        Returns: total_count, data_list
+        """
+        if session is not None:
+            return await count_query(session), await data_query(session)
+
+        uow = current_unit_of_work()
+        shared_session = uow.acquire() if uow is not None else None
+        if shared_session is not None:
+            try:
+                return await count_query(shared_session), await data_query(shared_session)
+            finally:
+                uow.release()
+
+        replica = replica_router.choose(orm_table, use_primary)
+        if replica is not None:
+            try:
+                return await self._gather_page_in(
+                    replica.session_maker, count_query, data_query, snapshot=snapshot
+                )
+            except Exception as e:
+                if not is_replica_unavailable(e):
+                    raise
+                replica_router.mark_down(replica, e)
+        return await self._gather_page_in(async_session_maker, count_query, data_query, snapshot=snapshot)
+
+    @staticmethod
+    async def _gather_page_in(
+            session_maker: async_sessionmaker,
+            count_query: Callable[[AsyncSession], Any],
+            data_query: Callable[[AsyncSession], Any],
+            *,
+            snapshot: bool = False,
+    ):
+        if snapshot:
+            async with snapshot_session(session_maker) as snap_session:
+                return await count_query(snap_session), await data_query(snap_session)
+
+        async with session_maker() as count_session, session_maker() as data_session:
+            async with count_session.begin(), data_session.begin():
+                # 先取连接, 连接失败在这里抛出(由调用方回退主库), 不会被查询方法的 with_session 吞掉
+                await _gather_settled(count_session.connection(), data_session.connection())
+                return await _gather_settled(count_query(count_session), data_query(data_session))
+
+    @with_session(read_only=True)
+    async def _list_page_with_window_count(
+            self,
+            *,
+            cols: list,
+            orm_table: BaseOrmTable,
+            conds: list,
+            orders: list,
+            limit: int,
+            offset: int,
+            strategy: WindowCount,
+            session: AsyncSession = None,
+    ):
+        """
+        单次往返分页: SELECT ..., COUNT(*) OVER() AS __total_count ... LIMIT ... OFFSET ...
+        """
+        cursor_result = await self._query(
+            cols=[*(cols or [orm_table]), strategy.column()], orm_table=orm_table, conds=conds, orders=orders,
+            limit=limit, offset=offset, session=session
+        )
+        if cols:
+            rows = cursor_result.mappings().all()
+            data_list = [{key: value for key, value in row.items() if key != strategy.label} for row in rows]
+            total_count = rows[0][strategy.label] if rows else None
+        else:
+            rows = cursor_result.all()
+            data_list = [row[0] for row in rows]
+            total_count = rows[0][-1] if rows else None
+
+        if total_count is None:
+            # 页码越界时窗口函数拿不到总数
+            total_count = await strategy.count(orm_table, conds, session) if offset else 0
+        return TotalCount(total_count), data_list
+
+    async def _list_page_by_cursor(
+            self,
+            *,
+            cols: list,
+            orm_table: BaseOrmTable,
+            conds: list,
+            orders: list,
+            cursor: Optional[str],
+            page_size: int,
+            strategy: CountStrategy,
+            snapshot: bool = False,
+            use_primary: bool = False,
+            session: AsyncSession = None,
+    ):
+        """
+        游标(keyset)分页
+        Notes:
+            按 orders + id 组成唯一排序键，用上一页最后一行的排序键值构造 seek 条件代替 OFFSET，
+            多取一行判断是否还有下一页; 总数按不带 seek 条件的过滤集合统计
+        """
+        sort_keys = parse_orders(orders, orm_table)
+        page_conds = list(conds)
+        if cursor:
+            page_conds.append(keyset_condition(sort_keys, decode_cursor(cursor, sort_keys)))
+
+        total_count, data_list = await self._gather_page(
+            lambda page_session: self.count(
+                orm_table=orm_table, conds=conds, strategy=strategy, session=page_session
+            ),
+            lambda page_session: self.query_all(
+                cols=cols, orm_table=orm_table, conds=page_conds, orders=keyset_orders(sort_keys),
+                limit=page_size + 1, session=page_session
+            ),
+            orm_table=orm_table,
+            snapshot=snapshot,
+            use_primary=use_primary,
+            session=session,
+        )
+
+        data_list = list(data_list or [])
+        next_cursor = None
+        if len(data_list) > page_size:
+            data_list = data_list[:page_size]
+            next_cursor = encode_cursor(sort_keys, row_sort_values(data_list[-1], sort_keys))
+
+        return total_count, data_list, next_cursor
+
     @with_session
     async def update(
             self,
@@ -768,8 +1616,39 @@ class BaseManager(metaclass=SingletonMetaCls):
             return
         sql = update(orm_table).where(*conds).values(**values)
         cursor_result = await session.execute(sql)
+        await _invalidate_entities(session, orm_table, pk_ids_from_conds(orm_table, conds))
         return cursor_result.rowcount
 
+    @with_session
+    async def bulk_update(
+            self,
+            items: List[dict],
+            *,
+            orm_table: Type[BaseOrmTable] = None,
+            chunk_size: int = 500,
+            use_case: bool = False,
+            session: AsyncSession = None,
+    ) -> int:
+        """
+        按主键批量更新, 每行可以更新不同的字段
+        Args:
+            items: 更新列表, e.g. [{"id": 1, "status": 3}, {"id": 2, "status": 3, "success_count": 10}]
+            orm_table: ORM表映射类
+            chunk_size: 每批行数
+            use_case: 默认按更新字段分组 executemany; True 时每批合并为一条 CASE WHEN 语句
+            session: 数据库会话对象，如果为 None，则在方法内部开启新的事务
+
+        Returns: 影响的行数
+        """
+        orm_table = orm_table or self.orm_table
+        if not items:
+            return 0
+        rowcount = await update_rows_by_pk(
+            session, orm_table.__table__, items, chunk_size=chunk_size, use_case=use_case
+        )
+        await _invalidate_entities(session, orm_table, [item["id"] for item in items])
+        return rowcount
+
     @with_session
     async def update_or_add(
             self,
@@ -793,11 +1672,65 @@ class BaseManager(metaclass=SingletonMetaCls):
         if isinstance(table_obj, dict):
             table_obj = orm_table(**table_obj)
 
-        return await session.merge(table_obj, **kwargs)
+        ret = await session.merge(table_obj, **kwargs)
+        if ret.id is not None:
+            await _invalidate_entities(session, orm_table, [ret.id])
+        return ret
+
+    @with_session
+    async def bulk_upsert(
+            self,
+            table_objs: List[Union[T_BaseOrmTable, dict]],
+            *,
+            orm_table: Type[BaseOrmTable] = None,
+            conflict_keys: List[str] = None,
+            update_columns: List[str] = None,
+            chunk_size: int = 500,
+            session: AsyncSession = None,
+    ) -> dict:
+        """
+        批量新增或更新, 替代逐行 merge(每行一次 SELECT + 一次 INSERT/UPDATE)
+        Args:
+            table_objs: 映射类实例对象 or dict 列表
+            orm_table: ORM表映射类
+            conflict_keys: 冲突键, 默认主键; MySQL 的 ON DUPLICATE KEY 由表上任意唯一索引触发,
+                冲突键需与对应的唯一索引一致, 用于统计新增/更新行数
+            update_columns: 冲突时更新的列, 默认传入的全部列(排除冲突键、主键与 created_at/created_by)
+            chunk_size: 每批行数
+            session: 数据库会话对象，如果为 None，则在方法内部开启新的事务
+
+        Examples:
+            ret = await TestCaseManager().bulk_upsert(cases, conflict_keys=["id"], update_columns=["name", "url"])
+            ret => {"inserted": 10, "updated": 90}
+
+        Returns: {"inserted": 新增行数, "updated": 更新行数}
+        """
+        orm_table = orm_table or self.orm_table
+        table = orm_table.__table__
+        rows = normalize_rows(table, table_objs)
+        if not rows:
+            return {"inserted": 0, "updated": 0}
+
+        conflict_keys = conflict_keys or [col.key for col in table.primary_key.columns]
+        if update_columns is None:
+            excluded = {*conflict_keys, *(col.key for col in table.primary_key.columns), "created_at", "created_by"}
+            update_columns = [key for key in rows[0] if key not in excluded]
+        stats = await upsert_rows(
+            session, table, rows, conflict_keys=conflict_keys, update_columns=update_columns, chunk_size=chunk_size
+        )
+        pk_ids = [row.get("id") for row in rows]
+        await _invalidate_entities(session, orm_table, None if None in pk_ids else pk_ids)
+        return stats
 
     @with_session
     async def run_sql(
-            self, sql: str, *, params: dict = None, query_one: bool = False, session: AsyncSession = None
+            self,
+            sql: str,
+            *,
+            params: dict = None,
+            query_one: bool = False,
+            timeout: float = None,
+            session: AsyncSession = None,
     ) -> Union[dict, List[dict]]:
         """
         执行并提交单条sql
@@ -805,14 +1738,72 @@ class BaseManager(metaclass=SingletonMetaCls):
             sql: sql语句
             params: sql参数, eg. {":id_val": 10, ":name_val": "hui"}
             query_one: 是否查询单条，默认False查询多条
+            timeout: 语句超时秒数, 超时终止语句并抛出 TimeoutError
             session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
 
         Returns:
             执行sql的结果
         """
         sql = text(sql)
-        cursor_result = await session.execute(sql, params)
+        deadline = await StatementTimeout.start(session, timeout)
+        cursor_result = await deadline.run(session.execute(sql, params))
         if query_one:
             return cursor_result.mappings().one() or {}
         else:
             return cursor_result.mappings().all() or []
+
+    @with_session
+    async def run_sql_many(
+            self, sql: str, params_list: List[dict], *, timeout: float = None, session: AsyncSession = None
+    ) -> int:
+        """
+        同一条sql按多组参数批量执行(executemany), 一次提交
+        Args:
+            sql: sql语句, eg. "update alden_report set status = :status where id = :id"
+            params_list: 多组sql参数, eg. [{"status": 3, "id": 1}, {"status": 3, "id": 2}]
+            timeout: 语句超时秒数, 超时终止语句并抛出 TimeoutError
+            session: 数据库会话对象，如果为 None，则通过装饰器在方法内部开启新的事务
+
+        Notes:
+            驱动层 executemany 一次往返发送全部参数(aiomysql 会把 INSERT ... VALUES 改写成多行插入),
+            替代循环调用 run_sql; 参数组很多时由调用方分批, 避免超过 max_allowed_packet
+
+        Returns: 影响的行数
+        """
+        if not params_list:
+            return 0
+        deadline = await StatementTimeout.start(session, timeout)
+        conn = await session.connection()
+        cursor_result = await deadline.run(conn.execute(text(sql), params_list))
+        return cursor_result.rowcount
+
+    async def stream_sql(
+            self,
+            sql: str,
+            *,
+            params: dict = None,
+            batch_size: int = 1000,
+            timeout: float = None,
+            session: AsyncSession = None,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        流式执行查询sql, 基于服务端游标按批返回
+        Args:
+            sql: sql语句
+            params: sql参数, eg. {":id_val": 10, ":name_val": "hui"}
+            batch_size: 每批行数
+            timeout: 执行语句以及拉取每一批结果的超时秒数, 超时终止语句并抛出 TimeoutError
+            session: 数据库会话对象，如果为 None，则在方法内部开启新的事务, 迭代结束或提前退出时关闭
+
+        Returns: 异步迭代器, 每次返回一批 RowMapping
+        """
+        async with stream_session(self, "stream_sql", session) as stream_db:
+            deadline = await StatementTimeout.start(stream_db, timeout)
+            stream_result = await deadline.run(
+                stream_db.stream(text(sql).execution_options(yield_per=batch_size), params)
+            )
+            try:
+                async for batch in deadline.iterate(stream_result.mappings().partitions(batch_size)):
+                    yield batch
+            finally:
+                await stream_result.close()
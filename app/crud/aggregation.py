@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/1 20:40
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import re
+from typing import Any, Dict, Tuple
+
+from sqlalchemy import ColumnElement, distinct, func
+
+# 指标写法 "字段__聚合函数", 与过滤参数的 "字段__操作符" 一致
+# eg: "success_count__sum"、"executor__count_distinct"、"cost__p95", 单独的 "count" 表示 count(*)
+AGGREGATE_FUNCS = {
+    "count": func.count,
+    "count_distinct": lambda column: func.count(distinct(column)),
+    "sum": func.sum,
+    "avg": func.avg,
+    "min": func.min,
+    "max": func.max,
+}
+
+# 百分位 p50/p95/p99.9, 需要数据库支持有序集合聚合 percentile_cont ... WITHIN GROUP
+PERCENTILE_PATTERN = re.compile(r"^p(\d{1,2}(?:\.\d+)?)$")
+PERCENTILE_DIALECTS = {"postgresql", "oracle"}
+
+# 分组的时间粒度写法 "字段__粒度", eg: "created_at__day"
+TIME_BUCKET_FORMATS: Dict[str, Dict[str, str]] = {
+    "mysql": {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"},
+    "sqlite": {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"},
+    "postgresql": {"hour": "YYYY-MM-DD HH24:00", "day": "YYYY-MM-DD", "month": "YYYY-MM", "year": "YYYY"},
+}
+
+
+def _table_column(orm_table, name: str):
+    if name not in orm_table.__table__.columns:
+        raise ValueError(f"Invalid column name: {name}")
+    return getattr(orm_table, name)
+
+
+def _time_bucket(column, unit: str, dialect_name: str) -> ColumnElement:
+    formats = TIME_BUCKET_FORMATS.get(dialect_name)
+    if formats is None:
+        raise ValueError(f"time bucket is not supported on dialect {dialect_name}")
+    fmt = formats[unit]
+    if dialect_name == "mysql":
+        return func.date_format(column, fmt)
+    if dialect_name == "sqlite":
+        return func.strftime(fmt, column)
+    return func.to_char(column, fmt)
+
+
+def group_expression(orm_table, spec: str, dialect_name: str) -> ColumnElement:
+    """
+    分组列, 结果列名为 spec 本身
+    Args:
+        orm_table: orm表映射类
+        spec: 字段名, 或 "字段__hour/day/month/year" 按时间粒度分组(结果为格式化后的字符串)
+        dialect_name: 数据库方言名
+    """
+    if "__" in spec:
+        field_name, unit = spec.rsplit("__", 1)
+        formats = TIME_BUCKET_FORMATS["mysql"]
+        if unit not in formats:
+            raise ValueError(f"Invalid group by: {spec}, time bucket must be one of {list(formats)}")
+        expression = _time_bucket(_table_column(orm_table, field_name), unit, dialect_name)
+    else:
+        expression = _table_column(orm_table, spec)
+    return expression.label(spec)
+
+
+def metric_expression(orm_table, alias: str, spec: str, dialect_name: str) -> ColumnElement:
+    """
+    聚合指标, 结果列名为 alias
+    Args:
+        orm_table: orm表映射类
+        alias: 结果列名
+        spec: "count" 或 "字段__count/count_distinct/sum/avg/min/max/p<百分位>"
+        dialect_name: 数据库方言名
+    """
+    if spec == "count":
+        return func.count().label(alias)
+    if "__" not in spec:
+        raise ValueError(f"Invalid metric: {spec}, expected <field>__<func>")
+
+    field_name, op = spec.rsplit("__", 1)
+    column = _table_column(orm_table, field_name)
+    if op in AGGREGATE_FUNCS:
+        return AGGREGATE_FUNCS[op](column).label(alias)
+
+    matched = PERCENTILE_PATTERN.match(op)
+    if matched is None:
+        raise ValueError(f"Invalid metric: {spec}, func must be one of {list(AGGREGATE_FUNCS)} or p<0-100>")
+    if dialect_name not in PERCENTILE_DIALECTS:
+        raise ValueError(f"percentile metric {spec} is not supported on dialect {dialect_name}")
+    fraction = float(matched.group(1)) / 100
+    return func.percentile_cont(fraction).within_group(column.asc()).label(alias)
+
+
+def freeze_metrics(metrics: Dict[str, str]) -> Tuple[Tuple[str, Any], ...]:
+    """ 指标定义转 tuple, 用作缓存键 """
+    return tuple(metrics.items())
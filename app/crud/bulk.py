@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/23 21:30
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Sequence, Union
+
+from sqlalchemy import Table, bindparam, case, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 批量写入时统一填充的时间戳列
+TIMESTAMP_COLUMNS = ("created_at", "updated_at")
+
+
+def chunked(rows: Sequence, chunk_size: int) -> Iterator[Sequence]:
+    """ 按 chunk_size 切分 """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be greater than 0")
+    for idx in range(0, len(rows), chunk_size):
+        yield rows[idx: idx + chunk_size]
+
+
+def _column_default(col) -> Any:
+    default = col.default
+    if default is None:
+        return None
+    if default.is_callable:
+        # SQLAlchemy 把 default=datetime.now 包装成接收 context 的函数
+        return default.arg(None)
+    if default.is_scalar:
+        return default.arg
+    return None
+
+
+def normalize_rows(table: Table, rows: List[Union[dict, Any]], now: datetime = None) -> List[dict]:
+    """
+    把 dict / orm实例 统一成列名一致的参数字典, 用于 executemany
+    Notes:
+        created_at/updated_at 未传时整批使用同一个时间;
+        其他缺失列使用列上的 Python 默认值, 没有默认值则为 None
+    """
+    now = now or datetime.now()
+    params = [dict(row) if isinstance(row, dict) else row.to_dict() for row in rows]
+    for name in TIMESTAMP_COLUMNS:
+        if name in table.c:
+            for param in params:
+                if param.get(name) is None:
+                    param[name] = now
+
+    keys = [col.key for col in table.columns if any(col.key in param for param in params)]
+    for key in keys:
+        missing = [param for param in params if key not in param]
+        if missing:
+            value = _column_default(table.c[key])
+            for param in missing:
+                param[key] = value
+    return params
+
+
+async def insert_rows(
+        session: AsyncSession,
+        table: Table,
+        rows: List[dict],
+        *,
+        chunk_size: int = 1000,
+        return_ids: bool = False,
+) -> Union[int, List[int]]:
+    """
+    Core 批量插入, 不创建 orm 实例也不进入 identity map
+    Args:
+        session: 数据库会话对象
+        table: Table 对象
+        rows: normalize_rows 处理后的参数列表
+        chunk_size: 每批行数, 每批一次 executemany(aiomysql 会改写为多行 INSERT ... VALUES)
+        return_ids: 是否返回生成的主键
+
+    Notes:
+        返回主键时: 支持 executemany RETURNING 的方言(SQLite/PostgreSQL/MariaDB)按参数顺序返回;
+        MySQL 每批使用一条多行 INSERT, 主键为 LAST_INSERT_ID() 起连续的 N 个值,
+        行数已知的 simple insert 在任意 innodb_autoinc_lock_mode 下都分配连续的自增值;
+        一批中既有指定主键又有未指定主键的行时, 按原顺序拆成连续的同类子批分别插入
+
+    Returns: 插入行数 or 主键列表
+    """
+    if not return_ids:
+        for chunk in chunked(rows, chunk_size):
+            await session.execute(insert(table), chunk)
+        return len(rows)
+
+    conn = await session.connection()
+    dialect = conn.dialect
+    pk_col = table.primary_key.columns.values()[0]
+    ids = []
+    for chunk in chunked(rows, chunk_size):
+        for has_pk, group in groupby(chunk, key=lambda row: row.get(pk_col.key) is not None):
+            group = list(group)
+            if has_pk:
+                await session.execute(insert(table), group)
+                ids.extend(row[pk_col.key] for row in group)
+                continue
+            # 主键由数据库生成, 不传主键列
+            group = [{key: value for key, value in row.items() if key != pk_col.key} for row in group]
+            if getattr(dialect, "insert_executemany_returning_sort_by_parameter_order", False):
+                cursor_result = await session.execute(
+                    insert(table).returning(pk_col, sort_by_parameter_order=True), group
+                )
+                ids.extend(cursor_result.scalars().all())
+            elif dialect.name == "mysql":
+                cursor_result = await session.execute(insert(table).values(group))
+                first_id = cursor_result.lastrowid
+                ids.extend(range(first_id, first_id + len(group)))
+            else:
+                for row in group:
+                    cursor_result = await session.execute(insert(table).values(**row))
+                    ids.append(cursor_result.inserted_primary_key[0])
+    return ids
+
+
+def _row_key(row: dict, conflict_keys: Sequence[str]) -> tuple:
+    return tuple(row.get(key) for key in conflict_keys)
+
+
+def _has_null_key(key: tuple) -> bool:
+    """ 冲突键含 NULL 时不会与任何已有行冲突(NULL 不等于 NULL), 只能新增 """
+    return any(value is None for value in key)
+
+
+def _without_null_pk(table: Table, row: dict) -> dict:
+    """ 去掉值为 None 的主键列, 由数据库生成主键 """
+    pk_keys = {col.key for col in table.primary_key.columns}
+    return {key: value for key, value in row.items() if not (key in pk_keys and value is None)}
+
+
+async def _insert_grouped(session: AsyncSession, table: Table, rows: List[dict]):
+    """ 按列集合分组 executemany, 去掉空主键后各行的列可能不同 """
+    groups: Dict[tuple, List[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    for group in groups.values():
+        await session.execute(insert(table), group)
+
+
+async def _existing_keys(
+        session: AsyncSession, table: Table, conflict_keys: Sequence[str], rows: Sequence[dict]
+) -> set:
+    """ 一次查询出本批中已存在的冲突键 """
+    conflict_cols = [table.c[key] for key in conflict_keys]
+    keys = {key for row in rows if not _has_null_key(key := _row_key(row, conflict_keys))}
+    if not keys:
+        return set()
+    if len(conflict_cols) == 1:
+        cond = conflict_cols[0].in_([key[0] for key in keys])
+    else:
+        cond = tuple_(*conflict_cols).in_(list(keys))
+    cursor_result = await session.execute(select(*conflict_cols).where(cond))
+    return {tuple(row) for row in cursor_result.all()}
+
+
+def _native_upsert(dialect_name: str, table: Table, rows: List[dict], conflict_keys: Sequence[str],
+                   update_columns: Sequence[str]):
+    """ 方言原生 upsert 语句, 不支持的方言返回 None """
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        stmt = mysql_insert(table).values(rows)
+        # 没有需要更新的列时, 用冲突键自赋值实现 "存在即忽略"
+        set_columns = update_columns or conflict_keys[:1]
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in set_columns})
+
+    if dialect_name in ("postgresql", "sqlite"):
+        if dialect_name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        # ON CONFLICT 不允许同一条语句内重复命中同一行, 同键保留最后一条
+        rows = list({_row_key(row, conflict_keys): row for row in rows}.values())
+        stmt = dialect_insert(table).values(rows)
+        if not update_columns:
+            return stmt.on_conflict_do_nothing(index_elements=list(conflict_keys))
+        return stmt.on_conflict_do_update(
+            index_elements=list(conflict_keys), set_={name: stmt.excluded[name] for name in update_columns}
+        )
+    return None
+
+
+async def upsert_rows(
+        session: AsyncSession,
+        table: Table,
+        rows: List[dict],
+        *,
+        conflict_keys: Sequence[str],
+        update_columns: Sequence[str],
+        chunk_size: int = 500,
+) -> Dict[str, int]:
+    """
+    批量 upsert
+    Args:
+        session: 数据库会话对象
+        table: Table 对象
+        rows: normalize_rows 处理后的参数列表
+        conflict_keys: 冲突键(主键或唯一索引列)
+        update_columns: 冲突时更新的列
+        chunk_size: 每批行数
+
+    Notes:
+        每批先查询一次已存在的冲突键用于统计新增/更新行数, 再执行一条
+        MySQL INSERT ... ON DUPLICATE KEY UPDATE / PostgreSQL、SQLite INSERT ... ON CONFLICT;
+        其他方言拆成 INSERT 与按冲突键 UPDATE 两次 executemany.
+        冲突键含 None 的行(如未指定主键的新行)不参与去重和冲突判断, 总是新增.
+        每批固定 2~3 次往返, 与行数无关
+
+    Returns: {"inserted": 新增行数, "updated": 更新行数}
+    """
+    dialect_name = (await session.connection()).dialect.name
+    stats = {"inserted": 0, "updated": 0}
+    for chunk in chunked(rows, chunk_size):
+        seen = await _existing_keys(session, table, conflict_keys, chunk)
+        keyed, to_insert, to_update, null_key_rows = [], [], [], []
+        for row in chunk:
+            key = _row_key(row, conflict_keys)
+            if _has_null_key(key):
+                null_key_rows.append(_without_null_pk(table, row))
+                continue
+            keyed.append(row)
+            if key in seen:
+                to_update.append(row)
+            else:
+                to_insert.append(row)
+                seen.add(key)
+        stats["inserted"] += len(to_insert) + len(null_key_rows)
+        stats["updated"] += len(to_update)
+
+        if null_key_rows:
+            await _insert_grouped(session, table, null_key_rows)
+        if not keyed:
+            continue
+
+        stmt = _native_upsert(dialect_name, table, keyed, conflict_keys, update_columns)
+        if stmt is not None:
+            await session.execute(stmt)
+            continue
+
+        if to_insert:
+            await _insert_grouped(session, table, [_without_null_pk(table, row) for row in to_insert])
+        if to_update and update_columns:
+            update_stmt = (
+                update(table)
+                .where(*[table.c[key] == bindparam(f"b_{key}") for key in conflict_keys])
+                .values({name: bindparam(name) for name in update_columns})
+            )
+            await session.execute(
+                update_stmt,
+                [{**{name: row[name] for name in update_columns},
+                  **{f"b_{key}": row[key] for key in conflict_keys}} for row in to_update],
+            )
+    return stats
+
+
+async def update_rows_by_pk(
+        session: AsyncSession,
+        table: Table,
+        items: List[dict],
+        *,
+        chunk_size: int = 500,
+        use_case: bool = False,
+) -> int:
+    """
+    按主键批量更新, 每行更新的字段可以不同
+    Args:
+        session: 数据库会话对象
+        table: Table 对象
+        items: [{主键: 1, 字段: 值, ...}, ...]
+        chunk_size: 每批行数
+        use_case: False 按更新字段分组后 executemany;
+            True 每批一条 UPDATE ... SET col = CASE id WHEN ... END WHERE id IN (...)
+
+    Returns: 影响的行数
+    """
+    pk_col = table.primary_key.columns.values()[0]
+    pk_key = pk_col.key
+    for item in items:
+        if item.get(pk_key) is None:
+            raise ValueError(f"bulk update item missing primary key <{pk_key}>: {item}")
+
+    rowcount = 0
+    if use_case:
+        for chunk in chunked(items, chunk_size):
+            columns = [col.key for col in table.columns if col.key != pk_key and any(col.key in item for item in chunk)]
+            if not columns:
+                continue
+            values = {
+                name: case(
+                    {item[pk_key]: item[name] for item in chunk if name in item}, value=pk_col, else_=table.c[name]
+                )
+                for name in columns
+            }
+            cursor_result = await session.execute(
+                update(table).where(pk_col.in_([item[pk_key] for item in chunk])).values(values)
+            )
+            rowcount += cursor_result.rowcount
+        return rowcount
+
+    groups: Dict[tuple, List[dict]] = {}
+    for item in items:
+        columns = tuple(sorted(key for key in item if key != pk_key))
+        if columns:
+            groups.setdefault(columns, []).append(item)
+
+    for columns, group in groups.items():
+        update_stmt = update(table).where(pk_col == bindparam(f"b_{pk_key}")).values(
+            {name: bindparam(name) for name in columns}
+        )
+        for chunk in chunked(group, chunk_size):
+            params = [{**{name: item[name] for name in columns}, f"b_{pk_key}": item[pk_key]} for item in chunk]
+            cursor_result = await session.execute(update_stmt, params)
+            rowcount += cursor_result.rowcount
+    return rowcount
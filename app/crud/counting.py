@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/21 16:40
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import hashlib
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Union
+
+from loguru import logger
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class TotalCount(int):
+    """
+    分页总数
+    Notes:
+        本身是 int, 可直接参与计算与序列化; capped/estimated 标记非精确结果
+    """
+
+    capped: bool = False
+    estimated: bool = False
+
+    def __new__(cls, value: int, *, capped: bool = False, estimated: bool = False):
+        obj = super().__new__(cls, value)
+        obj.capped = capped
+        obj.estimated = estimated
+        return obj
+
+    @property
+    def exact(self) -> bool:
+        return not (self.capped or self.estimated)
+
+    @property
+    def display(self) -> str:
+        """ 前端展示文案, e.g. 1000+ / ~12000 / 35 """
+        if self.capped:
+            return f"{int(self)}+"
+        if self.estimated:
+            return f"~{int(self)}"
+        return str(int(self))
+
+
+def _count_stmt(orm_table, conds: list):
+    return select(func.count()).select_from(orm_table).where(*conds)
+
+
+class CountStrategy:
+    """ 分页总数统计策略基类 """
+
+    # 为 True 时总数通过 COUNT(*) OVER() 与分页数据在同一条语句中返回
+    single_round_trip: bool = False
+
+    async def count(self, orm_table, conds: list, session: AsyncSession) -> TotalCount:
+        raise NotImplementedError
+
+
+class ExactCount(CountStrategy):
+    """ 精确总数: SELECT COUNT(*) ... WHERE ... """
+
+    async def count(self, orm_table, conds: list, session: AsyncSession) -> TotalCount:
+        cursor_result = await session.execute(_count_stmt(orm_table, conds))
+        return TotalCount(cursor_result.scalar_one())
+
+
+class CappedCount(CountStrategy):
+    """
+    封顶总数: 最多扫描 cap + 1 行, 超过 cap 时返回 cap 并标记 capped (展示为 "1000+")
+    """
+
+    def __init__(self, cap: int = 1000):
+        self.cap = cap
+
+    async def count(self, orm_table, conds: list, session: AsyncSession) -> TotalCount:
+        limited = select(literal_column("1")).select_from(orm_table).where(*conds).limit(self.cap + 1).subquery()
+        cursor_result = await session.execute(select(func.count()).select_from(limited))
+        total = cursor_result.scalar_one()
+        if total > self.cap:
+            return TotalCount(self.cap, capped=True)
+        return TotalCount(total)
+
+
+class EstimatedCount(CountStrategy):
+    """
+    估算总数(仅 MySQL)
+    Notes:
+        无过滤条件时读取 information_schema.TABLES.TABLE_ROWS,
+        有过滤条件时读取 EXPLAIN 的 rows * filtered 估算值;
+        估算值小于 exact_below 时改为精确统计, 非 MySQL 方言同样回退为精确统计
+    """
+
+    def __init__(self, exact_below: int = 1000):
+        self.exact_below = exact_below
+        self._exact = ExactCount()
+
+    async def _estimate(self, orm_table, conds: list, session: AsyncSession) -> int:
+        conn = await session.connection()
+        if not conds:
+            cursor_result = await conn.execute(
+                text(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name"
+                ),
+                {"table_name": orm_table.__tablename__},
+            )
+            return int(cursor_result.scalar_one() or 0)
+
+        stmt = select(literal_column("1")).select_from(orm_table).where(*conds)
+        sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+        cursor_result = await conn.exec_driver_sql(f"EXPLAIN {sql}")
+        plan = cursor_result.mappings().first()
+        rows, filtered = plan.get("rows") or 0, plan.get("filtered") or 100
+        return int(rows * float(filtered) / 100)
+
+    async def count(self, orm_table, conds: list, session: AsyncSession) -> TotalCount:
+        conn = await session.connection()
+        if conn.dialect.name != "mysql":
+            return await self._exact.count(orm_table, conds, session)
+
+        try:
+            estimate = await self._estimate(orm_table, conds, session)
+        except Exception as e:
+            # 条件无法渲染成字面量等情况, 直接走精确统计
+            logger.warning(f"估算 {orm_table.__tablename__} 总数失败, 改为精确统计: {e}")
+            return await self._exact.count(orm_table, conds, session)
+
+        if estimate < self.exact_below:
+            return await self._exact.count(orm_table, conds, session)
+        return TotalCount(estimate, estimated=True)
+
+
+class CachedCount(CountStrategy):
+    """
+    缓存总数: 以 (表, 过滤条件) 的指纹为键缓存内层策略的统计结果, ttl 秒后过期, LRU 淘汰
+    Notes:
+        每张表一个版本号, 缓存条目记录统计时的版本; BaseManager 的写操作通过 invalidate_cached_counts
+        递增该表的版本, 写入后的分页立即重新统计. 未经过 BaseManager 的写入(run_sql、其他进程)仍要等 ttl 过期
+    """
+
+    # 所有实例, 写操作时统一失效, 包括直接传给 list_page 的自定义实例
+    instances: "weakref.WeakSet[CachedCount]" = weakref.WeakSet()
+
+    def __init__(self, ttl: float = 60, maxsize: int = 1024, inner: CountStrategy = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.inner = inner or ExactCount()
+        self._cache: "OrderedDict[str, tuple[float, int, TotalCount]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        CachedCount.instances.add(self)
+
+    @staticmethod
+    def fingerprint(orm_table, conds: list) -> str:
+        compiled = _count_stmt(orm_table, conds).compile()
+        raw = f"{compiled.string}|{sorted(compiled.params.items(), key=lambda item: item[0])!r}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def invalidate(self, orm_table=None):
+        """ 失效表的全部缓存总数, 不传表时清空 """
+        if orm_table is None:
+            self._cache.clear()
+            return
+        table_name = orm_table.__tablename__
+        self._versions[table_name] = self._versions.get(table_name, 0) + 1
+
+    async def count(self, orm_table, conds: list, session: AsyncSession) -> TotalCount:
+        key = self.fingerprint(orm_table, conds)
+        version = self._versions.get(orm_table.__tablename__, 0)
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached and cached[0] > now and cached[1] == version:
+            self._cache.move_to_end(key)
+            return cached[2]
+
+        total = await self.inner.count(orm_table, conds, session)
+        # 统计期间发生的写入会递增版本, 带着统计前的版本写入, 下次读取直接作废
+        self._cache[key] = (now + self.ttl, version, total)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return total
+
+
+def invalidate_cached_counts(orm_table):
+    """ 表有写入时失效所有 CachedCount 中该表的缓存总数 """
+    for strategy in list(CachedCount.instances):
+        strategy.invalidate(orm_table)
+
+
+class WindowCount(ExactCount):
+    """
+    单次往返: 分页查询附带 COUNT(*) OVER(), 一条语句同时返回分页数据与总数(MySQL 8+)
+    Notes:
+        页码越界查不到数据时, 退化为精确统计
+    """
+
+    single_round_trip = True
+    label = "__total_count"
+
+    def column(self):
+        return func.count().over().label(self.label)
+
+
+COUNT_STRATEGIES: Dict[str, CountStrategy] = {
+    "exact": ExactCount(),
+    "capped": CappedCount(),
+    "estimated": EstimatedCount(),
+    "cached": CachedCount(),
+    "window": WindowCount(),
+}
+
+
+def register_count_strategy(name: str, strategy: CountStrategy):
+    """ 注册自定义总数统计策略, list_page(count_strategy=name) 即可使用 """
+    COUNT_STRATEGIES[name] = strategy
+
+
+def get_count_strategy(strategy: Union[str, CountStrategy, Any]) -> CountStrategy:
+    if isinstance(strategy, CountStrategy):
+        return strategy
+    try:
+        return COUNT_STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError(f"Unsupported count strategy: {strategy}, options: {list(COUNT_STRATEGIES)}")
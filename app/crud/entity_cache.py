@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/24 22:05
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import orjson
+from loguru import logger
+from sqlalchemy import Date, DateTime
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+
+from config import Settings
+
+
+def pk_ids_from_conds(orm_table, conds: Optional[list]) -> Optional[list]:
+    """
+    从 [orm_table.id == 1] / [orm_table.id.in_([1, 2])] 这类条件中解析主键id
+    Returns: 主键id列表, 无法解析时返回 None(调用方按整表失效处理)
+    """
+    if not conds or len(conds) != 1 or not isinstance(conds[0], BinaryExpression):
+        return None
+    cond = conds[0]
+    if getattr(cond.left, "key", None) != "id" or getattr(cond.left, "table", None) is not orm_table.__table__:
+        return None
+    if not isinstance(cond.right, BindParameter):
+        return None
+    if cond.operator is operators.eq:
+        return [cond.right.value]
+    if cond.operator is operators.in_op:
+        return list(cond.right.value)
+    return None
+
+
+class EntityCache:
+    """
+    主键查询的两级缓存
+    Notes:
+        一级: 进程内 LRU + TTL; 二级: Redis(可选, bind_redis 后启用)
+        整表失效通过表版本号实现: 写操作条件无法解析出主键时版本号 +1, 旧版本的缓存全部作废;
+        按主键失效时删除缓存并递增该主键的代数, Redis 中表版本号、实体与代数一次 MGET 读取, 不额外增加往返;
+        回填的条目带着查库前读到的版本号与代数, 查库期间发生的失效会让回填的条目直接作废, 不会写回旧数据.
+        一级缓存只感知本进程的写操作, 其他 worker 的写入最多延迟 local_ttl 秒可见;
+        缓存的是整行数据, 不要为含密码等敏感列的表开启
+    """
+
+    # 进程内按主键失效的记录保留秒数, 超过该时长仍未完成的查库不再检查是否被失效
+    invalidation_window = 60
+
+    key_prefix = "alden:entity"
+
+    def __init__(self, local_maxsize: int = 4096, local_ttl: float = 5, redis_ttl: int = 300):
+        self.local_maxsize = local_maxsize
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.redis = None
+        self._models: Dict[str, Optional[float]] = {}
+        self._local: "OrderedDict[str, tuple[float, int, dict]]" = OrderedDict()
+        self._local_versions: Dict[str, int] = {}
+        # 按主键失效的序号: 键 -> (序号, 失效时间), 用于判断查库期间是否被失效
+        self._invalidation_seq = 0
+        self._invalidated: "OrderedDict[str, tuple[int, float]]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def bind_redis(self, redis_client: Any):
+        """ 绑定 redis.asyncio.Redis 客户端(或接口兼容的内存实现), None 则只使用进程内缓存 """
+        self.redis = redis_client
+
+    def register(self, orm_table, ttl: float = None):
+        """ 按模型开启缓存, ttl 为二级缓存过期秒数, 默认 redis_ttl """
+        self._models[orm_table.__tablename__] = ttl
+        self._stats.setdefault(orm_table.__tablename__, {"local_hits": 0, "redis_hits": 0, "misses": 0})
+
+    def enabled_for(self, orm_table) -> bool:
+        return orm_table is not None and orm_table.__tablename__ in self._models
+
+    def _entity_key(self, table_name: str, pk_id: Any) -> str:
+        return f"{self.key_prefix}:{table_name}:{pk_id}"
+
+    def _version_key(self, table_name: str) -> str:
+        return f"{self.key_prefix}:{table_name}:version"
+
+    @staticmethod
+    def _gen_key(entity_key: str) -> str:
+        return f"{entity_key}:gen"
+
+    @staticmethod
+    def _dump(orm_obj) -> dict:
+        return orm_obj.to_dict(exclude_none=False)
+
+    @staticmethod
+    def _load(orm_table, data: dict):
+        """ 还原成 detached 状态的 orm 实例, 与会话关闭后 session.get 返回的对象一致 """
+        for col in orm_table.__table__.columns:
+            value = data.get(col.key)
+            if isinstance(value, str):
+                if isinstance(col.type, DateTime):
+                    data[col.key] = datetime.fromisoformat(value)
+                elif isinstance(col.type, Date):
+                    data[col.key] = date.fromisoformat(value)
+        orm_obj = orm_table(**data)
+        make_transient_to_detached(orm_obj)
+        return orm_obj
+
+    def _set_local(self, key: str, version: int, data: dict):
+        self._local[key] = (time.monotonic() + self.local_ttl, version, data)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_maxsize:
+            self._local.popitem(last=False)
+
+    async def get_or_load(self, orm_table, pk_id: Any, loader: Callable[[], Awaitable[Any]]):
+        """
+        读缓存, 未命中时调用 loader 查库并回填
+        Args:
+            orm_table: orm表映射类
+            pk_id: 主键id
+            loader: 查库函数
+
+        Returns: orm实例 or None
+        """
+        table_name = orm_table.__tablename__
+        stats = self._stats[table_name]
+        key = self._entity_key(table_name, pk_id)
+        local_version = self._local_versions.get(table_name, 0)
+
+        cached = self._local.get(key)
+        if cached and cached[0] > time.monotonic() and cached[1] == local_version:
+            self._local.move_to_end(key)
+            stats["local_hits"] += 1
+            return self._load(orm_table, dict(cached[2]))
+
+        # 查库前的失效序号与版本, 回填前据此判断查库期间是否被失效
+        seq_before = self._invalidation_seq
+        redis_versions = None
+        if self.redis is not None:
+            try:
+                raw_version, raw, raw_gen = await self.redis.mget(
+                    self._version_key(table_name), key, self._gen_key(key)
+                )
+                redis_versions = (int(raw_version or 0), int(raw_gen or 0))
+                if raw:
+                    payload = orjson.loads(raw)
+                    if (payload["v"], payload.get("g", 0)) == redis_versions:
+                        stats["redis_hits"] += 1
+                        self._set_local(key, local_version, payload["d"])
+                        return self._load(orm_table, dict(payload["d"]))
+            except Exception as e:
+                logger.warning(f"读取实体缓存 {key} 失败: {e}")
+
+        stats["misses"] += 1
+        orm_obj = await loader()
+        if orm_obj is None:
+            return None
+        if self._invalidated_since(key, seq_before):
+            return orm_obj
+
+        data = self._dump(orm_obj)
+        self._set_local(key, local_version, data)
+        # 读取 redis 失败时不回填, 避免写入版本未知的条目
+        if redis_versions is not None:
+            try:
+                ttl = self._models.get(table_name) or self.redis_ttl
+                payload = {"v": redis_versions[0], "g": redis_versions[1], "d": data}
+                await self.redis.set(key, orjson.dumps(payload), ex=int(ttl))
+            except Exception as e:
+                logger.warning(f"写入实体缓存 {key} 失败: {e}")
+        return orm_obj
+
+    def _invalidated_since(self, key: str, seq: int) -> bool:
+        invalidated = self._invalidated.get(key)
+        return invalidated is not None and invalidated[0] > seq
+
+    def _mark_invalidated(self, keys: List[str]):
+        now = time.monotonic()
+        for key in keys:
+            self._invalidation_seq += 1
+            self._invalidated[key] = (self._invalidation_seq, now)
+            self._invalidated.move_to_end(key)
+        while self._invalidated and next(iter(self._invalidated.values()))[1] < now - self.invalidation_window:
+            self._invalidated.popitem(last=False)
+
+    async def invalidate(self, orm_table, pk_ids: Optional[List[Any]] = None):
+        """
+        失效缓存
+        Args:
+            orm_table: orm表映射类
+            pk_ids: 主键id列表, None 表示整表失效
+        """
+        if not self.enabled_for(orm_table):
+            return
+        table_name = orm_table.__tablename__
+        try:
+            if pk_ids is None:
+                self._local_versions[table_name] = self._local_versions.get(table_name, 0) + 1
+                if self.redis is not None:
+                    await self.redis.incr(self._version_key(table_name))
+                return
+
+            keys = [self._entity_key(table_name, pk_id) for pk_id in pk_ids]
+            for key in keys:
+                self._local.pop(key, None)
+            self._mark_invalidated(keys)
+            if self.redis is not None and keys:
+                # 代数的过期时间要长于实体, 否则代数归零后查库期间写回的旧条目会重新生效
+                gen_ttl = int(self._models.get(table_name) or self.redis_ttl) * 2 + self.invalidation_window
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(*keys)
+                    for key in keys:
+                        pipe.incr(self._gen_key(key))
+                        pipe.expire(self._gen_key(key), gen_ttl)
+                    await pipe.execute()
+        except Exception as e:
+            logger.warning(f"失效实体缓存 {table_name} 失败: {e}")
+
+    def clear_local(self):
+        self._local.clear()
+
+    def stats(self) -> dict:
+        """ 各模型的命中统计 """
+        ret = {}
+        for table_name, counter in self._stats.items():
+            total = sum(counter.values())
+            hits = counter["local_hits"] + counter["redis_hits"]
+            ret[table_name] = {**counter, "hit_ratio": round(hits / total, 4) if total else 0.0}
+        return ret
+
+
+entity_cache = EntityCache(
+    local_maxsize=Settings.ENTITY_CACHE_LOCAL_MAXSIZE,
+    local_ttl=Settings.ENTITY_CACHE_LOCAL_TTL,
+    redis_ttl=Settings.ENTITY_CACHE_REDIS_TTL,
+)
@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/31 20:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import hashlib
+import json
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import Table, func, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import (BinaryExpression, BindParameter, BooleanClauseList, ClauseList, Null,
+                                     UnaryExpression)
+
+from config import Settings
+
+EQ, RANGE = "eq", "range"
+
+# 过滤操作符 -> 索引中的用法; 不在表中的操作符(ne/not_in/contains/endswith/or ...)无法利用 B+ 树索引
+FILTER_KINDS = {
+    "eq": EQ, "is": EQ, "in": EQ,
+    "gt": RANGE, "lt": RANGE, "gte": RANGE, "lte": RANGE, "between": RANGE, "startswith": RANGE, "like": RANGE,
+}
+
+_SQL_OPERATORS = {
+    operators.eq: "eq", operators.is_: "is", operators.in_op: "in",
+    operators.gt: "gt", operators.lt: "lt", operators.ge: "gte", operators.le: "lte",
+    operators.between_op: "between", operators.startswith_op: "startswith", operators.like_op: "like",
+}
+
+# 没有统计信息时范围条件的选择率, 与多数优化器的默认值一致
+RANGE_SELECTIVITY = 0.3
+MAX_INDEX_COLUMNS = 5
+
+# (列名, 操作符, 样例值)
+Predicate = Tuple[str, str, Any]
+
+
+@dataclass
+class QueryPattern:
+    """ 一类查询: 参与过滤的列与操作符 + 排序 """
+    table: str
+    predicates: Tuple[Tuple[str, str], ...]
+    orders: Tuple[Tuple[str, bool], ...]
+    samples: Tuple[Any, ...]
+    unindexable: Tuple[str, ...] = ()
+    count: int = 0
+
+    def describe(self) -> str:
+        where = " AND ".join(f"{col} {op}" for col, op in self.predicates) or "-"
+        order = ", ".join(f"{col} {'desc' if is_desc else 'asc'}" for col, is_desc in self.orders) or "-"
+        return f"WHERE {where} ORDER BY {order}"
+
+
+@dataclass
+class IndexRecommendation:
+    table: str
+    columns: List[Tuple[str, bool]]
+    ddl: str
+    query_count: int
+    patterns: List[str]
+    current_access: Optional[str] = None
+    current_key: Optional[str] = None
+    current_rows: Optional[int] = None
+    uses_filesort: bool = False
+    estimated_rows: Optional[int] = None
+    rows_saved_per_query: int = 0
+    expected_gain: int = 0
+    notes: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {**self.__dict__, "columns": [f"{col} {'desc' if is_desc else 'asc'}" for col, is_desc in self.columns]}
+
+
+def _cond_predicates(table: Table, cond: Any, predicates: List[Predicate], unindexable: List[str]):
+    """ 从 where 条件表达式中解析出 (列, 操作符, 样例值), 只处理 AND 连接的单列比较 """
+    if isinstance(cond, BooleanClauseList) and cond.operator is operators.and_:
+        for clause in cond.clauses:
+            _cond_predicates(table, clause, predicates, unindexable)
+        return
+    if not isinstance(cond, BinaryExpression):
+        unindexable.append(str(cond.__class__.__name__))
+        return
+
+    key = getattr(cond.left, "key", None)
+    left_table = getattr(cond.left, "table", None)
+    if key not in table.c or (left_table is not None and left_table is not table):
+        unindexable.append(str(key))
+        return
+
+    op = _SQL_OPERATORS.get(cond.operator)
+    right = cond.right
+    if isinstance(right, BindParameter):
+        value = right.value
+    elif isinstance(right, Null):
+        value, op = None, "is" if op in ("eq", "is") else op
+    elif isinstance(right, ClauseList):
+        value = tuple(getattr(clause, "value", None) for clause in right.clauses)
+    else:
+        value = None
+    if op is None or (op == "like" and (not isinstance(value, str) or value.startswith(("%", "_")))):
+        unindexable.append(key)
+        return
+    predicates.append((key, op, value))
+
+
+def _order_keys(table: Table, orders: list) -> List[Tuple[str, bool]]:
+    keys = []
+    for order in orders or []:
+        is_desc = False
+        if isinstance(order, UnaryExpression):
+            is_desc = order.modifier is operators.desc_op
+            order = order.element
+        key = order if isinstance(order, str) else getattr(order, "key", None)
+        if key in table.c:
+            keys.append((key, is_desc))
+    return keys
+
+
+def _existing_indexes(sync_conn, table_name: str) -> List[Tuple[str, ...]]:
+    inspector = inspect(sync_conn)
+    indexes = [tuple(index["column_names"]) for index in inspector.get_indexes(table_name)]
+    indexes.extend(tuple(uc["column_names"]) for uc in inspector.get_unique_constraints(table_name))
+    pk = inspector.get_pk_constraint(table_name).get("constrained_columns")
+    if pk:
+        indexes.append(tuple(pk))
+    return indexes
+
+
+def _is_covered(columns: List[str], n_eq: int, existing: List[Tuple[str, ...]]) -> bool:
+    """ 已有索引前 n_eq 列与候选的等值列集合相同, 且后续列顺序一致 """
+    for index in existing:
+        if len(index) < len(columns):
+            continue
+        if set(index[:n_eq]) == set(columns[:n_eq]) and list(index[n_eq:len(columns)]) == columns[n_eq:]:
+            return True
+    return False
+
+
+class IndexAdvisor:
+    """
+    索引建议
+    Notes:
+        按 sample_rate 采样记录 BaseManager 查询中实际使用的过滤列、操作符与排序(查询模式);
+        analyze 时对每个模式构造代表语句执行 EXPLAIN, 按 等值列(区分度高的在前) -> 排序列 -> 范围列
+        生成候选联合索引, 去掉已有索引能覆盖的, 合并前缀相同的候选, 按 节省扫描行数 x 调用次数 排序.
+        调用次数为采样估算值; 结果仅供参考, 上线前请在从库或测试库验证执行计划
+    """
+
+    def __init__(self, sample_rate: float = 0.05, max_patterns: int = 2000):
+        self.sample_rate = sample_rate
+        self.max_patterns = max_patterns
+        self.tables: Dict[str, Table] = {}
+        self.patterns: Dict[tuple, QueryPattern] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def record_filters(self, orm_table, shape: tuple, params: dict, sort_columns=None, sort_orders=None):
+        """ 记录 field__op 形式的过滤(BaseManager._filter_shape 的结果) """
+        if orm_table is None or not self._sampled():
+            return
+        table = orm_table.__table__
+        predicates, unindexable = [], []
+        for key, spec in shape:
+            field_name, op = key.rsplit("__", 1) if "__" in key else (key, "eq")
+            if op == "or" or field_name not in table.c or op not in FILTER_KINDS:
+                unindexable.append(field_name)
+                continue
+            kind, arg = spec
+            if kind == "literal":
+                value, op = arg, "is" if arg is None else op
+            elif kind == "between":
+                value = (params.get(f"{arg}_0"), params.get(f"{arg}_1"))
+            else:
+                value = params.get(arg)
+            if op == "like" and (not isinstance(value, str) or value.startswith(("%", "_"))):
+                unindexable.append(field_name)
+                continue
+            predicates.append((field_name, op, value))
+
+        if isinstance(sort_columns, str):
+            sort_columns = [sort_columns]
+        if isinstance(sort_orders, str):
+            sort_orders = [sort_orders] * len(sort_columns or [])
+        orders = [
+            (name, bool(sort_orders) and sort_orders[idx] == "desc")
+            for idx, name in enumerate(sort_columns or []) if name in table.c
+        ]
+        self._record(table, predicates, orders, unindexable)
+
+    def record_conds(self, orm_table, conds: Optional[list], orders: Optional[list]):
+        """ 记录 where 条件表达式列表形式的查询(BaseManager._build_query) """
+        if orm_table is None or not self._sampled():
+            return
+        table = orm_table.__table__
+        predicates, unindexable = [], []
+        for cond in conds or []:
+            _cond_predicates(table, cond, predicates, unindexable)
+        self._record(table, predicates, _order_keys(table, orders), unindexable)
+
+    def _record(self, table: Table, predicates: List[Predicate], orders: List[Tuple[str, bool]],
+                unindexable: List[str]):
+        if not predicates and not orders:
+            return
+        predicates = sorted(predicates, key=lambda item: (item[0], item[1]))
+        key = (table.name, tuple((col, op) for col, op, _ in predicates), tuple(orders))
+        pattern = self.patterns.get(key)
+        if pattern is None:
+            if len(self.patterns) >= self.max_patterns:
+                return
+            pattern = self.patterns[key] = QueryPattern(
+                table=table.name, predicates=key[1], orders=key[2],
+                samples=tuple(value for _, _, value in predicates), unindexable=tuple(sorted(set(unindexable))),
+            )
+            self.tables[table.name] = table
+        pattern.count += 1
+
+    def reset(self):
+        self.patterns.clear()
+
+    @staticmethod
+    def _statement(table: Table, pattern: QueryPattern):
+        """ 用样例值构造代表语句 """
+        conds = []
+        for (col_name, op), value in zip(pattern.predicates, pattern.samples):
+            col = table.c[col_name]
+            if op == "is" or value is None:
+                conds.append(col.is_(None))
+            elif op == "in":
+                conds.append(col.in_(list(value) or [None]))
+            elif op == "between":
+                conds.append(col.between(*value))
+            elif op == "startswith":
+                conds.append(col.startswith(value, autoescape=True))
+            else:
+                conds.append({
+                    "eq": col.__eq__, "gt": col.__gt__, "lt": col.__lt__, "gte": col.__ge__, "lte": col.__le__,
+                    "like": col.like,
+                }[op](value))
+        orders = [table.c[col].desc() if is_desc else table.c[col].asc() for col, is_desc in pattern.orders]
+        return select(table).where(*conds).order_by(*orders).limit(20)
+
+    @staticmethod
+    async def _explain(conn: AsyncConnection, stmt) -> dict:
+        """ 返回 {access, key, rows, filesort}, 不支持的方言返回空字典 """
+        dialect = conn.dialect.name
+        sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+        if dialect == "mysql":
+            cursor_result = await conn.exec_driver_sql(f"EXPLAIN FORMAT=JSON {sql}")
+            plan = json.loads(cursor_result.scalar_one())
+            found = {"filesort": '"using_filesort": true' in json.dumps(plan)}
+
+            def walk(node):
+                if isinstance(node, dict):
+                    if "access_type" in node and "access" not in found:
+                        found.update(access=node["access_type"], key=node.get("key"),
+                                     rows=node.get("rows_examined_per_scan"))
+                    for value in node.values():
+                        walk(value)
+                elif isinstance(node, list):
+                    for value in node:
+                        walk(value)
+
+            walk(plan)
+            return found
+        if dialect == "sqlite":
+            cursor_result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+            details = [row[-1] for row in cursor_result.all()]
+            scan = next((detail for detail in details if detail.startswith(("SCAN", "SEARCH"))), "")
+            return {
+                "access": "ALL" if scan.startswith("SCAN") and "INDEX" not in scan else "index",
+                "key": scan.split(" INDEX ", 1)[1].split(" ")[0] if " INDEX " in scan else None,
+                "filesort": any("TEMP B-TREE FOR ORDER BY" in detail for detail in details),
+            }
+        if dialect == "postgresql":
+            cursor_result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cursor_result.scalar_one()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            text_plan = json.dumps(plan)
+            root = plan[0]["Plan"]
+            return {
+                "access": "ALL" if '"Seq Scan"' in text_plan else "index",
+                "key": root.get("Index Name"),
+                "rows": root.get("Plan Rows"),
+                "filesort": '"Node Type": "Sort"' in text_plan,
+            }
+        return {}
+
+    @staticmethod
+    async def _table_rows(conn: AsyncConnection, table: Table) -> int:
+        if conn.dialect.name == "mysql":
+            cursor_result = await conn.execute(
+                text(
+                    "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name"
+                ),
+                {"table_name": table.name},
+            )
+            return int(cursor_result.scalar_one_or_none() or 0)
+        cursor_result = await conn.execute(select(func.count()).select_from(table))
+        return int(cursor_result.scalar_one())
+
+    @staticmethod
+    async def _ndv(conn: AsyncConnection, table: Table, columns: List[str], sample_rows: int) -> int:
+        """ 在最多 sample_rows 行样本上估算多列组合的不同值个数 """
+        sample = select(*[table.c[col] for col in columns]).limit(sample_rows).subquery()
+        cursor_result = await conn.execute(
+            select(func.count()).select_from(select(*sample.c).distinct().subquery())
+        )
+        return max(int(cursor_result.scalar_one() or 0), 1)
+
+    @staticmethod
+    def _candidate(pattern: QueryPattern) -> Tuple[List[Tuple[str, bool]], int]:
+        """ 候选索引列: 等值列 -> 排序列 -> 第一个范围列, 返回 (列, 等值列个数) """
+        eq_cols = list(dict.fromkeys(col for col, op in pattern.predicates if FILTER_KINDS[op] == EQ))
+        range_cols = [col for col, op in pattern.predicates if FILTER_KINDS[op] == RANGE and col not in eq_cols]
+        orders = [(col, is_desc) for col, is_desc in pattern.orders if col not in eq_cols]
+        # InnoDB 二级索引隐含主键, 等值列之后按 id 排序不需要再建到索引里
+        if eq_cols and orders and orders[-1][0] == "id":
+            orders = orders[:-1]
+        columns = [(col, False) for col in eq_cols] + orders
+        if range_cols and range_cols[0] not in {col for col, _ in columns}:
+            columns.append((range_cols[0], False))
+        if columns == [("id", False)] or columns == [("id", True)]:
+            return [], 0
+        return columns[:MAX_INDEX_COLUMNS], min(len(eq_cols), MAX_INDEX_COLUMNS)
+
+    @staticmethod
+    def _ddl(table: Table, columns: List[Tuple[str, bool]], dialect) -> str:
+        # 不用 sqlalchemy.Index: 传入列对象会把索引挂到模型的 Table 上, create_all 时被创建
+        name = f"ix_{table.name}_{'_'.join(col for col, _ in columns)}"
+        if len(name) > 60:
+            name = f"{name[:51]}_{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+        preparer = dialect.identifier_preparer
+        column_sql = ", ".join(f"{preparer.quote(col)}{' DESC' if is_desc else ''}" for col, is_desc in columns)
+        return f"CREATE INDEX {preparer.quote(name)} ON {preparer.format_table(table)} ({column_sql});"
+
+    async def analyze(self, engine: AsyncEngine, *, min_count: int = 1,
+                      ndv_sample_rows: int = 100000) -> List[IndexRecommendation]:
+        """
+        生成索引建议
+        Args:
+            engine: 执行 EXPLAIN 的引擎(建议使用只读副本)
+            min_count: 采样次数低于该值的查询模式不参与分析
+            ndv_sample_rows: 估算区分度时的采样行数
+
+        Returns: 按预期收益降序的索引建议
+        """
+        recommendations: Dict[Tuple[str, tuple], IndexRecommendation] = {}
+        async with engine.connect() as conn:
+            for table_name, table in self.tables.items():
+                patterns = [p for p in self.patterns.values() if p.table == table_name and p.count >= min_count]
+                if not patterns:
+                    continue
+                existing = await conn.run_sync(_existing_indexes, table_name)
+                table_rows = await self._table_rows(conn, table)
+                ndv_cache: Dict[str, int] = {}
+
+                for pattern in patterns:
+                    columns, n_eq = self._candidate(pattern)
+                    if not columns:
+                        continue
+                    eq_cols = [col for col, _ in columns[:n_eq]]
+                    for col in eq_cols:
+                        if col not in ndv_cache:
+                            ndv_cache[col] = await self._ndv(conn, table, [col], ndv_sample_rows)
+                    # 区分度高的等值列放在前面
+                    columns[:n_eq] = sorted(columns[:n_eq], key=lambda item: -ndv_cache[item[0]])
+                    column_names = [col for col, _ in columns]
+                    if _is_covered(column_names, n_eq, existing):
+                        continue
+
+                    try:
+                        plan = await self._explain(conn, self._statement(table, pattern))
+                    except Exception as e:
+                        logger.warning(f"EXPLAIN {table_name} {pattern.describe()} 失败: {e}")
+                        plan = {}
+
+                    estimated = table_rows
+                    if eq_cols:
+                        ndv = await self._ndv(conn, table, eq_cols, ndv_sample_rows)
+                        estimated = table_rows / ndv
+                    if any(FILTER_KINDS[op] == RANGE for col, op in pattern.predicates if col in column_names):
+                        estimated *= RANGE_SELECTIVITY
+                    current_rows = plan.get("rows") or table_rows
+                    rows_saved = max(int(current_rows - estimated), 0)
+
+                    key = (table_name, tuple(columns))
+                    rec = recommendations.get(key)
+                    if rec is None:
+                        rec = recommendations[key] = IndexRecommendation(
+                            table=table_name, columns=columns, ddl=self._ddl(table, columns, conn.dialect),
+                            query_count=0, patterns=[], current_access=plan.get("access"),
+                            current_key=plan.get("key"), current_rows=current_rows,
+                            uses_filesort=bool(plan.get("filesort")), estimated_rows=max(int(estimated), 1),
+                            rows_saved_per_query=rows_saved,
+                        )
+                    rec.query_count += pattern.count
+                    rec.patterns.append(f"{pattern.describe()} x{pattern.count}")
+                    rec.expected_gain += rows_saved * pattern.count
+                    if pattern.unindexable:
+                        rec.notes.append(f"无法使用索引的条件: {', '.join(pattern.unindexable)}")
+
+        return self._merge_prefixes(list(recommendations.values()))
+
+    @staticmethod
+    def _merge_prefixes(recommendations: List[IndexRecommendation]) -> List[IndexRecommendation]:
+        """ 候选 A 是同表候选 B 的前缀时, B 可以服务 A 的查询, 合并到 B """
+        recommendations.sort(key=lambda rec: -len(rec.columns))
+        merged: List[IndexRecommendation] = []
+        for rec in recommendations:
+            target = next(
+                (other for other in merged
+                 if other.table == rec.table and other.columns[:len(rec.columns)] == rec.columns),
+                None,
+            )
+            if target is None:
+                merged.append(rec)
+                continue
+            target.query_count += rec.query_count
+            target.patterns.extend(rec.patterns)
+            target.expected_gain += rec.expected_gain
+            target.notes.extend(rec.notes)
+        merged.sort(key=lambda rec: -rec.expected_gain)
+        return merged
+
+    @staticmethod
+    def render(recommendations: List[IndexRecommendation]) -> str:
+        """ 文本报告, 末尾附可直接执行的 DDL """
+        lines = []
+        for idx, rec in enumerate(recommendations, 1):
+            lines.append(
+                f"{idx}. {rec.table} ({', '.join(f'{col} desc' if is_desc else col for col, is_desc in rec.columns)})"
+            )
+            lines.append(
+                f"   当前: access={rec.current_access} key={rec.current_key} rows={rec.current_rows} "
+                f"filesort={rec.uses_filesort}; 预计 rows≈{rec.estimated_rows}, "
+                f"每次少扫描 {rec.rows_saved_per_query} 行, 采样调用 {rec.query_count} 次, 收益 {rec.expected_gain}"
+            )
+            lines.extend(f"   - {pattern}" for pattern in rec.patterns)
+            lines.extend(f"   ! {note}" for note in dict.fromkeys(rec.notes))
+        lines.append("")
+        lines.extend(rec.ddl for rec in recommendations)
+        return "\n".join(lines)
+
+
+index_advisor = IndexAdvisor(sample_rate=Settings.INDEX_ADVISOR_SAMPLE_RATE)
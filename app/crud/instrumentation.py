@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/26 21:05
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import bisect
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.commons.tracing import current_span
+from config import Settings
+
+# 直方图桶上界(毫秒), 最后一个桶为 +inf
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# 未匹配到路由的请求(404、扫描器等)统一聚合的键, 避免原始路径导致维度膨胀
+UNMATCHED_ROUTE = "<unmatched>"
+# 路由数达到上限后新出现的路由统一聚合的键
+OTHER_ROUTE = "<other>"
+
+# 当前执行 SQL 的 BaseManager 方法, 由 with_session 设置
+_query_caller: ContextVar[Optional[str]] = ContextVar("query_caller", default=None)
+# 当前请求的 SQL 累计, 由日志中间件设置
+_request_queries: ContextVar[Optional["RequestQueries"]] = ContextVar("request_queries", default=None)
+
+
+class Histogram:
+    """ 固定桶的耗时直方图, 分位数按桶上界估算 """
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, value)] += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return float(LATENCY_BUCKETS_MS[idx]) if idx < len(LATENCY_BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max, 3),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {
+                **{f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                "le_inf": self.buckets[-1],
+            },
+        }
+
+
+@dataclass
+class RequestQueries:
+    """ 单个请求内的 SQL 累计 """
+    path: str
+    count: int = 0
+    elapsed_ms: float = 0.0
+    rows: int = 0
+
+
+class QueryStats:
+    """
+    基于引擎事件的 SQL 埋点
+    Notes:
+        before/after_cursor_execute 记录每条语句的耗时、影响行数与调用的 BaseManager 方法,
+        按方法与路由聚合成直方图, 路由最多保留 max_routes 个, 超出的归入 <other>;
+        超过 slow_threshold_ms 的语句按 sample_rate 采样写入慢查询日志.
+        enabled=False 时不注册事件监听, 除一次布尔判断外没有额外开销
+    """
+
+    def __init__(self, enabled: bool = True, slow_threshold_ms: float = 200, sample_rate: float = 1.0,
+                 max_statement_length: int = 2000, max_routes: int = 500):
+        self.enabled = enabled
+        self.max_routes = max_routes
+        self.slow_threshold_ms = slow_threshold_ms
+        self.sample_rate = sample_rate
+        self.max_statement_length = max_statement_length
+        self.statements = Histogram()
+        self.methods: Dict[str, Histogram] = {}
+        self.routes: Dict[str, Histogram] = {}
+        self.route_queries: Dict[str, Histogram] = {}
+        self.slow_queries = 0
+        self._engines: List[AsyncEngine] = []
+
+    def instrument(self, *engines: AsyncEngine):
+        """ 为引擎注册事件监听 """
+        if not self.enabled:
+            return
+        for engine in engines:
+            if engine in self._engines:
+                continue
+            event.listen(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+            event.listen(engine.sync_engine, "handle_error", self._handle_error)
+            self._engines.append(engine)
+
+    def uninstrument(self):
+        for engine in self._engines:
+            event.remove(engine.sync_engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+            event.remove(engine.sync_engine, "handle_error", self._handle_error)
+        self._engines.clear()
+
+    @staticmethod
+    def set_caller(name: str):
+        """ 嵌套调用时保留最外层的方法名, 已设置时返回 None """
+        if _query_caller.get() is not None:
+            return None
+        return _query_caller.set(name)
+
+    @staticmethod
+    def reset_caller(token):
+        _query_caller.reset(token)
+
+    def begin_request(self, path: str) -> Optional[RequestQueries]:
+        if not self.enabled:
+            return None
+        queries = RequestQueries(path=path)
+        _request_queries.set(queries)
+        return queries
+
+    def end_request(self, route: str, queries: Optional[RequestQueries]):
+        """ 请求结束时按路由模板聚合本次请求的 SQL 耗时与条数 """
+        if queries is None:
+            return
+        if route not in self.routes and len(self.routes) >= self.max_routes:
+            route = OTHER_ROUTE
+        self.routes.setdefault(route, Histogram()).observe(queries.elapsed_ms)
+        # 复用直方图统计每个请求的 SQL 条数, 桶边界按个数解读
+        self.route_queries.setdefault(route, Histogram()).observe(queries.count)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else 0
+        caller = _query_caller.get() or "<raw>"
+
+        self.statements.observe(elapsed_ms)
+        self.methods.setdefault(caller, Histogram()).observe(elapsed_ms)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.elapsed_ms += elapsed_ms
+            queries.rows += rows
+        span = current_span()
+        if span is not None:
+            span.incr("db.statements")
+            span.incr("db.time_ms", elapsed_ms)
+
+        if elapsed_ms >= self.slow_threshold_ms:
+            self.slow_queries += 1
+            if self.sample_rate >= 1 or random.random() < self.sample_rate:
+                logger.bind(name="slow_query").warning(
+                    f"slow query {elapsed_ms:.3f}ms rows={rows} executemany={executemany} "
+                    f"method={caller} path={queries.path if queries else '-'}\n"
+                    f"{statement[:self.max_statement_length]}"
+                )
+
+    @staticmethod
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
+
+    def snapshot(self) -> dict:
+        """ 聚合统计 """
+        return {
+            "enabled": self.enabled,
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "slow_queries": self.slow_queries,
+            "statements": self.statements.to_dict(),
+            "methods": {name: hist.to_dict() for name, hist in self.methods.items()},
+            "routes": {
+                route: {**hist.to_dict(), "queries_per_request": self.route_queries[route].to_dict()}
+                for route, hist in self.routes.items()
+            },
+        }
+
+    def reset(self):
+        self.statements = Histogram()
+        self.methods.clear()
+        self.routes.clear()
+        self.route_queries.clear()
+        self.slow_queries = 0
+
+
+query_stats = QueryStats(
+    enabled=Settings.QUERY_STATS_ENABLED,
+    slow_threshold_ms=Settings.SLOW_QUERY_THRESHOLD_MS,
+    sample_rate=Settings.SLOW_QUERY_SAMPLE_RATE,
+    max_routes=Settings.QUERY_STATS_MAX_ROUTES,
+)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/28 20:10
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from app.crud.bulk import chunked
+
+
+class BatchLoader:
+    """
+    批量加载器(DataLoader)
+    Notes:
+        同一个事件循环 tick 内的 load 调用去重后合并成一次 batch_fn 调用, 每个调用方拿到各自的结果;
+        cache=True 时已加载过的键直接返回同一个 Future, 生命周期与加载器相同(按请求创建则为请求级缓存)
+    """
+
+    def __init__(
+            self,
+            batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+            *,
+            max_batch_size: int = 500,
+            cache: bool = True,
+    ):
+        """
+        Args:
+            batch_fn: 接收键列表, 返回 {键: 值}, 缺失的键视为 None
+            max_batch_size: 单次 batch_fn 的最大键数
+            cache: 是否缓存已加载的键
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.cache = cache
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._queue: Dict[Hashable, asyncio.Future] = {}
+        self.batches = 0
+
+    def load(self, key: Hashable) -> "asyncio.Future":
+        if self.cache and key in self._cache:
+            return self._cache[key]
+        future = self._queue.get(key)
+        if future is not None:
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._queue:
+            # 当前 tick 中已就绪的协程都执行到 load 之后再派发
+            loop.call_soon(self._dispatch)
+        self._queue[key] = future
+        if self.cache:
+            self._cache[key] = future
+        return future
+
+    async def load_many(self, keys: List[Hashable]) -> List[Any]:
+        return list(await asyncio.gather(*[self.load(key) for key in keys]))
+
+    def prime(self, key: Hashable, value: Any):
+        """ 预先写入缓存, 已存在时不覆盖 """
+        if self.cache and key not in self._cache:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+            self._cache[key] = future
+
+    def clear(self, key: Hashable = None):
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    def _dispatch(self):
+        queue, self._queue = self._queue, {}
+        for keys in chunked(list(queue), self.max_batch_size):
+            asyncio.ensure_future(self._run_batch({key: queue[key] for key in keys}))
+
+    async def _run_batch(self, batch: Dict[Hashable, asyncio.Future]):
+        self.batches += 1
+        try:
+            results: Optional[dict] = await self.batch_fn(list(batch))
+        except Exception as e:
+            for key, future in batch.items():
+                # 失败的键不缓存, 下次重新加载
+                self._cache.pop(key, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        results = results or {}
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/21 15:02
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Tuple
+
+from sqlalchemy import ColumnElement, and_, column, or_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+# (排序列, 是否降序)
+SortKey = Tuple[ColumnElement, bool]
+
+
+def parse_orders(orders: list, orm_table=None) -> List[SortKey]:
+    """
+    把 order_by 表达式列表拆解成 (列, 是否降序)，并补充 id 作为唯一性兜底
+    Args:
+        orders: 排序列表, e.g. [column("id")] or [Report.created_at.desc()]
+        orm_table: orm表映射类, 用于补充 id 排序列
+
+    Returns: 排序键列表
+    """
+    sort_keys = []
+    for order in orders:
+        if isinstance(order, str):
+            order = column(order)
+        is_desc = False
+        if isinstance(order, UnaryExpression):
+            if order.modifier not in (operators.asc_op, operators.desc_op):
+                raise ValueError(f"Unsupported keyset order expression: {order}")
+            is_desc = order.modifier is operators.desc_op
+            order = order.element
+        if getattr(order, "key", None) is None:
+            raise ValueError(f"Keyset order column must be a named column: {order}")
+        sort_keys.append((order, is_desc))
+
+    if not any(sort_col.key == "id" for sort_col, _ in sort_keys):
+        # id 作为兜底排序列，保证排序键唯一，方向与最后一个排序列保持一致
+        id_col = orm_table.id if orm_table is not None else column("id")
+        sort_keys.append((id_col, sort_keys[-1][1] if sort_keys else False))
+    return sort_keys
+
+
+def keyset_orders(sort_keys: List[SortKey]) -> list:
+    """ 排序键转 order_by 表达式 """
+    return [sort_col.desc() if is_desc else sort_col.asc() for sort_col, is_desc in sort_keys]
+
+
+def keyset_condition(sort_keys: List[SortKey], values: list) -> ColumnElement:
+    """
+    构造 seek 条件, 例如排序 (a asc, id asc) 时:
+        a > :a OR (a = :a AND id > :id)
+    Args:
+        sort_keys: 排序键列表
+        values: 上一页最后一行对应的排序键取值
+
+    Returns: where 条件
+    """
+    clauses = []
+    for idx, (sort_col, is_desc) in enumerate(sort_keys):
+        equals = [sort_keys[i][0] == values[i] for i in range(idx)]
+        seek = sort_col < values[idx] if is_desc else sort_col > values[idx]
+        clauses.append(and_(*equals, seek))
+    return or_(*clauses)
+
+
+def row_sort_values(row: Any, sort_keys: List[SortKey]) -> list:
+    """ 从查询结果行(orm实例或 RowMapping)中取出排序键的值 """
+    values = []
+    for sort_col, _ in sort_keys:
+        key = sort_col.key
+        try:
+            values.append(row[key] if hasattr(row, "keys") else getattr(row, key))
+        except (KeyError, AttributeError):
+            raise ValueError(f"Keyset sort column <{key}> must be included in the selected cols")
+    return values
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"$d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"$dec": str(value)}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "$dt" in value:
+            return datetime.fromisoformat(value["$dt"])
+        if "$d" in value:
+            return date.fromisoformat(value["$d"])
+        if "$dec" in value:
+            return Decimal(value["$dec"])
+    return value
+
+
+def encode_cursor(sort_keys: List[SortKey], values: list) -> str:
+    """
+    把最后一行的排序键取值编码成不透明的游标字符串
+    Args:
+        sort_keys: 排序键列表
+        values: 排序键取值
+
+    Returns: urlsafe base64 游标
+    """
+    payload = {
+        "k": [sort_col.key for sort_col, _ in sort_keys],
+        "v": [_encode_value(value) for value in values],
+    }
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_keys: List[SortKey]) -> list:
+    """
+    解析游标，并校验游标与当前排序规则一致
+    Args:
+        cursor: encode_cursor 生成的游标
+        sort_keys: 排序键列表
+
+    Returns: 排序键取值列表
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        keys, values = payload["k"], payload["v"]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError(f"Invalid pagination cursor: {cursor}")
+
+    if keys != [sort_col.key for sort_col, _ in sort_keys] or len(values) != len(keys):
+        raise ValueError("Pagination cursor does not match the current sort orders")
+    return [_decode_value(value) for value in values]
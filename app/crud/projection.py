@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/29 20:25
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+from collections import namedtuple
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+
+@dataclass(frozen=True)
+class RowProjection:
+    """ 投影: 查询的列与把 Core 行转换成结果对象的函数 """
+    columns: Tuple[Any, ...]
+    keys: Tuple[str, ...]
+    build: Callable[[List[tuple]], list]
+
+
+_projections: Dict[Hashable, RowProjection] = {}
+
+
+def _tuple_builder(orm_table, keys: Tuple[str, ...]) -> Callable[[List[tuple]], list]:
+    # namedtuple 的实例没有 __dict__(__slots__ = ()), 内存与普通 tuple 相同
+    row_cls = namedtuple(f"{orm_table.__name__}Row", keys, rename=True)
+    make = row_cls._make
+
+    def build(rows: List[tuple]) -> list:
+        return list(map(make, rows))
+
+    return build
+
+
+def _schema_builder(schema: Type[BaseModel], keys: Tuple[str, ...]) -> Callable[[List[tuple]], list]:
+    # 数据来自数据库且列类型与 schema 一致, 用 model_construct 跳过校验
+    construct = schema.model_construct
+    fields_set = set(keys)
+
+    def build(rows: List[tuple]) -> list:
+        return [construct(fields_set, **dict(zip(keys, row))) for row in rows]
+
+    return build
+
+
+def row_projection(
+        orm_table,
+        schema: Optional[Type[BaseModel]] = None,
+        as_tuples: bool = False,
+) -> RowProjection:
+    """
+    获取(并缓存)表的行投影
+    Args:
+        orm_table: orm表映射类
+        schema: 只查询 schema 中与表同名的字段; 未传时查询全部列
+        as_tuples: True 返回命名元组, False 返回 schema 实例(此时 schema 必传)
+
+    Returns: RowProjection
+    """
+    cache_key = (orm_table, schema, as_tuples)
+    projection = _projections.get(cache_key)
+    if projection is not None:
+        return projection
+
+    if schema is None and not as_tuples:
+        raise ValueError("schema_to_select is required unless as_tuples=True")
+
+    table_columns = orm_table.__table__.columns
+    if schema is not None:
+        keys = tuple(name for name in schema.model_fields if name in table_columns)
+    else:
+        keys = tuple(col.key for col in table_columns)
+    if not keys:
+        raise ValueError(f"{schema.__name__} has no field matching columns of {orm_table.__tablename__}")
+
+    columns = tuple(getattr(orm_table, key) for key in keys)
+    build = _tuple_builder(orm_table, keys) if as_tuples else _schema_builder(schema, keys)
+    projection = RowProjection(columns=columns, keys=keys, build=build)
+    _projections[cache_key] = projection
+    return projection
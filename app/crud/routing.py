@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/25 21:48
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.models import async_session_maker, replica_engines
+from config import Settings
+
+
+
+def is_replica_unavailable(error: BaseException) -> bool:
+    """
+    只读副本连接层面的失败, 需要标记副本不可用并回退主库
+    Notes:
+        只认连接失败、连接被作废、驱动接口错误; 死锁、锁等待超时等 SQL 错误和语句超时照常抛出,
+        避免健康的副本被摘除、同一条慢查询又在主库上再执行一次
+    """
+    if isinstance(error, TimeoutError):
+        return False
+    if isinstance(error, (InterfaceError, OSError)):
+        return True
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        # 建立连接失败时驱动的 OperationalError 由 socket 错误引发
+        cause = error.orig.__cause__ if error.orig is not None else None
+        return isinstance(cause, OSError) and not isinstance(cause, TimeoutError)
+    return False
+
+
+# force_primary() 作用域内的读操作全部走主库
+_force_primary: ContextVar[bool] = ContextVar("force_primary", default=False)
+
+
+@contextmanager
+def force_primary():
+    """
+    代码块内的读操作强制走主库
+    Examples:
+        with force_primary():
+            user = await UserManager().query_by_id(1)
+    """
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+@dataclass
+class Replica:
+    name: str
+    engine: AsyncEngine
+    session_maker: async_sessionmaker
+    healthy: bool = True
+    lag: Optional[int] = None
+    checked_at: float = field(default=0.0)
+
+
+class ReplicaRouter:
+    """
+    读写分离路由
+    Notes:
+        只读方法在未传 session 时轮询健康的只读副本;
+        表写入后 read_your_writes 秒内该表的读操作走主库(进程内), 保证读到自己的写入;
+        副本延迟超过 max_lag 或连接失败时标记为不健康, 读操作回退主库, 由健康检查恢复
+    """
+
+    def __init__(self, engines: List[AsyncEngine], read_your_writes: float = 2, max_lag: int = 5):
+        self.read_your_writes = read_your_writes
+        self.max_lag = max_lag
+        self.replicas = [
+            Replica(
+                name=f"replica-{idx}",
+                engine=engine,
+                session_maker=async_sessionmaker(
+                    bind=engine, class_=AsyncSession, autocommit=False, expire_on_commit=False
+                ),
+            )
+            for idx, engine in enumerate(engines)
+        ]
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+        self._last_writes: Dict[str, float] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _table_name(orm_table) -> Optional[str]:
+        return getattr(orm_table, "__tablename__", None)
+
+    def mark_write(self, orm_table):
+        table_name = self._table_name(orm_table)
+        if self.replicas and table_name:
+            self._last_writes[table_name] = time.monotonic()
+
+    def mark_down(self, replica: Replica, error: Exception):
+        replica.healthy = False
+        logger.warning(f"只读副本 {replica.name} 不可用, 读操作回退主库: {error}")
+
+    def choose(self, orm_table=None, use_primary: bool = False) -> Optional[Replica]:
+        """
+        选择只读副本
+        Returns: 健康的副本, 需要走主库时返回 None
+        """
+        if not self.replicas or use_primary or _force_primary.get():
+            return None
+        last_write = self._last_writes.get(self._table_name(orm_table))
+        if last_write is not None and time.monotonic() - last_write < self.read_your_writes:
+            return None
+        for _ in range(len(self.replicas)):
+            replica = next(self._cycle)
+            if replica.healthy:
+                return replica
+        return None
+
+    def session_maker_for(self, orm_table=None, use_primary: bool = False) -> async_sessionmaker:
+        replica = self.choose(orm_table, use_primary)
+        return replica.session_maker if replica else async_session_maker
+
+    async def _replica_lag(self, replica: Replica) -> Optional[int]:
+        async with replica.engine.connect() as conn:
+            if conn.dialect.name != "mysql":
+                await conn.exec_driver_sql("SELECT 1")
+                return 0
+            try:
+                cursor_result = await conn.exec_driver_sql("SHOW REPLICA STATUS")
+            except OperationalError:
+                # MySQL 8.0.22 之前的版本
+                await conn.rollback()
+                cursor_result = await conn.exec_driver_sql("SHOW SLAVE STATUS")
+            status = cursor_result.mappings().first()
+        if status is None:
+            # 不是复制节点(如本地环境用主库充当副本), 视为无延迟
+            return 0
+        return status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+
+    async def check_health(self):
+        """ 检查副本连通性与复制延迟 """
+        for replica in self.replicas:
+            try:
+                replica.lag = await self._replica_lag(replica)
+                healthy = replica.lag is not None and replica.lag <= self.max_lag
+            except Exception as e:
+                logger.warning(f"只读副本 {replica.name} 健康检查失败: {e}")
+                replica.lag, healthy = None, False
+            if healthy != replica.healthy:
+                logger.info(f"只读副本 {replica.name} 状态变更: healthy={healthy}, lag={replica.lag}")
+            replica.healthy = healthy
+            replica.checked_at = time.monotonic()
+
+    async def run_health_checks(self, interval: float):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float):
+        """ 启动后台健康检查, 未配置副本时不启动 """
+        if self.replicas and self._health_task is None:
+            self._health_task = asyncio.create_task(self.run_health_checks(interval))
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replica_router = ReplicaRouter(
+    replica_engines,
+    read_your_writes=Settings.READ_YOUR_WRITES_SECONDS,
+    max_lag=Settings.REPLICA_MAX_LAG_SECONDS,
+)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/22 20:15
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class StatementCache:
+    """
+    查询语句模板缓存(LRU)
+    Notes:
+        缓存的是以 bindparam 占位的语句模板, 不含具体参数值;
+        相同结构的语句 SQLAlchemy 的 compiled_cache 也能命中, 不再重复编译 SQL
+    """
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        try:
+            value = self._cache[key]
+        except (KeyError, TypeError):
+            # TypeError: 参数中含有不可哈希的字面量, 按未命中处理
+            self.misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        try:
+            self._cache[key] = value
+        except TypeError:
+            return
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """ 命中统计 """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._cache),
+            "maxsize": self.maxsize,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
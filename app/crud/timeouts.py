@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/2 21:05
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Optional
+
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+# session.info 中的标记: 会话由本次调用开启, 调用结束即关闭
+_OWNED_KEY = "alden_owned_session"
+
+
+def mark_owned(session: AsyncSession):
+    """ 标记会话由本次调用开启并独占, 超时后可以直接作废其连接 """
+    session.info[_OWNED_KEY] = True
+
+
+class StatementTimeout:
+    """
+    单条语句的超时控制
+    Notes:
+        客户端用 asyncio.timeout 计时, 超时后:
+          mysql: 另开连接 KILL QUERY 终止服务端仍在执行的语句
+          postgresql: 额外设置 SET LOCAL statement_timeout, 由服务端自行终止
+        抛出 TimeoutError; 本次调用独占的连接直接作废(不归还连接池),
+        调用方传入或请求级共享会话的连接不作废, 由外层回滚 SAVEPOINT/事务后继续使用
+    """
+
+    def __init__(
+            self,
+            conn: AsyncConnection,
+            seconds: Optional[float],
+            connection_id: Optional[int] = None,
+            owned: bool = False,
+    ):
+        self.conn = conn
+        self.seconds = seconds
+        self.connection_id = connection_id
+        self.owned = owned
+
+    @classmethod
+    async def start(cls, session: AsyncSession, seconds: Optional[float]) -> "StatementTimeout":
+        conn = await session.connection()
+        if not seconds:
+            return cls(conn, None)
+
+        dialect_name = conn.dialect.name
+        connection_id = None
+        if dialect_name == "mysql":
+            connection_id = (await conn.exec_driver_sql("SELECT CONNECTION_ID()")).scalar()
+        elif dialect_name == "postgresql":
+            await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(seconds * 1000)}")
+        return cls(conn, seconds, connection_id, owned=session.info.get(_OWNED_KEY, False))
+
+    async def run(self, awaitable: Awaitable) -> Any:
+        """ 在超时控制下等待一次数据库调用(执行语句或拉取一批结果) """
+        if not self.seconds:
+            return await awaitable
+        try:
+            async with asyncio.timeout(self.seconds):
+                return await awaitable
+        except TimeoutError:
+            await self._abort()
+            raise TimeoutError(f"statement exceeded timeout of {self.seconds}s")
+
+    async def iterate(self, iterator: AsyncIterator) -> AsyncIterator:
+        """ 逐个拉取异步迭代器, 每次拉取单独计时 """
+        while True:
+            try:
+                item = await self.run(anext(iterator))
+            except StopAsyncIteration:
+                return
+            yield item
+
+    async def _abort(self):
+        if self.connection_id is not None:
+            try:
+                async with self.conn.engine.connect() as killer:
+                    await killer.exec_driver_sql(f"KILL QUERY {int(self.connection_id)}")
+            except Exception as e:
+                logger.warning(f"KILL QUERY {self.connection_id} failed: {e}")
+        if self.owned:
+            # 连接上可能还有未读完的结果, 直接作废, 不再归还连接池
+            await self.conn.invalidate()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/27 20:40
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from loguru import logger
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.models import async_session_maker
+
+_current_unit_of_work: ContextVar[Optional["UnitOfWork"]] = ContextVar("unit_of_work", default=None)
+
+
+class UnitOfWork:
+    """
+    请求级共享会话
+    Notes:
+        第一次用到时才从连接池取连接, 请求内未传 session 的 BaseManager 调用共用这一个会话和事务,
+        请求结束时统一提交或回滚.
+        AsyncSession 不能并发使用, 会话正被占用时(如 asyncio.gather 并发调用)由调用方自行开启独立会话
+    """
+
+    def __init__(self, session_maker: async_sessionmaker = None):
+        self.session_maker = session_maker or async_session_maker
+        self.session: Optional[AsyncSession] = None
+        self.has_writes = False
+        # 请求级的 BatchLoader, 键为 orm表名
+        self.loaders: dict = {}
+        # 提交成功后执行的回调, 如失效响应缓存
+        self.after_commit: List[Callable[[], Awaitable]] = []
+        self._busy = False
+
+    def acquire(self) -> Optional[AsyncSession]:
+        """ 占用共享会话, 正被占用时返回 None """
+        if self._busy:
+            return None
+        if self.session is None:
+            self.session = self.session_maker()
+        self._busy = True
+        return self.session
+
+    def release(self):
+        self._busy = False
+
+    async def close(self, commit: bool):
+        if self.session is None:
+            return
+        try:
+            if commit:
+                await self.session.commit()
+            else:
+                await self.session.rollback()
+        finally:
+            await self.session.close()
+            self.session = None
+        if commit:
+            for callback in self.after_commit:
+                try:
+                    await callback()
+                except Exception as e:
+                    logger.warning(f"after_commit callback {callback} failed: {e}")
+        self.after_commit.clear()
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    return _current_unit_of_work.get()
+
+
+@asynccontextmanager
+async def unit_of_work(session_maker: async_sessionmaker = None) -> AsyncIterator[UnitOfWork]:
+    """
+    开启请求级共享会话, 正常退出时提交, 异常时回滚
+    Examples:
+        async with unit_of_work():
+            user = await UserManager().query_by_id(1)
+            await UserManager().update({"nickname": "alden"}, conds=[UserModel.id == 1])
+    """
+    uow = UnitOfWork(session_maker)
+    token = _current_unit_of_work.set(uow)
+    try:
+        yield uow
+    except BaseException:
+        await uow.close(commit=False)
+        raise
+    else:
+        await uow.close(commit=True)
+    finally:
+        _current_unit_of_work.reset(token)
@@ -10,17 +10,26 @@
 import traceback
 
 from fastapi.requests import Request
-from fastapi.responses import JSONResponse
 
 from fastapi.exceptions import RequestValidationError
 from loguru import logger
 
 from app.commons import R
+from app.commons.response import RJSONResponse
 from app.enums.exception import ErrorCodeEnum, HttpResponseEnum
-from app.exceptions.global_exception import BusinessException, AuthorizationException
+from app.exceptions.global_exception import BusinessException, AuthorizationException, LimiterResException
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 
+def limiter_response(exc: LimiterResException) -> RJSONResponse:
+    """ 限流/过载响应, 中间件拦截时直接使用, 不经过异常处理器 """
+    return RJSONResponse(
+        status_code=exc.status_code,
+        content=R.fail(code=exc.status_code, message=str(HttpResponseEnum.use_code_get_enum_msg(exc.status_code))),
+        headers=exc.headers,
+    )
+
+
 # 自定义http异常处理器
 async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     # res = ResponseDto(code=CodeEnum.HTTP_ERROR.code, msg=HTTP_MSG_MAP.get(exc.status_code, exc.detail))
@@ -28,8 +37,10 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     #     return MethodNotAllowedException()
     # if exc.status_code == 404:
     #     return NotfoundException()
-    # elif exc.status_code == 429:
-    #     return LimiterResException()
+    if isinstance(exc, LimiterResException):
+        # 被限流的请求量可能很大, 不逐条打印请求头
+        logger.info(f"请求被限流 {exc.status_code} {request.method} {request.url.path}")
+        return limiter_response(exc)
     logger.warning(
         f"Http请求异常\n"
         f"Method\n{request.method}"
@@ -41,9 +52,10 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
 
     exc_msg = HttpResponseEnum.use_code_get_enum_msg(exc.status_code)
 
-    return JSONResponse(
+    return RJSONResponse(
         status_code=exc.status_code,
-        content=R.fail(code=exc.status_code, message=str(exc_msg)).dict()
+        content=R.fail(code=exc.status_code, message=str(exc_msg)),
+        headers=exc.headers
     )
 
 
@@ -57,18 +69,18 @@ async def business_exception_handler(request: Request, exc: BusinessException):
         f"Code:{exc.code}\n"
         f"Message:{exc.message}\n"
     )
-    return JSONResponse(
+    return RJSONResponse(
         status_code=200,
-        content=R.fail(code=exc.code, message=str(exc.message)).dict()
+        content=R.fail(code=exc.code, message=str(exc.message))
     )
 
 
 async def authorization_exception_handler(request: Request, exc: AuthorizationException):
     """ 认证异常处理 """
     logger.debug('认证失败')
-    return JSONResponse(
+    return RJSONResponse(
         status_code=401,
-        content=R.fail(code=exc.code, message=str(exc.message)).dict()
+        content=R.fail(code=exc.code, message=str(exc.message))
     )
 
 
@@ -78,9 +90,9 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
                         for error in exc.errors()])
 
     logger.warning(message)
-    return JSONResponse(
+    return RJSONResponse(
         status_code=200,
-        content=R.fail(code=-1, message=str(message)).dict()
+        content=R.fail(code=-1, message=str(message))
     )
 
 
@@ -97,7 +109,7 @@ async def global_exception_handler(request: Request, exc: Exception):
         error = ErrorCodeEnum.SYSTEM_ERR
 
     logger.error(message)
-    return JSONResponse(
+    return RJSONResponse(
         status_code=200,
-        content=R.fail(code=error.code, message=str(message)).dict()
+        content=R.fail(code=error.code, message=str(message))
     )
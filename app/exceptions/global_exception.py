@@ -6,6 +6,10 @@
 @Author   : wiesZheng
 @Software : PyCharm
 """
+import math
+
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
 from app.enums.exception import ErrorCodeEnum
 
 
@@ -38,3 +42,15 @@ class AuthorizationException(BusinessException):
     def __init__(self):
         self.code = ErrorCodeEnum.AUTHORIZATION_ERR.code
         self.message = ErrorCodeEnum.AUTHORIZATION_ERR.msg
+
+
+class LimiterResException(StarletteHTTPException):
+    """ 限流(429)与过载(503)异常, 带 Retry-After 响应头 """
+
+    def __init__(self, status_code: int = 429, retry_after: float = 1):
+        """
+        :param status_code: 429 请求过于频繁, 503 服务过载
+        :param retry_after: 建议的重试等待秒数, 向上取整
+        """
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(status_code=status_code, headers={"Retry-After": str(self.retry_after)})
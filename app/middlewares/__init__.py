@@ -8,13 +8,17 @@
 """
 from starlette.middleware.cors import CORSMiddleware
 
-from .middlewares import LoggingMiddleware
+from .middlewares import AdmissionMiddleware, LoggingMiddleware, UnitOfWorkMiddleware
 from fastapi import FastAPI
 
 
 def register_middlewares(_app: FastAPI):
     """注册中间件"""
+    # 先注册的在内层
     middleware_list = [
+        UnitOfWorkMiddleware,
+        # 被拦截的请求不开启共享会话, 仍记录请求日志
+        AdmissionMiddleware,
         LoggingMiddleware
     ]
     for middleware in middleware_list:
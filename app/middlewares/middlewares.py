@@ -6,12 +6,22 @@
 @Author   : wiesZheng
 @Software : PyCharm
 """
+import random
 import time
-import shortuuid
+from typing import Dict, List, Optional
+
 from loguru import logger
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.commons.rate_limit import LoadShedder, RateLimiter, load_shedder, rate_limiter
+from app.commons.tracing import tracer
+from app.crud.instrumentation import UNMATCHED_ROUTE, query_stats
+from app.crud.unit_of_work import unit_of_work
+from app.exceptions.exception_handler import limiter_response
+from app.exceptions.global_exception import LimiterResException
+from config import Settings
 
 
 async def set_body(request: Request):
@@ -23,49 +33,182 @@ async def set_body(request: Request):
     request._receive = receive
 
 
-def make_traceid(request) -> None:
-    '''
-    生成追踪链路ID
-    :param request:
-    :return:
-    '''
-    request.state.traceid = shortuuid.uuid()
-    # 追踪索引序号
-    request.state.trace_links_index = 0
-    # 追踪ID
-    request.state.traceid = shortuuid.uuid()
+class UnitOfWorkMiddleware:
+    """
+    请求级共享会话中间件
+    请求内未传 session 的 BaseManager 调用共用一个连接和事务, 响应返回前提交, 异常时回滚
+    Notes:
+        纯 ASGI 实现, 在发送 http.response.start 之前提交, 提交失败时仍可返回 500
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async with unit_of_work() as uow:
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    await uow.close(commit=True)
+                await send(message)
 
+            await self.app(scope, receive, send_wrapper)
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+
+class AdmissionMiddleware:
+    """
+    准入控制中间件
+    Notes:
+        先按过载程度丢弃请求(503), 再按 IP、用户、路径前缀的令牌桶限流(429), 均返回 R.fail 格式并带 Retry-After;
+        被拦截的请求不进入路由, 也不会占用数据库连接; exempt_paths 前缀的请求不做准入控制
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            limiter: RateLimiter = None,
+            shedder: LoadShedder = None,
+            exempt_paths: List[str] = None,
+    ):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+        self.shedder = shedder or load_shedder
+        self.exempt_paths = tuple(Settings.RATE_LIMIT_EXEMPT_PATHS if exempt_paths is None else exempt_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        if self.shedder.should_shed():
+            exc = LimiterResException(503, self.shedder.retry_after)
+        else:
+            retry_after = await self.limiter.check(scope)
+            exc = LimiterResException(429, retry_after) if retry_after else None
+        if exc is None:
+            await self.app(scope, receive, send)
+            return
+        await limiter_response(exc)(scope, receive, send)
+
+
+class LoggingMiddleware:
     """
     日志中间件
     记录请求参数信息、计算响应时间
+    Notes:
+        纯 ASGI 实现, 不经过 BaseHTTPMiddleware 的任务与流转发;
+        请求体在接口读取时旁路复制, 最多保留 body_max_bytes 字节, 不做 JSON 解析;
+        查询参数与请求体按 sample_rate 采样记录, route_sample_rates 按路径前缀覆盖采样率(最长前缀优先);
+        日志使用 loguru 的延迟格式化, 日志级别未开启时不做格式化;
+        traceid 即链路追踪的 trace_id, 带 traceparent 请求头时沿用上游的 trace_id, 采样的请求记录根 span
     """
 
-    async def dispatch(self, request: Request, call_next) -> Response:
+    def __init__(
+            self,
+            app: ASGIApp,
+            sample_rate: float = None,
+            body_max_bytes: int = None,
+            route_sample_rates: Dict[str, float] = None,
+    ):
+        self.app = app
+        self.sample_rate = Settings.LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.body_max_bytes = Settings.LOG_BODY_MAX_BYTES if body_max_bytes is None else body_max_bytes
+        route_sample_rates = Settings.LOG_ROUTE_SAMPLE_RATES if route_sample_rates is None else route_sample_rates
+        self.route_sample_rates = sorted(route_sample_rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _sampled(self, path: str) -> bool:
+        rate = self.sample_rate
+        for prefix, prefix_rate in self.route_sample_rates:
+            if path.startswith(prefix):
+                rate = prefix_rate
+                break
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    @staticmethod
+    def _header(scope: Scope, name: bytes) -> Optional[str]:
+        for key, value in scope["headers"]:
+            if key == name:
+                return value.decode("latin-1")
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         start_time = time.perf_counter()
-        make_traceid(request)
+        method, path = scope["method"], scope["path"]
+        # 追踪ID, 接口中通过 request.state.traceid 访问
+        traceid, span = tracer.start_request(
+            f"{method} {path}", self._header(scope, b"traceparent"), {"http.method": method, "http.path": path}
+        )
+        scope.setdefault("state", {})["traceid"] = traceid
+
+        client = scope.get("client")
+        queries = query_stats.begin_request(path)
         # 打印请求信息
-        logger.info(f"--> {request.state.traceid} {request.method} {request.url.path} {request.client.host}")
-        if request.query_params:
-            logger.info(f"--> {request.state.traceid} Query Params: {request.query_params}")
-
-        if "application/json" in request.headers.get("Content-Type", ""):
-            # await set_body(request)
-            try:
-                # starlette 中间件中不能读取请求数据，否则会进入循环等待 需要特殊处理或者换APIRoute实现
-                body = await request.json()
-                logger.info(f"--> {request.state.traceid} Body: {body}")
-            except Exception as e:
-                logger.warning(f"Failed to parse JSON body: {e}")
-
-        # 执行请求获取响应
-        response = await call_next(request)
-
-        # 计算响应时间
-        process_time = time.perf_counter() - start_time
-        response.headers["X-Response-Time"] = f"{process_time:.6f}s"
-        logger.info(
-            f"<-- {request.state.traceid} {response.status_code} {request.url.path} (took: {process_time:.6f}s)\n")
-
-        return response
+        logger.info("--> {} {} {} {}", traceid, method, path, client[0] if client else "-")
+
+        sampled = self._sampled(path)
+        if sampled and scope.get("query_string"):
+            logger.info("--> {} Query Params: {}", traceid, scope["query_string"].decode("latin-1"))
+
+        body_chunks: List[bytes] = []
+        body_size = 0
+        if sampled and self.body_max_bytes > 0 and "application/json" in (self._header(scope, b"content-type") or ""):
+            async def receive_tee() -> Message:
+                nonlocal body_size
+                message = await receive()
+                if message["type"] == "http.request":
+                    chunk = message.get("body", b"")
+                    remain = self.body_max_bytes - body_size
+                    if remain > 0 and chunk:
+                        body_chunks.append(chunk[:remain])
+                    body_size += len(chunk)
+                return message
+        else:
+            receive_tee = receive
+
+        status_code: Optional[int] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Response-Time", f"{time.perf_counter() - start_time:.6f}s")
+            await send(message)
+
+        try:
+            # 执行请求获取响应
+            await self.app(scope, receive_tee, send_wrapper)
+        except Exception as e:
+            if span is not None:
+                span.record_error(e)
+            raise
+        finally:
+            if body_chunks:
+                logger.opt(lazy=True).info(
+                    "--> {} Body: {}{}",
+                    lambda: traceid,
+                    lambda: b"".join(body_chunks).decode("utf-8", "replace"),
+                    lambda: f" ...({body_size} bytes)" if body_size > self.body_max_bytes else "",
+                )
+
+            # 按路由模板聚合本次请求的 SQL 耗时, 避免路径参数导致维度膨胀
+            route_path = getattr(scope.get("route"), "path", None)
+            route_label = f"{method} {route_path}" if route_path is not None else UNMATCHED_ROUTE
+            if queries is not None:
+                query_stats.end_request(route_label, queries)
+            if span is not None:
+                span.name = route_label
+                span.set_attribute("http.status_code", status_code or 500)
+                tracer.end_span(span)
+
+            # 计算响应时间
+            logger.info(
+                "<-- {} {} {} (took: {:.6f}s)\n", traceid, status_code or 500, path, time.perf_counter() - start_time
+            )
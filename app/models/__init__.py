@@ -6,11 +6,15 @@
 @Author   : wiesZheng
 @Software : PyCharm
 """
+import operator
+import time
 from datetime import datetime
+from typing import Callable, Dict, List
 
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, declarative_base
 from sqlalchemy import URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.asyncio import (create_async_engine, AsyncSession,
                                     async_sessionmaker)
 
@@ -24,8 +28,34 @@ async_database_url = URL.create(Settings.MYSQL_PROTOCOL,
                                 Settings.MYSQL_PORT,
                                 Settings.MYSQL_DATABASE,
                                 {"charset": "utf8mb4"})
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """ 记录每次从连接池取连接的等待毫秒数(含新建连接), 交给 wait_observers, 供过载保护判断 """
+
+    wait_observers: List[Callable[[float], None]] = []
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            for observer in self.wait_observers:
+                observer(elapsed_ms)
+
+
 # 创建异步引擎
-async_engine = create_async_engine(async_database_url, echo=True, pool_size=50, pool_recycle=1500)
+async_engine = create_async_engine(async_database_url, echo=Settings.SQL_ECHO, poolclass=TimedQueuePool,
+                                   pool_size=50, pool_recycle=1500)
+
+# 只读副本引擎, 与主库使用相同的账号和库名
+replica_engines = [
+    create_async_engine(async_database_url.set(host=host, port=int(port or Settings.MYSQL_PORT)),
+                        echo=Settings.SQL_ECHO, poolclass=TimedQueuePool, pool_size=50, pool_recycle=1500)
+    for host, _, port in (item.strip().partition(":") for item in Settings.MYSQL_REPLICA_HOSTS.split(",")
+                          if item.strip())
+]
 
 # 初始化Session工厂
 async_session_maker = async_sessionmaker(
@@ -36,6 +66,43 @@ async_session_maker = async_sessionmaker(
 )
 
 
+# 按 (模型, 别名, 是否排除None) 缓存的序列化函数
+_serializers: Dict[tuple, Callable[[object], dict]] = {}
+
+
+def _build_serializer(orm_table, alias_dict: dict, exclude_none: bool) -> Callable[[object], dict]:
+    """
+    生成模型专用的序列化函数
+    Notes:
+        已加载的列一次 itemgetter 从实例 __dict__ 中取出, 跳过属性描述符;
+        有未加载或已过期的列时退回属性访问, 与 getattr 的行为一致
+    """
+    names = tuple(c.name for c in orm_table.__table__.columns)
+    keys = tuple(alias_dict.get(name, name) for name in names)
+    if len(names) == 1:
+        # 单个参数时 itemgetter/attrgetter 返回的不是元组
+        from_dict = lambda data: (data[names[0]],)  # noqa: E731
+        from_attrs = lambda obj: (getattr(obj, names[0]),)  # noqa: E731
+    else:
+        from_dict = operator.itemgetter(*names)
+        from_attrs = operator.attrgetter(*names)
+
+    def values(obj) -> tuple:
+        try:
+            return from_dict(obj.__dict__)
+        except KeyError:
+            return from_attrs(obj)
+
+    if exclude_none:
+        def serialize(obj) -> dict:
+            return {key: value for key, value in zip(keys, values(obj)) if value is not None}
+    else:
+        def serialize(obj) -> dict:
+            return dict(zip(keys, values(obj)))
+
+    return serialize
+
+
 class BaseOrmTable(AsyncAttrs, DeclarativeBase):
     """SQLAlchemy Base ORM Model"""
 
@@ -46,6 +113,21 @@ class BaseOrmTable(AsyncAttrs, DeclarativeBase):
     def __repr__(self):
         return str(self.to_dict())
 
+    @classmethod
+    def serializer(cls, alias_dict: dict = None, exclude_none=True) -> Callable[[object], dict]:
+        """
+        获取模型的序列化函数, 首次使用时生成并缓存
+        Args:
+            alias_dict: 字段别名字典
+            exclude_none: 默认排查None值
+        Returns: 接收模型实例返回 dict 的函数
+        """
+        cache_key = (cls, tuple(sorted(alias_dict.items())) if alias_dict else (), exclude_none)
+        serialize = _serializers.get(cache_key)
+        if serialize is None:
+            serialize = _serializers[cache_key] = _build_serializer(cls, alias_dict or {}, exclude_none)
+        return serialize
+
     def to_dict(self, alias_dict: dict = None, exclude_none=True) -> dict:
         """
         数据库模型转成字典
@@ -55,15 +137,15 @@ class BaseOrmTable(AsyncAttrs, DeclarativeBase):
             exclude_none: 默认排查None值
         Returns: dict
         """
-        alias_dict = alias_dict or {}
-        if exclude_none:
-            return {
-                alias_dict.get(c.name, c.name): getattr(self, c.name)
-                for c in self.__table__.columns
-                if getattr(self, c.name) is not None
-            }
-        else:
-            return {alias_dict.get(c.name, c.name): getattr(self, c.name, None) for c in self.__table__.columns}
+        return self.serializer(alias_dict, exclude_none)(self)
+
+    @classmethod
+    def to_dicts(cls, orm_objs: List["BaseOrmTable"], alias_dict: dict = None, exclude_none=True) -> List[dict]:
+        """
+        批量转成字典, 整批共用一个序列化函数
+        eg: UserModel.to_dicts(await UserManager().query_all())
+        """
+        return list(map(cls.serializer(alias_dict, exclude_none), orm_objs))
 
 
 class TimestampColumns(AsyncAttrs, DeclarativeBase):
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/3 20:15
+@Author   : wiesZheng
+@Software : PyCharm
+
+基于指纹的建表同步, 替代每次启动都执行 metadata.create_all
+
+    python -m app.models.schema_sync --env prod          # 发布时单独执行, 应用变更
+    python -m app.models.schema_sync --env prod --check  # 只比较指纹
+"""
+import argparse
+import asyncio
+import hashlib
+import importlib
+import sys
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+
+from loguru import logger
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text, update
+from sqlalchemy.engine import Dialect
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+# 指纹的计算方式变化时递增, 使旧指纹失效
+FINGERPRINT_VERSION = 1
+SCHEMA_LOCK_NAME = "alden_schema_sync"
+
+# 版本表不属于 BaseOrmTable.metadata, 不参与指纹计算
+schema_version_table = Table(
+    "alden_schema_version",
+    MetaData(),
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("fingerprint", String(64), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+UNCHANGED = "unchanged"
+APPLIED = "applied"
+PENDING = "pending"
+
+
+def schema_fingerprint(metadata: MetaData, dialect: Dialect) -> str:
+    """
+    元数据指纹: 按表名排序后, 对每张表的建表语句与索引语句做 sha256
+    Notes:
+        只在进程内编译 DDL, 不访问数据库
+    """
+    digest = hashlib.sha256(f"v{FINGERPRINT_VERSION}:{dialect.name}".encode())
+    for table in sorted(metadata.tables.values(), key=lambda t: t.fullname):
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return digest.hexdigest()
+
+
+async def read_fingerprint(engine: AsyncEngine) -> Optional[str]:
+    """ 读取已应用的指纹, 版本表不存在时返回 None """
+    async with engine.connect() as conn:
+        return await _read_fingerprint(conn)
+
+
+async def _read_fingerprint(conn: AsyncConnection) -> Optional[str]:
+    try:
+        cursor_result = await conn.execute(
+            select(schema_version_table.c.fingerprint).where(schema_version_table.c.id == 1)
+        )
+    except DBAPIError:
+        # 首次部署, 版本表还没有创建
+        await conn.rollback()
+        return None
+    return cursor_result.scalar()
+
+
+@asynccontextmanager
+async def advisory_lock(conn: AsyncConnection, timeout: int):
+    """
+    数据库级别的咨询锁, 保证同一时间只有一个进程执行 DDL
+    Notes:
+        mysql: GET_LOCK/RELEASE_LOCK; postgresql: pg_advisory_lock; 其他数据库(sqlite)不加锁
+    """
+    dialect_name = conn.dialect.name
+    if dialect_name == "mysql":
+        acquired = (await conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"), {"name": SCHEMA_LOCK_NAME, "timeout": timeout}
+        )).scalar()
+        if acquired != 1:
+            raise TimeoutError(f"acquire schema lock {SCHEMA_LOCK_NAME} timeout after {timeout}s")
+        release_sql, params = text("SELECT RELEASE_LOCK(:name)"), {"name": SCHEMA_LOCK_NAME}
+    elif dialect_name == "postgresql":
+        key = zlib.crc32(SCHEMA_LOCK_NAME.encode())
+        await conn.execute(text(f"SET lock_timeout = {int(timeout * 1000)}"))
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": key})
+        release_sql, params = text("SELECT pg_advisory_unlock(:key)"), {"key": key}
+    else:
+        release_sql, params = None, None
+
+    try:
+        yield
+    finally:
+        if release_sql is not None:
+            await conn.execute(release_sql, params)
+
+
+async def _write_fingerprint(conn: AsyncConnection, fingerprint: str):
+    values = {"fingerprint": fingerprint, "applied_at": datetime.now()}
+    cursor_result = await conn.execute(
+        update(schema_version_table).where(schema_version_table.c.id == 1).values(**values)
+    )
+    if cursor_result.rowcount == 0:
+        await conn.execute(schema_version_table.insert().values(id=1, **values))
+
+
+async def sync_schema(engine: AsyncEngine, metadata: MetaData, *, apply: bool = True, lock_timeout: int = 60) -> str:
+    """
+    按指纹同步库表
+    Args:
+        engine: 主库引擎
+        metadata: orm 元数据
+        apply: 指纹不一致时是否执行建表, False 时只返回 PENDING
+        lock_timeout: 等待咨询锁的秒数
+
+    Notes:
+        指纹一致时只有一次主键查询, 启动耗时与表数量、worker 数量无关;
+        不一致时由抢到咨询锁的进程执行 create_all 并写入新指纹, 其余进程等锁释放后重新比较指纹直接跳过;
+        与 create_all 相同, 只创建缺失的表和索引, 不修改已有表结构
+
+    Returns: UNCHANGED / APPLIED / PENDING
+    """
+    fingerprint = schema_fingerprint(metadata, engine.dialect)
+    if await read_fingerprint(engine) == fingerprint:
+        return UNCHANGED
+    if not apply:
+        return PENDING
+
+    async with engine.connect() as conn:
+        async with advisory_lock(conn, lock_timeout):
+            # 等锁期间其他进程可能已经完成同步
+            if await _read_fingerprint(conn) == fingerprint:
+                await conn.commit()
+                return UNCHANGED
+            await conn.run_sync(metadata.create_all)
+            await conn.run_sync(schema_version_table.create, checkfirst=True)
+            await _write_fingerprint(conn, fingerprint)
+            await conn.commit()
+    logger.info(f"schema synced, fingerprint {fingerprint[:12]}")
+    return APPLIED
+
+
+def import_models():
+    """ 与应用启动时相同, 通过加载路由导入用到的模型, 保证元数据一致 """
+    importlib.import_module("app.apis.v1")
+
+
+async def main(check: bool):
+    from app.models import BaseOrmTable, async_engine
+    from config import Settings
+
+    import_models()
+    status = await sync_schema(
+        async_engine, BaseOrmTable.metadata, apply=not check, lock_timeout=Settings.SCHEMA_SYNC_LOCK_TIMEOUT
+    )
+    await async_engine.dispose()
+    logger.info(f"schema {status}")
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="schema sync")
+    parser.add_argument("--check", action="store_true", help="只比较指纹, 不执行建表")
+    args, _ = parser.parse_known_args()
+    sys.exit(1 if asyncio.run(main(args.check)) == PENDING else 0)
@@ -10,7 +10,7 @@ import argparse
 import os
 import sys
 from functools import lru_cache
-from typing import ClassVar
+from typing import ClassVar, Dict, List
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -38,6 +38,72 @@ class AppConfigSettings(BaseSettings):
 
     # SalAlchemy配置
     ASYNC_DATABASE_URI: str
+    # 是否输出 SQLAlchemy 原始 SQL 日志(同步写日志, 仅调试时开启)
+    SQL_ECHO: bool = False
+    # 启动时的建表同步: auto 指纹变化时抢锁建表, check 只比较指纹(由 python -m app.models.schema_sync 建表), off 跳过
+    SCHEMA_SYNC_MODE: str = "auto"
+    SCHEMA_SYNC_LOCK_TIMEOUT: int = 60
+
+    # SQL 埋点: 是否启用、慢查询阈值毫秒、慢查询日志采样率(0~1)、按路由聚合的最多路由数(超出的归入 <other>)
+    QUERY_STATS_ENABLED: bool = True
+    SLOW_QUERY_THRESHOLD_MS: int = 200
+    SLOW_QUERY_SAMPLE_RATE: float = 1.0
+    QUERY_STATS_MAX_ROUTES: int = 500
+    # 索引建议: 记录查询模式的采样率, 0 为关闭
+    INDEX_ADVISOR_SAMPLE_RATE: float = 0.05
+
+    # 请求日志: 查询参数与请求体的采样率(0~1)、按路径前缀覆盖的采样率、请求体最多记录的字节数
+    LOG_SAMPLE_RATE: float = 1.0
+    LOG_ROUTE_SAMPLE_RATES: Dict[str, float] = {}
+    LOG_BODY_MAX_BYTES: int = 4096
+
+    # JSON 响应的 gzip 压缩: 最小字节数(0 为关闭)、压缩级别
+    GZIP_MIN_SIZE: int = 1024
+    GZIP_LEVEL: int = 5
+
+    # 链路追踪: 请求采样率(0~1, 带 traceparent 的请求沿用上游的采样标记)、span 导出的采集端点(为空则不发送)
+    TRACE_SAMPLE_RATE: float = 0.1
+    TRACE_EXPORT_ENDPOINT: str = ""
+
+    # 只读副本, 逗号分隔的 host:port, 为空则读写都走主库
+    MYSQL_REPLICA_HOSTS: str = ""
+    # 写入后该表的读操作走主库的秒数(read-your-writes)
+    READ_YOUR_WRITES_SECONDS: float = 2
+    # 副本复制延迟超过该秒数则不再路由读请求
+    REPLICA_MAX_LAG_SECONDS: int = 5
+    REPLICA_HEALTH_CHECK_INTERVAL: int = 10
+
+    # redis配置, 为空则不启用 redis
+    REDIS_DSN: str = ""
+
+    # 主键查询缓存: 进程内缓存容量、进程内缓存过期秒数、redis 缓存默认过期秒数
+    ENTITY_CACHE_LOCAL_MAXSIZE: int = 4096
+    ENTITY_CACHE_LOCAL_TTL: int = 5
+    ENTITY_CACHE_REDIS_TTL: int = 300
+
+    # 接口响应缓存: 进程内缓存容量、启用 redis 时进程内缓存的过期秒数
+    RESPONSE_CACHE_LOCAL_MAXSIZE: int = 1024
+    RESPONSE_CACHE_LOCAL_TTL: int = 5
+
+    # 限流: 令牌桶的每秒补充令牌数与桶容量, rate 为 0 表示不限制该维度; 用户按 Authorization 区分, 未登录的请求只按 IP 限制
+    # 默认关闭; 部署在反向代理之后开启时须同时设置 RATE_LIMIT_TRUST_FORWARDED=True, 否则所有客户端共用代理 IP 的桶
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_USER_RATE: float = 20
+    RATE_LIMIT_USER_BURST: int = 40
+    RATE_LIMIT_IP_RATE: float = 50
+    RATE_LIMIT_IP_BURST: int = 100
+    # 按路径前缀的限流(所有调用方共用一个桶), eg: {"/api/v1/common/upload": [5, 10]} 即每秒 5 个、桶容量 10
+    RATE_LIMIT_ROUTES: Dict[str, List[float]] = {}
+    # 部署在反向代理之后时, 客户端 IP 取 X-Forwarded-For 的第一个地址; 仅在代理会覆盖该请求头时开启, 否则客户端可伪造 IP
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
+    # 不限流、不丢弃的路径前缀
+    RATE_LIMIT_EXEMPT_PATHS: List[str] = ["/docs", "/openapi.json", "/static"]
+
+    # 过载保护: 事件循环延迟、连接池取连接等待的阈值毫秒(0 为不检查该指标), 超过阈值按比例丢弃请求并返回 503
+    # 默认关闭, 与限流一样需要显式开启; 关闭时不启动采样任务, 请求也不做丢弃判断
+    SHED_ENABLED: bool = False
+    SHED_LOOP_LAG_MS: int = 200
+    SHED_POOL_WAIT_MS: int = 500
 
     # 日志配置
     LOG_ERROR: str
@@ -74,6 +140,18 @@ class AppConfigSettings(BaseSettings):
     # 错误时的日志文件
     ERROR_LOG_FILE: str = os.path.join(LOG_DIR, 'error.log')
 
+    # 慢查询日志文件
+    SLOW_QUERY_LOG_FILE: str = os.path.join(LOG_DIR, 'slow_query.log')
+
+    # 静态资源预压缩文件目录
+    STATIC_BUILD_DIR: str = os.path.join(ROOT, 'static', 'dist')
+
+    # 链路追踪 span 文件(JSON Lines), 默认为空不写文件, 需要时配置为 os.path.join(LOG_DIR, 'spans.jsonl')
+    TRACE_EXPORT_FILE: str = ""
+    # span 文件超过该字节数后滚动为 spans.jsonl.1 ... 最多保留 TRACE_EXPORT_FILE_BACKUPS 个
+    TRACE_EXPORT_FILE_MAX_BYTES: int = 10 * 1024 * 1024
+    TRACE_EXPORT_FILE_BACKUPS: int = 5
+
     # 项目日志滚动配置（日志文件超过10 MB就自动新建文件扩充）
     LOGGING_ROTATION: str = "10 MB"
     LOGGING_CONF: dict = {
@@ -91,6 +169,12 @@ class AppConfigSettings(BaseSettings):
             'backtrace': True,
             'diagnose': True,
         },
+        'slow_query_handler': {
+            'file': SLOW_QUERY_LOG_FILE,
+            'level': 'WARNING',
+            'rotation': LOGGING_ROTATION,
+            'filter': lambda record: record["extra"].get("name") == "slow_query",
+        },
     }
 
     BANNER: str = """
@@ -10,8 +10,16 @@ from art import text2art
 from loguru import logger
 from app import alden, init_logging, init_create_table
 from app.apis import register_routers
+from app.commons.client import create_redis_client
+from app.commons.rate_limit import load_shedder, rate_limiter
+from app.commons.response_cache import response_cache
+from app.commons.tracing import tracer
+from app.crud.entity_cache import entity_cache
+from app.crud.instrumentation import query_stats
+from app.crud.routing import replica_router
 from app.exceptions import register_global_exceptions_handler
 from app.middlewares import register_middlewares
+from app.models import async_engine, replica_engines
 
 from config import Settings
 
@@ -23,6 +31,8 @@ logger.info("middlewares is register success！！")
 # 注册全局异常处理器
 register_global_exceptions_handler(alden)
 logger.info("global exceptions is register success！！！")
+# SQL 埋点
+query_stats.instrument(async_engine, *replica_engines)
 
 
 @alden.on_event('startup')
@@ -39,7 +49,26 @@ async def startup_event():
         logger.info(f"database and tables  created failed.        ❌")
         raise e
 
+    # step6 主键查询缓存、接口响应缓存启用 redis 二级缓存, 限流令牌桶多 worker 共享
+    redis_client = create_redis_client()
+    entity_cache.bind_redis(redis_client)
+    response_cache.bind_redis(redis_client)
+    rate_limiter.bind_redis(redis_client)
+
+    # step7 只读副本健康检查
+    replica_router.start(Settings.REPLICA_HEALTH_CHECK_INTERVAL)
+
+    # step8 链路追踪 span 批量导出
+    tracer.exporter.start()
+
+    # step9 过载保护: 事件循环延迟与连接池等待采样(SHED_ENABLED 开启时)
+    load_shedder.start()
+
 
 @alden.on_event("shutdown")
 async def shutdown_event():
-    pass
+    await replica_router.close()
+    await tracer.exporter.close()
+    await load_shedder.close()
+    if entity_cache.redis is not None:
+        await entity_cache.redis.aclose()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/21 21:10
+@Author   : wiesZheng
+@Software : PyCharm
+
+list_page 端到端耗时对比: 旧实现(同一 session 上 asyncio.gather) vs 并发双连接 vs 一致性快照
+
+    python test/bench_list_page.py --env dev --rounds 200 --page 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import column, func  # noqa: E402
+
+from app.crud import BaseManager  # noqa: E402
+from app.models import async_engine, async_session_maker  # noqa: E402
+from app.models.operation_log import OperationLog  # noqa: E402
+
+
+class OperationLogManager(BaseManager):
+    orm_table = OperationLog
+
+
+async def legacy_list_page(manager: BaseManager, curr_page: int, page_size: int, session=None):
+    """ 改造前的实现: 总数与数据共用调用方 session 并 gather """
+    offset = (curr_page - 1) * page_size
+    return await asyncio.gather(
+        manager.query_one(cols=[func.count()], orders=[column("id")], flat=True, session=session),
+        manager.query_all(orders=[column("id")], limit=page_size, offset=offset, session=session),
+    )
+
+
+async def timed(label: str, rounds: int, factory):
+    costs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await factory()
+        costs.append((time.perf_counter() - start) * 1000)
+    costs.sort()
+    print(
+        f"{label:<28} avg={statistics.mean(costs):8.3f}ms "
+        f"p50={costs[len(costs) // 2]:8.3f}ms p95={costs[int(len(costs) * 0.95) - 1]:8.3f}ms"
+    )
+
+
+async def main(rounds: int, curr_page: int, page_size: int):
+    manager = OperationLogManager()
+
+    async def legacy_with_session():
+        async with async_session_maker() as session:
+            async with session.begin():
+                return await legacy_list_page(manager, curr_page, page_size, session=session)
+
+    async def legacy_without_session():
+        return await legacy_list_page(manager, curr_page, page_size)
+
+    async def caller_session():
+        async with async_session_maker() as session:
+            async with session.begin():
+                return await manager.list_page(curr_page=curr_page, page_size=page_size, session=session)
+
+    await timed("legacy(session=caller)", rounds, legacy_with_session)
+    await timed("legacy(session=None)", rounds, legacy_without_session)
+    await timed("list_page(session=caller)", rounds, caller_session)
+    await timed("list_page(parallel)", rounds, lambda: manager.list_page(curr_page=curr_page, page_size=page_size))
+    await timed(
+        "list_page(snapshot)", rounds,
+        lambda: manager.list_page(curr_page=curr_page, page_size=page_size, snapshot=True)
+    )
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="list_page benchmark")
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=20)
+    args, _ = parser.parse_known_args()
+    asyncio.run(main(args.rounds, args.page, args.page_size))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/4 20:30
+@Author   : wiesZheng
+@Software : PyCharm
+
+日志中间件吞吐: 旧版 BaseHTTPMiddleware(request.json() + f-string) vs 纯 ASGI LoggingMiddleware
+在进程内通过 ASGI 调用, 日志写入 os.devnull, 只比较中间件本身的开销
+
+    python test/bench_logging_middleware.py --env dev --requests 5000 --body-kb 8
+    python test/bench_logging_middleware.py --env dev --level WARNING   # 日志级别关闭时的开销
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import shortuuid  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from loguru import logger  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.middlewares.middlewares import LoggingMiddleware  # noqa: E402
+
+
+class LegacyLoggingMiddleware(BaseHTTPMiddleware):
+    """ 替换前的实现, 作为对照 """
+
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.perf_counter()
+        request.state.traceid = shortuuid.uuid()
+        logger.info(f"--> {request.state.traceid} {request.method} {request.url.path} {request.client.host}")
+        if request.query_params:
+            logger.info(f"--> {request.state.traceid} Query Params: {request.query_params}")
+        if "application/json" in request.headers.get("Content-Type", ""):
+            try:
+                body = await request.json()
+                logger.info(f"--> {request.state.traceid} Body: {body}")
+            except Exception as e:
+                logger.warning(f"Failed to parse JSON body: {e}")
+        response = await call_next(request)
+        process_time = time.perf_counter() - start_time
+        response.headers["X-Response-Time"] = f"{process_time:.6f}s"
+        logger.info(
+            f"<-- {request.state.traceid} {response.status_code} {request.url.path} (took: {process_time:.6f}s)\n")
+        return response
+
+
+def create_app(middleware, **options) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/items")
+    async def create_item(request: Request):
+        body = await request.body()
+        return {"size": len(body), "traceid": request.state.traceid}
+
+    app.add_middleware(middleware, **options)
+    return app
+
+
+async def run(app: FastAPI, payload: bytes, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Content-Type": "application/json"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(count: int):
+            for _ in range(count):
+                response = await client.post("/items?page=1&size=20", content=payload, headers=headers)
+                assert response.status_code == 200 and "X-Response-Time" in response.headers
+
+        await worker(concurrency * 5)  # 预热
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(total // concurrency) for _ in range(concurrency)])
+        return total / (time.perf_counter() - start)
+
+
+async def main(total: int, concurrency: int, body_kb: int, level: str):
+    logger.remove()
+    logger.add(open(os.devnull, "w"), level=level)
+    payload = ('{"items": [' + ",".join(['{"name": "case", "value": 1}'] * (body_kb * 1024 // 30)) + "]}").encode()
+
+    cases = (
+        ("BaseHTTPMiddleware", create_app(LegacyLoggingMiddleware)),
+        ("ASGI sample=1", create_app(LoggingMiddleware, sample_rate=1.0)),
+        ("ASGI sample=0.1", create_app(LoggingMiddleware, sample_rate=0.1)),
+    )
+    for label, app in cases:
+        rps = await run(app, payload, total, concurrency)
+        print(f"{label:<20} body={len(payload) // 1024}KiB level={level:<8} {rps:10.1f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="logging middleware benchmark")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--body-kb", type=int, default=8)
+    parser.add_argument("--level", type=str, default="INFO")
+    args, _ = parser.parse_known_args()
+    asyncio.run(main(args.requests, args.concurrency, args.body_kb, args.level))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/29 21:10
+@Author   : wiesZheng
+@Software : PyCharm
+
+query_all 每 1 万行的耗时与内存: orm 实例 + to_dict vs 命名元组投影 vs schema 投影
+
+    python test/bench_projection.py --env dev --rows 10000 --rounds 20
+"""
+import argparse
+import asyncio
+import gc
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import BaseModel  # noqa: E402
+
+from app.crud import BaseManager  # noqa: E402
+from app.models import async_engine  # noqa: E402
+from app.models.operation_log import OperationLog  # noqa: E402
+
+
+class OperationLogManager(BaseManager):
+    orm_table = OperationLog
+
+
+class OperationLogOut(BaseModel):
+    id: int
+    user_id: int
+    operate_time: datetime
+    title: str
+    description: Optional[str] = None
+    tag: Optional[str] = None
+    mode: int
+    key: Optional[int] = None
+
+
+async def measure(label: str, rounds: int, rows: int, factory):
+    costs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await factory()
+        costs.append((time.perf_counter() - start) * 1000)
+
+    # 单独一轮统计结果集的内存峰值
+    gc.collect()
+    tracemalloc.start()
+    result = await factory()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_10k = 10000 / max(len(result), 1)
+    print(
+        f"{label:<26} rows={len(result):<6} avg={statistics.mean(costs) * per_10k:9.3f}ms/10k "
+        f"p50={sorted(costs)[len(costs) // 2] * per_10k:9.3f}ms/10k peak={peak / 1024 / 1024 * per_10k:8.2f}MiB/10k"
+    )
+    del result
+
+
+async def main(rows: int, rounds: int):
+    manager = OperationLogManager()
+
+    async def orm_to_dict():
+        return OperationLog.to_dicts(await manager.query_all(limit=rows))
+
+    await manager.query_all(limit=rows)  # 预热连接池与语句缓存
+    await measure("orm + to_dict", rounds, rows, orm_to_dict)
+    await measure("orm instances", rounds, rows, lambda: manager.query_all(limit=rows))
+    await measure("as_tuples", rounds, rows, lambda: manager.query_all(limit=rows, as_tuples=True))
+    await measure(
+        "schema_to_select", rounds, rows, lambda: manager.query_all(limit=rows, schema_to_select=OperationLogOut)
+    )
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="row projection benchmark")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args, _ = parser.parse_known_args()
+    asyncio.run(main(args.rows, args.rounds))
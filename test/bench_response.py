@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/30 21:15
+@Author   : wiesZheng
+@Software : PyCharm
+
+列表接口的响应序列化吞吐: FastAPI 默认(jsonable_encoder + JSONResponse) vs RRoute + RJSONResponse(orjson)
+在进程内通过 ASGI 调用, 只比较框架内的序列化开销, 不含网络与数据库
+
+    python test/bench_response.py --env dev --rows 100 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+from fastapi import APIRouter, FastAPI  # noqa: E402
+
+from app.commons import R  # noqa: E402
+from app.commons.response import RJSONResponse, RRoute  # noqa: E402
+
+
+def make_rows(count: int) -> list:
+    now = datetime.now()
+    return [
+        {
+            "id": idx,
+            "user_id": idx % 50,
+            "title": f"operation {idx}",
+            "description": "update test case" * 4,
+            "tag": None,
+            "mode": idx % 3,
+            "operate_time": now - timedelta(minutes=idx),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for idx in range(count)
+    ]
+
+
+def create_app(rows: list) -> FastAPI:
+    legacy = APIRouter(prefix="/legacy")
+    fast = APIRouter(prefix="/fast", route_class=RRoute)
+
+    @legacy.get("/logs")
+    async def legacy_logs():
+        return R.success(data={"total": len(rows), "list": rows})
+
+    @fast.get("/logs")
+    async def fast_logs():
+        return R.success(data={"total": len(rows), "list": rows})
+
+    app = FastAPI()
+    app.include_router(legacy)
+    app.include_router(fast, default_response_class=RJSONResponse)
+    return app
+
+
+async def run(client: httpx.AsyncClient, url: str, total: int, concurrency: int) -> float:
+    async def worker(count: int):
+        for _ in range(count):
+            response = await client.get(url)
+            assert response.status_code == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(total // concurrency) for _ in range(concurrency)])
+    return total / (time.perf_counter() - start)
+
+
+async def main(row_count: int, total: int, concurrency: int):
+    app = create_app(make_rows(row_count))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        legacy_body = (await client.get("/legacy/logs")).json()
+        fast_body = (await client.get("/fast/logs")).json()
+        assert legacy_body == fast_body, "响应内容不一致"
+
+        for label, url in (("jsonable_encoder", "/legacy/logs"), ("orjson RRoute", "/fast/logs")):
+            await run(client, url, concurrency * 10, concurrency)  # 预热
+            rps = await run(client, url, total, concurrency)
+            print(f"{label:<18} rows={row_count:<5} {rps:10.1f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="response serialization benchmark")
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args, _ = parser.parse_known_args()
+    asyncio.run(main(args.rows, args.requests, args.concurrency))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/7/27 21:30
+@Author   : wiesZheng
+@Software : PyCharm
+
+模拟一个调用 5 次 BaseManager 的接口, 对比每次调用独立会话 vs 请求级共享会话(unit_of_work)
+的耗时、连接池取连接次数与提交次数
+
+    python test/bench_unit_of_work.py --env dev --rounds 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import column, event  # noqa: E402
+
+from app.crud import BaseManager  # noqa: E402
+from app.crud.unit_of_work import unit_of_work  # noqa: E402
+from app.models import async_engine  # noqa: E402
+from app.models.operation_log import OperationLog  # noqa: E402
+
+
+class OperationLogManager(BaseManager):
+    orm_table = OperationLog
+
+
+class Counter:
+    def __init__(self):
+        self.checkouts = 0
+        self.commits = 0
+        self.statements = 0
+
+    def listen(self, engine):
+        event.listen(engine.sync_engine.pool, "checkout", self._on_checkout)
+        event.listen(engine.sync_engine, "commit", self._on_commit)
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_checkout(self, *args):
+        self.checkouts += 1
+
+    def _on_commit(self, *args):
+        self.commits += 1
+
+    def _on_execute(self, *args):
+        self.statements += 1
+
+    def reset(self):
+        self.checkouts = self.commits = self.statements = 0
+
+
+async def handler(manager: BaseManager):
+    """ 典型接口: 查总数 + 查一页 + 按主键查 + 按条件查单条 + 查总数 """
+    await manager.count()
+    rows = await manager.query_all(orders=[column("id")], limit=20)
+    if rows:
+        await manager.query_by_id(rows[0].id)
+        await manager.query_one(conds=[manager.orm_table.id == rows[-1].id])
+    await manager.count()
+
+
+async def timed(label: str, rounds: int, factory, counter: Counter):
+    costs = []
+    counter.reset()
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await factory()
+        costs.append((time.perf_counter() - start) * 1000)
+    costs.sort()
+    print(
+        f"{label:<22} avg={statistics.mean(costs):8.3f}ms p50={costs[len(costs) // 2]:8.3f}ms "
+        f"p95={costs[int(len(costs) * 0.95) - 1]:8.3f}ms "
+        f"checkouts/req={counter.checkouts / rounds:5.2f} commits/req={counter.commits / rounds:5.2f} "
+        f"statements/req={counter.statements / rounds:5.2f}"
+    )
+
+
+async def main(rounds: int):
+    manager = OperationLogManager()
+    counter = Counter()
+    counter.listen(async_engine)
+
+    async def with_unit_of_work():
+        async with unit_of_work():
+            await handler(manager)
+
+    await handler(manager)  # 预热连接池
+    await timed("session per call", rounds, lambda: handler(manager), counter)
+    await timed("unit_of_work", rounds, with_unit_of_work, counter)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="unit_of_work benchmark")
+    parser.add_argument("--rounds", type=int, default=100)
+    args, _ = parser.parse_known_args()
+    asyncio.run(main(args.rounds))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/9 20:10
+@Author   : wiesZheng
+@Software : PyCharm
+
+单元测试公共夹具: 使用 dev 环境配置, 数据库替换为临时目录下的 sqlite(aiosqlite)
+
+    pip install -r requirements-test.txt
+    python -m pytest test
+"""
+import os
+import sys
+
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+load_dotenv(os.path.join(ROOT, "conf", ".env.dev"))
+
+import pytest  # noqa: E402
+from minio import Minio  # noqa: E402
+
+# 导入 app 包时会加载路由并创建 MiNiOClient 检查 bucket, 单元测试不连接 minio
+Minio.bucket_exists = lambda self, bucket_name: True
+
+import pytest_asyncio  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine  # noqa: E402
+
+import app.crud as crud  # noqa: E402
+import app.crud.routing as routing  # noqa: E402
+import app.crud.unit_of_work as unit_of_work  # noqa: E402
+from app.crud import BaseManager  # noqa: E402
+from app.crud.entity_cache import entity_cache  # noqa: E402
+from app.commons.response_cache import response_cache  # noqa: E402
+from app.models import BaseOrmTable  # noqa: E402
+from app.models.report import Report  # noqa: E402
+
+
+class ReportManager(BaseManager):
+    orm_table = Report
+
+
+def _report_row(**kwargs) -> dict:
+    return {"executor": 1, "env": 1, "cost": "1s", "status": 0, "created_by": 1, "updated_by": 1, **kwargs}
+
+
+@pytest_asyncio.fixture
+async def session_maker(tmp_path, monkeypatch):
+    """ 每个用例一个新的 sqlite 库, 替换 BaseManager 默认使用的主库会话工厂 """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'alden.db'}")
+
+    # pysqlite 默认不在 SAVEPOINT 前发出 BEGIN, 由 SQLAlchemy 接管事务以支持 begin_nested 的回滚语义
+    @event.listens_for(engine.sync_engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    maker = async_sessionmaker(bind=engine, class_=AsyncSession, autocommit=False, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(BaseOrmTable.metadata.create_all, tables=[Report.__table__])
+
+    monkeypatch.setattr(crud, "async_session_maker", maker)
+    monkeypatch.setattr(routing, "async_session_maker", maker)
+    monkeypatch.setattr(unit_of_work, "async_session_maker", maker)
+    crud.BaseManager.statement_cache.clear()
+    entity_cache.clear_local()
+    response_cache.clear_local()
+    yield maker
+    await engine.dispose()
+
+
+@pytest.fixture
+def manager(session_maker) -> ReportManager:
+    return ReportManager()
+
+
+@pytest.fixture
+def report_row():
+    """ 生成 alden_report 的一行数据, 必填列之外的字段由调用方覆盖 """
+    return _report_row
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/11 15:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+METRICS = {"total": "count", "success": "success_count__sum", "executors": "executor__count_distinct"}
+
+
+@pytest_asyncio.fixture
+async def reports(manager, report_row):
+    day1, day2 = datetime(2024, 8, 1, 10), datetime(2024, 8, 2, 11)
+    await manager.bulk_add([
+        report_row(env=1, executor=1, success_count=1, created_at=day1),
+        report_row(env=1, executor=2, success_count=2, created_at=day1),
+        report_row(env=1, executor=2, success_count=3, created_at=day2),
+        report_row(env=2, executor=1, success_count=4, created_at=day2),
+        report_row(env=3, executor=1, success_count=0, created_at=day2),
+    ])
+
+
+async def test_group_by_and_metrics(manager, reports):
+    rows = await manager.aggregate(group_by="env", metrics=METRICS)
+    assert [row._asdict() for row in rows] == [
+        {"env": 1, "total": 3, "success": 6, "executors": 2},
+        {"env": 2, "total": 1, "success": 4, "executors": 1},
+        {"env": 3, "total": 1, "success": 0, "executors": 1},
+    ]
+
+    rows = await manager.aggregate(group_by=["created_at__day"], metrics={"total": "count"}, env=1)
+    assert [tuple(row) for row in rows] == [("2024-08-01", 2), ("2024-08-02", 1)]
+
+    rows = await manager.aggregate(metrics={"total": "count", "top": "success_count__max"}, env__in=[2, 3])
+    assert rows[0].total == 2 and rows[0].top == 4
+
+
+async def test_having_and_sorting(manager, reports):
+    rows = await manager.aggregate(
+        group_by="env", metrics=METRICS, having={"success__gt": 0}, sort_columns="success", sort_orders="desc"
+    )
+    assert [(row.env, row.success) for row in rows] == [(1, 6), (2, 4)]
+
+    # 相同结构不同取值复用缓存的语句模板, 参数重新绑定
+    rows = await manager.aggregate(
+        group_by="env", metrics=METRICS, having={"success__gt": 4}, sort_columns="success", sort_orders="desc"
+    )
+    assert [row.env for row in rows] == [1]
+
+    rows = await manager.aggregate(group_by="env", metrics=METRICS, having={"total": 1, "executors__lte": 1},
+                                   conds=[Report.success_count > 0])
+    assert [row.env for row in rows] == [2]
+
+
+@pytest.mark.parametrize("group_by, metrics, sort_columns, sort_orders, having", [
+    ([], {"total": "nope__sum"}, None, None, {}),
+    ([], {"total": "success_count__median"}, None, None, {}),
+    ([], {"total": "success_count"}, None, None, {}),
+    ([], {"p95": "success_count__p95"}, None, None, {}),
+    (["env"], {"env": "count"}, None, None, {}),
+    (["nope"], METRICS, None, None, {}),
+    (["created_at__week"], METRICS, None, None, {}),
+    (["env"], METRICS, ["executor"], None, {}),
+    (["env"], METRICS, ["total"], ["up"], {}),
+    (["env"], METRICS, ["total", "env"], ["asc"], {}),
+    (["env"], METRICS, None, None, {"executor__gt": 1}),
+    (["env"], METRICS, None, None, {"total__regexp": 1}),
+    (["env"], METRICS, None, None, {"total__or": {"gt": 1}}),
+])
+async def test_invalid_arguments(manager, group_by, metrics, sort_columns, sort_orders, having):
+    having_shape, _ = manager._filter_shape(having, prefix="h")
+    with pytest.raises(ValueError):
+        manager._build_aggregate(Report, "sqlite", group_by, metrics, (), sort_columns, sort_orders, having_shape)
+
+
+async def test_invalid_arguments_logged_not_raised(manager, reports):
+    # 与其他 with_session 方法一致, 参数错误记录日志后返回 None
+    assert await manager.aggregate(metrics={}) is None
+    assert await manager.aggregate(metrics={"total": "nope__sum"}) is None
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/9 21:00
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import pytest
+
+from app.crud.bulk import insert_rows, normalize_rows
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _report_ids(session_maker) -> dict:
+    async with session_maker() as session:
+        rows = await session.execute(Report.__table__.select().order_by(Report.id))
+        return {row.id: row.executor for row in rows}
+
+
+async def test_core_bulk_add_returns_ids_in_order(manager, report_row, session_maker):
+    ids = await manager.bulk_add([report_row(executor=i) for i in range(5)], core=True, return_ids=True)
+    assert ids == [1, 2, 3, 4, 5]
+    assert await _report_ids(session_maker) == {i + 1: i for i in range(5)}
+
+
+@pytest.mark.parametrize("returning", [True, False])
+async def test_insert_rows_mixed_explicit_and_generated_pk(session_maker, report_row, returning):
+    table = Report.__table__
+    rows = normalize_rows(table, [
+        report_row(executor=0), report_row(id=100, executor=1), report_row(id=101, executor=2),
+        report_row(executor=3), report_row(executor=4), report_row(id=50, executor=5),
+    ])
+    async with session_maker() as session:
+        async with session.begin():
+            conn = await session.connection()
+            # 关闭 executemany RETURNING 时走逐行插入的回退分支
+            conn.dialect.insert_executemany_returning_sort_by_parameter_order = returning
+            try:
+                ids = await insert_rows(session, table, rows, chunk_size=4, return_ids=True)
+            finally:
+                del conn.dialect.insert_executemany_returning_sort_by_parameter_order
+
+    assert ids[1:3] == [100, 101] and ids[5] == 50
+    stored = await _report_ids(session_maker)
+    assert len(set(ids)) == 6 and set(ids) == set(stored)
+    assert [stored[pk] for pk in ids] == [0, 1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("native", [True, False])
+async def test_bulk_upsert_rows_without_pk_are_inserted(manager, report_row, session_maker, monkeypatch, native):
+    if not native:
+        # 不支持原生 upsert 的方言走 INSERT + UPDATE 回退
+        monkeypatch.setattr("app.crud.bulk._native_upsert", lambda *args: None)
+    ret = await manager.bulk_upsert([report_row(id=None, executor=i) for i in range(3)])
+    assert ret == {"inserted": 3, "updated": 0}
+    assert sorted((await _report_ids(session_maker)).values()) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("native", [True, False])
+async def test_bulk_upsert_mixed_new_and_existing(manager, report_row, session_maker, monkeypatch, native):
+    if not native:
+        monkeypatch.setattr("app.crud.bulk._native_upsert", lambda *args: None)
+    await manager.bulk_add([report_row(id=1, executor=10), report_row(id=2, executor=20)], core=True)
+
+    ret = await manager.bulk_upsert([
+        report_row(id=1, executor=11),
+        report_row(id=None, executor=30),
+        report_row(id=5, executor=50),
+        report_row(id=2, executor=21),
+        report_row(id=None, executor=31),
+    ], update_columns=["executor"])
+    assert ret == {"inserted": 3, "updated": 2}
+
+    stored = await _report_ids(session_maker)
+    assert stored[1] == 11 and stored[2] == 21 and stored[5] == 50
+    assert sorted(executor for pk, executor in stored.items() if pk not in (1, 2, 5)) == [30, 31]
+
+
+@pytest.mark.parametrize("native", [True, False])
+async def test_bulk_upsert_duplicate_keys_in_one_chunk(manager, report_row, session_maker, monkeypatch, native):
+    if not native:
+        monkeypatch.setattr("app.crud.bulk._native_upsert", lambda *args: None)
+    await manager.bulk_add([report_row(id=1, executor=10)], core=True)
+    ret = await manager.bulk_upsert([
+        report_row(id=1, executor=11),
+        report_row(id=7, executor=70),
+        report_row(id=1, executor=12),
+        report_row(id=7, executor=71),
+    ], update_columns=["executor"])
+    # 同一批内重复的键: 第一次出现计为新增或更新, 之后都计为更新, 最后一条生效
+    assert ret == {"inserted": 1, "updated": 3}
+    assert await _report_ids(session_maker) == {1: 12, 7: 71}
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/9 20:40
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import pytest
+
+from app.crud.counting import CachedCount
+from app.crud.unit_of_work import unit_of_work
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_cached_count_invalidated_by_writes(manager, report_row):
+    strategy = CachedCount(ttl=600)
+    await manager.bulk_add([report_row() for _ in range(3)])
+    total, _ = await manager.list_page(count_strategy=strategy)
+    assert total == 3
+
+    await manager.add(report_row())
+    total, rows = await manager.list_page(count_strategy=strategy)
+    assert total == 4 and len(rows) == 4
+
+    await manager.delete(conds=[Report.id == rows[0].id])
+    total, _ = await manager.list_page(count_strategy=strategy)
+    assert total == 3
+
+
+async def test_cached_count_in_unit_of_work(manager, report_row):
+    strategy = CachedCount(ttl=600)
+    assert await manager.count(strategy=strategy) == 0
+    async with unit_of_work():
+        await manager.add(report_row())
+        # 共享会话内的后续统计能看到本请求的写入
+        assert await manager.count(strategy=strategy) == 1
+    assert await manager.count(strategy=strategy) == 1
+
+
+async def test_cached_count_hits_without_writes(manager, report_row, session_maker):
+    strategy = CachedCount(ttl=600)
+    await manager.add(report_row())
+    assert await manager.count(strategy=strategy) == 1
+    # 绕过 BaseManager 的写入要等 ttl 过期
+    async with session_maker() as session:
+        session.add(Report(**report_row()))
+        await session.commit()
+    assert await manager.count(strategy=strategy) == 1
+    assert await manager.count() == 2
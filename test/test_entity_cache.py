@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/9 21:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import fakeredis.aioredis
+import pytest
+
+from app.crud import BaseManager
+from app.crud.entity_cache import EntityCache, entity_cache
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def redis():
+    # 内存中的 redis 替身, 同一个实例模拟多个 worker 共享的 redis
+    return fakeredis.aioredis.FakeRedis()
+
+
+def make_cache(redis=None, local_ttl: float = 5) -> EntityCache:
+    cache = EntityCache(local_ttl=local_ttl, redis_ttl=60)
+    cache.register(Report)
+    cache.bind_redis(redis)
+    return cache
+
+
+class Loader:
+    """ 记录查库次数, on_load 模拟查库期间发生的并发写入 """
+
+    def __init__(self, report_row, on_load=None, **values):
+        self.row = report_row(id=1, **values)
+        self.on_load = on_load
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.on_load is not None:
+            await self.on_load()
+        return Report(**self.row)
+
+
+async def test_local_hit(report_row):
+    cache, loader = make_cache(), Loader(report_row, executor=7)
+    first = await cache.get_or_load(Report, 1, loader)
+    second = await cache.get_or_load(Report, 1, loader)
+    assert loader.calls == 1
+    assert first.executor == second.executor == 7
+    assert cache.stats()["alden_report"]["local_hits"] == 1
+
+
+async def test_redis_shared_between_workers(report_row, redis):
+    worker_a, worker_b = make_cache(redis), make_cache(redis)
+    loader = Loader(report_row, executor=7)
+    await worker_a.get_or_load(Report, 1, loader)
+    obj = await worker_b.get_or_load(Report, 1, loader)
+    assert loader.calls == 1 and obj.executor == 7
+    assert worker_b.stats()["alden_report"]["redis_hits"] == 1
+
+
+@pytest.mark.parametrize("pk_ids", [[1], None])
+async def test_invalidate_across_workers(report_row, redis, pk_ids):
+    worker_a, worker_b = make_cache(redis), make_cache(redis, local_ttl=0)
+    loader = Loader(report_row)
+    await worker_a.get_or_load(Report, 1, loader)
+    await worker_b.get_or_load(Report, 1, loader)
+    assert loader.calls == 1
+
+    await worker_a.invalidate(Report, pk_ids)
+    await worker_a.get_or_load(Report, 1, loader)
+    assert loader.calls == 2
+    # 重新回填后其他 worker 命中新条目
+    await worker_b.get_or_load(Report, 1, loader)
+    assert loader.calls == 2
+
+
+@pytest.mark.parametrize("with_redis", [True, False])
+@pytest.mark.parametrize("pk_ids", [[1], None])
+async def test_invalidate_during_load_is_not_overwritten(report_row, redis, with_redis, pk_ids):
+    cache = make_cache(redis if with_redis else None)
+    # 查库读到旧数据后、回填前, 另一个请求提交了更新并失效缓存
+    stale = Loader(report_row, on_load=lambda: cache.invalidate(Report, pk_ids), executor=1)
+    assert (await cache.get_or_load(Report, 1, stale)).executor == 1
+
+    fresh = Loader(report_row, executor=2)
+    assert (await cache.get_or_load(Report, 1, fresh)).executor == 2
+    assert fresh.calls == 1
+    # 其他 worker 也不会读到旧数据
+    other = make_cache(redis if with_redis else None, local_ttl=0)
+    assert (await other.get_or_load(Report, 1, Loader(report_row, executor=3))).executor in (2, 3)
+
+
+async def test_invalidate_during_load_of_other_worker(report_row, redis):
+    worker_a, worker_b = make_cache(redis), make_cache(redis, local_ttl=0)
+    stale = Loader(report_row, on_load=lambda: worker_b.invalidate(Report, [1]), executor=1)
+    await worker_a.get_or_load(Report, 1, stale)
+
+    fresh = Loader(report_row, executor=2)
+    assert (await worker_b.get_or_load(Report, 1, fresh)).executor == 2
+    assert fresh.calls == 1
+
+
+async def test_redis_failure_falls_back_to_loader(report_row):
+    class BrokenRedis:
+        async def mget(self, *keys):
+            raise ConnectionError("redis down")
+
+    cache = make_cache(BrokenRedis(), local_ttl=0)
+    loader = Loader(report_row, executor=5)
+    assert (await cache.get_or_load(Report, 1, loader)).executor == 5
+    assert (await cache.get_or_load(Report, 1, loader)).executor == 5
+    assert loader.calls == 2
+
+
+@pytest.fixture
+def cached_manager(session_maker, redis):
+    # 在夹具内定义, 定义即注册到全局 entity_cache, 用例结束后注销
+    class CachedReportManager(BaseManager):
+        orm_table = Report
+        entity_cache_ttl = 60
+
+    entity_cache.bind_redis(redis)
+    yield CachedReportManager()
+    entity_cache.bind_redis(None)
+    entity_cache._models.pop(Report.__tablename__, None)
+    entity_cache.clear_local()
+
+
+async def test_query_by_id_invalidated_by_update(cached_manager, report_row):
+    pk_id = await cached_manager.add(report_row(executor=1))
+    assert (await cached_manager.query_by_id(pk_id)).executor == 1
+    assert (await cached_manager.query_by_id(pk_id)).executor == 1
+    assert entity_cache.stats()[Report.__tablename__]["local_hits"] >= 1
+
+    await cached_manager.update({"executor": 2}, conds=[Report.id == pk_id])
+    assert (await cached_manager.query_by_id(pk_id)).executor == 2
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/11 11:30
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import app.middlewares.middlewares as middlewares
+from app.crud.instrumentation import OTHER_ROUTE, UNMATCHED_ROUTE, QueryStats
+from app.middlewares.middlewares import LoggingMiddleware
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def stats(monkeypatch) -> QueryStats:
+    stats = QueryStats(max_routes=3)
+    monkeypatch.setattr(middlewares, "query_stats", stats)
+    return stats
+
+
+async def test_routes_grouped_by_template(stats):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    transport = httpx.ASGITransport(app=LoggingMiddleware(app, sample_rate=0))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for path in ("/items/1", "/items/2", "/wp-login.php", "/.env", "/items/x/y"):
+            await client.get(path)
+
+    assert stats.routes["GET /items/{item_id}"].count == 2
+    assert stats.routes[UNMATCHED_ROUTE].count == 3
+    assert set(stats.routes) == {"GET /items/{item_id}", UNMATCHED_ROUTE}
+
+
+async def test_route_entries_capped(stats):
+    for idx in range(5):
+        stats.end_request(f"GET /r{idx}", stats.begin_request(f"/r{idx}"))
+    stats.end_request("GET /r0", stats.begin_request("/r0"))
+
+    assert set(stats.routes) == {"GET /r0", "GET /r1", "GET /r2", OTHER_ROUTE}
+    assert stats.routes["GET /r0"].count == 2
+    assert stats.routes[OTHER_ROUTE].count == 2
+    assert stats.snapshot()["routes"][OTHER_ROUTE]["queries_per_request"]["count"] == 2
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/9 20:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import pytest
+from sqlalchemy import desc
+
+import app.crud as crud
+from app.crud.unit_of_work import unit_of_work
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_keyset_pages_match_offset_pages(manager, report_row):
+    # env 有大量重复值, 游标分页自动补上与最后一列同向的 id 排序
+    await manager.bulk_add([report_row(env=i % 3) for i in range(25)])
+    orders = [desc(Report.env)]
+
+    offset_ids = []
+    for page in range(1, 4):
+        _, rows = await manager.list_page(orders=[desc(Report.env), desc(Report.id)], curr_page=page, page_size=10)
+        offset_ids.extend(row.id for row in rows)
+
+    keyset_ids, cursor, pages = [], None, 0
+    while True:
+        total, rows, cursor = await manager.list_page(orders=orders, keyset=True, cursor=cursor, page_size=10)
+        assert total == 25
+        keyset_ids.extend(row.id for row in rows)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert keyset_ids == offset_ids
+    assert len(set(keyset_ids)) == 25
+
+
+async def test_keyset_respects_conds(manager, report_row):
+    await manager.bulk_add([report_row(env=i % 2) for i in range(9)])
+    total, rows, cursor = await manager.list_page(conds=[Report.env == 1], keyset=True, page_size=3)
+    assert total == 4 and len(rows) == 3 and cursor
+    total, rows, cursor = await manager.list_page(conds=[Report.env == 1], cursor=cursor, page_size=3)
+    assert [row.env for row in rows] == [1] and cursor is None
+
+
+async def test_cursor_must_match_orders(manager, report_row):
+    await manager.bulk_add([report_row() for _ in range(3)])
+    _, _, cursor = await manager.list_page(orders=[desc(Report.env)], keyset=True, page_size=1)
+    with pytest.raises(ValueError):
+        await manager.list_page(orders=[Report.id], cursor=cursor, page_size=1)
+
+
+async def test_page_in_unit_of_work_uses_shared_session(manager, report_row, monkeypatch):
+    await manager.bulk_add([report_row() for _ in range(3)])
+    async with unit_of_work():
+        await manager.add(report_row())
+        # 总数与数据在共享会话中顺序查询, 都能看到本请求未提交的写入
+        monkeypatch.setattr(crud, "async_session_maker", None)
+        total, rows = await manager.list_page(page_size=10)
+        assert total == 4 and len(rows) == 4
+        total, rows, cursor = await manager.list_page(keyset=True, page_size=3)
+        assert total == 4 and len(rows) == 3 and cursor
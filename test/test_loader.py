@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/11 14:00
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+
+import pytest
+
+from app.crud.loader import BatchLoader
+from app.crud.unit_of_work import unit_of_work
+
+pytestmark = pytest.mark.asyncio
+
+
+class RecordingBatch:
+    """ 记录每次收到的键列表, 返回 {键: 键 * 10}, 键在 missing 中的不返回 """
+
+    def __init__(self, missing=(), error: Exception = None):
+        self.calls = []
+        self.missing = set(missing)
+        self.error = error
+
+    async def __call__(self, keys):
+        self.calls.append(list(keys))
+        if self.error is not None:
+            raise self.error
+        return {key: key * 10 for key in keys if key not in self.missing}
+
+
+async def test_dedupes_keys_in_one_batch():
+    batch_fn = RecordingBatch()
+    loader = BatchLoader(batch_fn, cache=False)
+    results = await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), loader.load(3))
+    assert results == [10, 20, 10, 30]
+    assert batch_fn.calls == [[1, 2, 3]]
+
+
+async def test_dispatches_once_per_tick():
+    batch_fn = RecordingBatch()
+    loader = BatchLoader(batch_fn, cache=False)
+    assert await loader.load_many([1, 2]) == [10, 20]
+    assert await loader.load_many([2, 3]) == [20, 30]
+    # 不缓存时下一个 tick 重新加载
+    assert batch_fn.calls == [[1, 2], [2, 3]] and loader.batches == 2
+
+
+async def test_cache_and_max_batch_size():
+    batch_fn = RecordingBatch()
+    loader = BatchLoader(batch_fn, max_batch_size=2)
+    assert await loader.load_many([1, 2, 3]) == [10, 20, 30]
+    assert batch_fn.calls == [[1, 2], [3]]
+    assert await loader.load_many([3, 1, 4]) == [30, 10, 40]
+    assert batch_fn.calls[-1] == [4]
+
+    loader.prime(5, "primed")
+    loader.clear(1)
+    assert await loader.load_many([5, 1]) == ["primed", 10]
+    assert batch_fn.calls[-1] == [1]
+
+
+async def test_missing_keys_resolve_to_none():
+    loader = BatchLoader(RecordingBatch(missing={2}))
+    assert await loader.load_many([1, 2]) == [10, None]
+
+
+async def test_exception_reaches_every_waiter():
+    batch_fn = RecordingBatch(error=RuntimeError("db down"))
+    loader = BatchLoader(batch_fn)
+    results = await asyncio.gather(loader.load(1), loader.load(2), loader.load(1), return_exceptions=True)
+    assert all(isinstance(ret, RuntimeError) for ret in results) and len(results) == 3
+    assert batch_fn.calls == [[1, 2]]
+
+    # 失败的键不缓存, 下次重新加载
+    batch_fn.error = None
+    assert await loader.load(1) == 10
+    assert batch_fn.calls[-1] == [1]
+
+
+async def test_load_by_id_batches_queries(manager, report_row, monkeypatch):
+    await manager.bulk_add([report_row(env=idx) for idx in range(3)])
+    ids = [row.id for row in await manager.query_all()]
+    calls = []
+    query_by_ids = manager._query_by_ids
+
+    async def spy(pk_ids, **kwargs):
+        calls.append(list(pk_ids))
+        return await query_by_ids(pk_ids, **kwargs)
+
+    monkeypatch.setattr(manager, "_query_by_ids", spy)
+    manager._id_loaders.clear()
+
+    rows = await asyncio.gather(*(manager.load_by_id(pk_id) for pk_id in [*ids, ids[0], 9999]))
+    assert [row.env if row else None for row in rows] == [0, 1, 2, 0, None]
+    assert calls == [[*ids, 9999]]
+
+    async with unit_of_work():
+        assert (await manager.load_by_id(ids[1])).env == 1
+        # 请求内相同主键只查询一次
+        assert [row.id for row in await manager.load_by_ids([ids[1], ids[2]])] == ids[1:]
+    assert calls[1:] == [[ids[1]], [ids[2]]]
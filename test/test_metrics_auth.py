@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/10 11:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.apis.v1.common import router
+from app.commons.auth import create_token, decode_token
+from app.exceptions import register_global_exceptions_handler
+from app.exceptions.global_exception import AuthorizationException
+from config import Settings
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    register_global_exceptions_handler(app)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def _bearer(**claims) -> dict:
+    return {"Authorization": f"Bearer {create_token(claims)}"}
+
+
+async def test_decode_token_rejects_tampering():
+    token = create_token({"role": Settings.ADMIN})
+    assert decode_token(token)["role"] == Settings.ADMIN
+    header, payload, signature = token.split(".")
+    forged = create_token({"role": Settings.MEMBER}).split(".")[1]
+    for bad in (f"{header}.{forged}.{signature}", token[:-2], "x.y", create_token({}, expired_minutes=-1)):
+        with pytest.raises(AuthorizationException):
+            decode_token(bad)
+
+
+@pytest.mark.parametrize("path", ["/metrics/queries?reset=true", "/metrics/index-advice", "/metrics/admission"])
+async def test_metrics_require_admin(client, path):
+    async with client:
+        assert (await client.get(path)).status_code == 401
+        assert (await client.get(path, headers=_bearer(role=Settings.MEMBER))).status_code == 401
+
+
+async def test_index_advice_skips_primary_without_replica(client):
+    async with client:
+        resp = await client.get("/metrics/index-advice", headers=_bearer(role=Settings.ADMIN))
+    assert resp.status_code == 200 and resp.json()["code"] == 400
+
+
+async def test_query_metrics_for_admin(client):
+    async with client:
+        resp = await client.get("/metrics/queries", headers=_bearer(role=Settings.ADMIN))
+    assert resp.json()["code"] == 200
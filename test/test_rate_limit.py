@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/10 17:00
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import fakeredis.aioredis
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import app.commons.rate_limit as rate_limit
+from app.commons.rate_limit import LoadShedder, LocalTokenBuckets, RateLimiter
+from app.middlewares.middlewares import AdmissionMiddleware
+from config import Settings
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeClock:
+    """ 替换 rate_limit 模块中的 time, 手动推进 monotonic """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", fake)
+    return fake
+
+
+def scope(ip: str = "10.0.0.1", path: str = "/api", headers: list = None) -> dict:
+    return {"type": "http", "method": "GET", "path": path, "headers": headers or [], "client": (ip, 1234)}
+
+
+async def test_local_bucket_burst_and_refill(clock):
+    buckets = LocalTokenBuckets()
+    bucket = [("ip:a", 2, 3)]
+    assert [buckets.acquire(bucket) for _ in range(3)] == [0, 0, 0]
+    # 桶空, 补充 1 个令牌需要 1 / rate 秒
+    assert buckets.acquire(bucket) == pytest.approx(0.5)
+
+    clock.now += 0.25
+    assert buckets.acquire(bucket) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert buckets.acquire(bucket) == 0
+    # 长时间空闲最多补满到桶容量
+    clock.now += 100
+    assert [buckets.acquire(bucket) for _ in range(4)] == [0, 0, 0, pytest.approx(0.5)]
+
+
+async def test_local_bucket_cost(clock):
+    buckets = LocalTokenBuckets()
+    bucket = [("route:/upload", 1, 5)]
+    assert buckets.acquire(bucket, cost=4) == 0
+    assert buckets.acquire(bucket, cost=3) == pytest.approx(2)
+    clock.now += 2
+    assert buckets.acquire(bucket, cost=3) == 0
+
+
+async def test_local_buckets_all_or_nothing(clock):
+    buckets = LocalTokenBuckets()
+    ip, user = ("ip:a", 1, 1), ("user:u", 1, 5)
+    assert buckets.acquire([ip, user]) == 0
+    # ip 桶不足时整体拒绝, user 桶不扣减
+    assert buckets.acquire([ip, user]) == pytest.approx(1)
+    assert [buckets.acquire([user]) for _ in range(5)] == [0, 0, 0, 0, pytest.approx(1)]
+
+
+async def test_local_buckets_evict_least_recent(clock):
+    buckets = LocalTokenBuckets(maxsize=2)
+    for key in ("a", "b", "c"):
+        assert buckets.acquire([(key, 1, 1)]) == 0
+    assert list(buckets._buckets) == ["b", "c"]
+    # 被淘汰的桶重新装满
+    assert buckets.acquire([("a", 1, 1)]) == 0
+    assert buckets.acquire([("c", 1, 1)]) == pytest.approx(1)
+
+
+async def test_redis_buckets_shared_between_workers():
+    redis = fakeredis.aioredis.FakeRedis()
+    workers = [RateLimiter(ip_rate=1, ip_burst=2, user_rate=0), RateLimiter(ip_rate=1, ip_burst=2, user_rate=0)]
+    for limiter in workers:
+        limiter.bind_redis(redis)
+    assert await workers[0].check(scope()) == 0
+    assert await workers[1].check(scope()) == 0
+    assert 0 < await workers[0].check(scope()) <= 1
+    assert await workers[1].check(scope(ip="10.0.0.2")) == 0
+    assert workers[0].stats()["backend"] == "redis"
+
+
+async def test_redis_failure_falls_back_to_local():
+    async def broken_script(keys, args):
+        raise ConnectionError("redis down")
+
+    limiter = RateLimiter(ip_rate=1, ip_burst=1, user_rate=0)
+    limiter.bind_redis(fakeredis.aioredis.FakeRedis())
+    limiter._script = broken_script
+    assert await limiter.check(scope()) == 0
+    assert await limiter.check(scope()) > 0
+    assert limiter.stats()["backend"] == "local"
+
+
+async def test_forwarded_ip_only_when_trusted():
+    forwarded = [(b"x-forwarded-for", b"1.1.1.1, 10.0.0.9")]
+    assert RateLimiter().client_ip(scope(headers=forwarded)) == "10.0.0.1"
+    assert RateLimiter(trust_forwarded=True).client_ip(scope(headers=forwarded)) == "1.1.1.1"
+
+
+async def test_load_shedder_ratio():
+    shedder = LoadShedder(loop_lag_ms=100, pool_wait_ms=0, smoothing=1)
+    shedder.sample(150)
+    assert shedder.shed_ratio() == pytest.approx(0.5)
+    shedder.sample(250)
+    assert shedder.should_shed() and shedder.shed_count == 1
+    shedder.sample(0)
+    assert not shedder.should_shed()
+
+
+async def test_load_shedder_off_by_default():
+    shedder = LoadShedder(
+        enabled=Settings.SHED_ENABLED, loop_lag_ms=Settings.SHED_LOOP_LAG_MS, pool_wait_ms=Settings.SHED_POOL_WAIT_MS,
+        smoothing=1,
+    )
+    assert not Settings.SHED_ENABLED and not shedder.enabled
+    # 关闭时不启动采样任务, 即使指标超过阈值也不丢弃
+    shedder.start()
+    assert shedder._task is None
+    shedder.sample(10_000)
+    assert not shedder.should_shed() and shedder.shed_count == 0
+
+
+async def test_admission_middleware_returns_429():
+    app = FastAPI()
+
+    @app.get("/api")
+    async def api():
+        return {"ok": True}
+
+    limiter = RateLimiter(ip_rate=1, ip_burst=1, user_rate=0)
+    middleware = AdmissionMiddleware(app, limiter=limiter, shedder=LoadShedder(0, 0), exempt_paths=["/docs"])
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url="http://test") as client:
+        assert (await client.get("/api")).status_code == 200
+        resp = await client.get("/api")
+        assert resp.status_code == 429 and resp.json()["code"] == 429
+        assert int(resp.headers["retry-after"]) >= 1
+        # 豁免的路径不经过限流
+        assert [(await client.get("/docs")).status_code for _ in range(3)] == [200, 200, 200]
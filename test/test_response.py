@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/10 15:30
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import gzip
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.commons import R
+from app.commons.response import RJSONResponse, RRoute, _accepts_gzip
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def client():
+    app = FastAPI(default_response_class=RJSONResponse)
+    app.router.route_class = RRoute
+
+    @app.get("/big")
+    async def big():
+        return R.success(data="x" * (RJSONResponse.gzip_min_size + 10))
+
+    @app.get("/small")
+    async def small():
+        return R.success(data="x")
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", True),
+    ("gzip, deflate, br", True),
+    ("br;q=1.0, gzip;q=0.5", True),
+    ("GZIP", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.000", False),
+    ("*", True),
+    ("*;q=0", False),
+    ("gzip;q=0, *", False),
+    ("br", False),
+    ("gzip;q=abc", False),
+    ("", False),
+])
+async def test_accepts_gzip(accept_encoding, expected):
+    assert _accepts_gzip(accept_encoding) is expected
+
+
+@pytest.mark.parametrize("accept_encoding, compressed", [("gzip", True), ("gzip;q=0", False), ("identity", False)])
+async def test_large_body_varies_on_accept_encoding(client, accept_encoding, compressed):
+    async with client:
+        resp = await client.get("/big", headers={"Accept-Encoding": accept_encoding})
+    assert resp.headers["vary"] == "Accept-Encoding"
+    assert (resp.headers.get("content-encoding") == "gzip") is compressed
+    assert resp.json()["code"] == 200
+
+
+async def test_small_body_not_compressed(client):
+    async with client:
+        resp = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "vary" not in resp.headers and "content-encoding" not in resp.headers
+
+
+async def test_compressed_body_roundtrip():
+    resp = RJSONResponse(R.success(data="y" * RJSONResponse.gzip_min_size))
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await resp({"type": "http", "headers": [(b"accept-encoding", b"gzip")]}, None, send)
+    start, body = sent
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    assert gzip.decompress(body["body"]).startswith(b'{"code":200')
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/10 16:00
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import fakeredis
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.commons import R
+from app.commons.response import RJSONResponse, RRoute
+from app.commons.response_cache import ResponseCache, response_cache
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_client(cache: ResponseCache, manager, calls: list) -> httpx.AsyncClient:
+    app = FastAPI(default_response_class=RJSONResponse)
+    app.router.route_class = RRoute
+
+    @app.get("/reports")
+    @cache(ttl=60, tags=[Report])
+    async def reports(env: int = 1):
+        calls.append(env)
+        return R.success(data=await manager.count(conds=[Report.env == env]))
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.fixture
+def calls() -> list:
+    return []
+
+
+@pytest.fixture
+def client(manager, calls):
+    return make_client(response_cache, manager, calls)
+
+
+async def test_etag_and_not_modified(client, calls):
+    async with client:
+        first = await client.get("/reports")
+        etag = first.headers["etag"]
+        assert first.status_code == 200 and first.json()["data"] == 0
+        assert first.headers["cache-control"] == "private, max-age=0, must-revalidate"
+
+        second = await client.get("/reports", headers={"If-None-Match": etag})
+        assert second.status_code == 304 and second.content == b""
+        assert second.headers["etag"] == etag
+
+        third = await client.get("/reports", headers={"If-None-Match": f'W/{etag}, "other"'})
+        assert third.status_code == 304
+    assert calls == [1]
+
+
+async def test_write_invalidates_tag(client, calls, manager, report_row):
+    async with client:
+        etag = (await client.get("/reports")).headers["etag"]
+        await manager.add(report_row())
+        resp = await client.get("/reports", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.json()["data"] == 1
+    assert resp.headers["etag"] != etag
+    assert calls == [1, 1]
+
+
+async def test_cache_key_varies_by_query_and_user(client, calls):
+    async with client:
+        await client.get("/reports?env=1")
+        await client.get("/reports?env=2")
+        await client.get("/reports?env=1", headers={"Authorization": "Bearer a"})
+        await client.get("/reports?env=1", headers={"Authorization": "Bearer a"})
+        await client.get("/reports?env=1")
+    assert calls == [1, 2, 1]
+
+
+async def test_redis_tier_shared_between_workers(manager, report_row):
+    redis = fakeredis.aioredis.FakeRedis()
+    workers = [ResponseCache(local_ttl=5), ResponseCache(local_ttl=5)]
+    calls = [[], []]
+    clients = [make_client(cache, manager, calls[idx]) for idx, cache in enumerate(workers)]
+    for cache in workers:
+        cache.bind_redis(redis)
+
+    etag = (await clients[0].get("/reports")).headers["etag"]
+    resp = await clients[1].get("/reports", headers={"If-None-Match": etag})
+    assert resp.status_code == 304 and calls == [[1], []]
+
+    # 另一个进程写入后失效标签, 两边的 redis 条目都作废
+    await manager.add(report_row())
+    await workers[1].invalidate([Report])
+    workers[0].clear_local()
+    resp = await clients[0].get("/reports", headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.json()["data"] == 1
+    assert calls == [[1, 1], []]
+    for client in clients:
+        await client.aclose()
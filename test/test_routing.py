@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/11 10:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import app.crud as crud
+from app.crud.routing import ReplicaRouter
+from app.models import BaseOrmTable
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+class StubReplica:
+    """ 副本替身: 独立的 sqlite 库, 可以让建立连接或执行语句抛出指定异常 """
+
+    def __init__(self, tmp_path):
+        self.connect_error = None
+        self.execute_error = None
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(self.engine.sync_engine.pool, "checkout", self._checkout)
+        self.router = ReplicaRouter([self.engine], read_your_writes=0)
+        self.replica = self.router.replicas[0]
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        if self.connect_error is not None:
+            raise self.connect_error
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.execute_error is not None and statement.lstrip().upper().startswith("SELECT"):
+            raise self.execute_error
+
+
+@pytest_asyncio.fixture
+async def replica(tmp_path, session_maker, monkeypatch, report_row):
+    stub = StubReplica(tmp_path)
+    async with stub.engine.begin() as conn:
+        await conn.run_sync(BaseOrmTable.metadata.create_all, tables=[Report.__table__])
+        # 副本上 2 行, 主库上 1 行, 用行数区分查询落在哪个库
+        await conn.execute(Report.__table__.insert(), [report_row(), report_row()])
+    async with session_maker.begin() as session:
+        await session.execute(Report.__table__.insert(), [report_row()])
+    monkeypatch.setattr(crud, "replica_router", stub.router)
+    yield stub
+    await stub.engine.dispose()
+
+
+CONNECTION_ERRORS = [
+    ConnectionRefusedError("replica down"),
+    DBAPIError("SELECT 1", {}, Exception("server has gone away"), connection_invalidated=True),
+]
+
+SQL_ERRORS = [
+    OperationalError("SELECT 1", {}, Exception("Deadlock found when trying to get lock")),
+    OperationalError("SELECT 1", {}, Exception("Lock wait timeout exceeded")),
+]
+
+
+async def test_reads_use_healthy_replica(manager, replica):
+    assert await manager.count() == 2
+    total, rows = await manager.list_page()
+    assert total == 2 and len(rows) == 2
+    # 强制主库
+    assert await manager.count(use_primary=True) == 1
+
+
+@pytest.mark.parametrize("error", CONNECTION_ERRORS)
+async def test_connection_failure_falls_back_to_primary(manager, replica, error):
+    replica.connect_error = error
+    assert await manager.count() == 1
+    assert not replica.replica.healthy
+    # 标记为不健康后不再路由到副本
+    replica.connect_error = None
+    assert await manager.count() == 1
+
+
+@pytest.mark.parametrize("error", CONNECTION_ERRORS)
+async def test_list_page_falls_back_to_primary(manager, replica, error):
+    replica.connect_error = error
+    total, rows = await manager.list_page()
+    assert total == 1 and len(rows) == 1
+    assert not replica.replica.healthy
+
+
+@pytest.mark.parametrize("error", SQL_ERRORS)
+async def test_sql_error_does_not_fall_back(manager, replica, error, monkeypatch):
+    replica.execute_error = error
+    primary_sessions = []
+    monkeypatch.setattr(crud, "async_session_maker", lambda: primary_sessions.append(1))
+    # with_session 记录日志后返回 None, 不在主库上重试
+    assert await manager.count() is None
+    assert replica.replica.healthy and primary_sessions == []
+
+
+async def test_statement_timeout_does_not_fall_back(manager, replica):
+    replica.execute_error = TimeoutError("statement exceeded timeout")
+    with pytest.raises(TimeoutError):
+        await manager.count()
+    assert replica.replica.healthy
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/9 20:50
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import pytest
+from sqlalchemy import select
+
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_cached_template_binds_new_values(manager, report_row):
+    await manager.bulk_add([report_row(env=env, executor=env * 10) for env in range(1, 6)])
+    cache = manager.statement_cache
+
+    first = await manager.execute_select(await manager.select(env__gt=3))
+    misses = cache.misses
+    second = await manager.execute_select(await manager.select(env__gt=1))
+    assert cache.misses == misses, "same filter shape must reuse the cached template"
+    assert sorted(row["env"] for row in first) == [4, 5]
+    assert sorted(row["env"] for row in second) == [2, 3, 4, 5]
+
+
+async def test_expanding_between_and_or_filters(manager, report_row):
+    await manager.bulk_add([report_row(env=env, executor=env * 10) for env in range(1, 6)])
+
+    rows = await manager.execute_select(await manager.select(env__in=[1, 5]))
+    assert sorted(row["env"] for row in rows) == [1, 5]
+    rows = await manager.execute_select(await manager.select(env__in=[2, 3, 4]))
+    assert sorted(row["env"] for row in rows) == [2, 3, 4]
+
+    rows = await manager.execute_select(await manager.select(env__between=(2, 3)))
+    assert sorted(row["env"] for row in rows) == [2, 3]
+
+    rows = await manager.execute_select(await manager.select(env__or={"lt": 2, "gt": 4}))
+    assert sorted(row["env"] for row in rows) == [1, 5]
+
+
+async def test_none_is_part_of_the_template(manager, report_row):
+    await manager.bulk_add([report_row(plan_id=None), report_row(plan_id=7)])
+    rows = await manager.execute_select(await manager.select(plan_id=None))
+    assert [row["plan_id"] for row in rows] == [None]
+    rows = await manager.execute_select(await manager.select(plan_id=7))
+    assert [row["plan_id"] for row in rows] == [7]
+
+
+async def test_combined_filters_do_not_collide(manager, report_row):
+    await manager.bulk_add([report_row(env=env, executor=env * 10) for env in range(1, 6)])
+    # 两组过滤条件的参数名相同(f0), unique_params 匿名化后互不覆盖
+    env_filter = manager._parse_filters(env__gte=2)
+    executor_filter = manager._parse_filters(executor__lte=30)
+    stmt = select(Report.env).where(*env_filter, *executor_filter)
+    rows = await manager.execute_select(stmt)
+    assert sorted(row["env"] for row in rows) == [2, 3]
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/10 14:10
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.crud.timeouts import StatementTimeout
+from app.crud.unit_of_work import unit_of_work
+
+pytestmark = pytest.mark.asyncio
+
+
+class SlowStatements:
+    """ 把受超时控制的数据库调用替换成 1 秒的等待, 记录每次的 StatementTimeout 与作废的连接 """
+
+    def __init__(self, monkeypatch):
+        self.enabled = True
+        self.deadlines = []
+        self.invalidated = []
+        real_run, real_invalidate = StatementTimeout.run, AsyncConnection.invalidate
+
+        async def slow_run(deadline, awaitable):
+            if not self.enabled:
+                return await real_run(deadline, awaitable)
+            awaitable.close()
+            self.deadlines.append(deadline)
+            return await real_run(deadline, asyncio.sleep(1))
+
+        async def invalidate(conn, exception=None):
+            self.invalidated.append(conn)
+            await real_invalidate(conn, exception)
+
+        monkeypatch.setattr(StatementTimeout, "run", slow_run)
+        monkeypatch.setattr(AsyncConnection, "invalidate", invalidate)
+
+
+@pytest.fixture
+def slow_statements(monkeypatch) -> SlowStatements:
+    return SlowStatements(monkeypatch)
+
+
+async def test_timeout_invalidates_owned_connection(manager, slow_statements):
+    with pytest.raises(TimeoutError):
+        await manager.run_sql("SELECT 1", timeout=0.01)
+    with pytest.raises(TimeoutError):
+        await manager.run_sql_many("UPDATE alden_report SET status = :status", [{"status": 1}], timeout=0.01)
+    assert [deadline.owned for deadline in slow_statements.deadlines] == [True, True]
+    assert slow_statements.invalidated == [deadline.conn for deadline in slow_statements.deadlines]
+
+
+async def test_timeout_keeps_shared_connection(manager, report_row, slow_statements):
+    async with unit_of_work():
+        first = await manager.add(report_row())
+        with pytest.raises(TimeoutError):
+            await manager.run_sql("SELECT 1", timeout=0.01)
+        slow_statements.enabled = False
+        second = await manager.add(report_row())
+
+    deadline, = slow_statements.deadlines
+    assert not deadline.owned and slow_statements.invalidated == []
+    assert [row.id for row in await manager.query_all()] == [first, second]
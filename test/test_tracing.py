@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/11 16:10
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import orjson
+import pytest
+
+from app.commons.tracing import Span, SpanExporter
+from config import Settings
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_span(idx: int) -> Span:
+    return Span(trace_id="0" * 32, span_id=f"{idx:016x}", parent_id=None, name=f"span-{idx}", kind="internal",
+                start_ns=1_000_000, end_ns=2_000_000)
+
+
+async def test_file_export_disabled_by_default():
+    assert Settings.TRACE_EXPORT_FILE == ""
+    assert not SpanExporter(file_path=Settings.TRACE_EXPORT_FILE).enabled
+
+
+async def test_file_export_rotates_by_size(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    line_size = len(orjson.dumps(make_span(0).to_dict())) + 1
+    exporter = SpanExporter(file_path=str(path), batch_size=1, max_bytes=line_size * 2, backups=2)
+
+    for idx in range(7):
+        exporter.submit(make_span(idx))
+    await exporter.flush()
+
+    def names(file) -> list:
+        return [orjson.loads(line)["name"] for line in file.read_bytes().splitlines()]
+
+    # 每个文件最多 2 行, 只保留 2 个备份, 最旧的 span-0 与 span-1 被删除
+    assert names(path) == ["span-6"]
+    assert names(tmp_path / "spans.jsonl.1") == ["span-4", "span-5"]
+    assert names(tmp_path / "spans.jsonl.2") == ["span-2", "span-3"]
+    assert not (tmp_path / "spans.jsonl.3").exists()
+    assert exporter.exported == 7
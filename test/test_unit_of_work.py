@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Version  : Python 3.12
+@Time     : 2024/8/10 10:20
+@Author   : wiesZheng
+@Software : PyCharm
+"""
+import pytest
+from pydantic import BaseModel
+from sqlalchemy import func, select
+
+from app.crud.entity_cache import entity_cache
+from app.crud.unit_of_work import unit_of_work
+from app.middlewares.middlewares import UnitOfWorkMiddleware
+from app.models.report import Report
+
+pytestmark = pytest.mark.asyncio
+
+
+class ReportCreate(BaseModel):
+    executor: int = 1
+    env: int = 1
+    cost: str = "1s"
+    status: int = 0
+    created_by: int = 1
+    updated_by: int = 1
+
+
+async def _count(session_maker) -> int:
+    async with session_maker() as session:
+        return await session.scalar(select(func.count()).select_from(Report))
+
+
+async def test_entity_invalidation_deferred_until_commit(manager, report_row, monkeypatch):
+    invalidated = []
+
+    async def fake_invalidate(orm_table, pk_ids=None):
+        invalidated.append(pk_ids)
+
+    monkeypatch.setattr(entity_cache, "invalidate", fake_invalidate)
+    pk_id = await manager.add(report_row())
+    async with unit_of_work():
+        await manager.update({"env": 2}, conds=[Report.id == pk_id])
+        await manager.delete(conds=[Report.id == pk_id])
+        assert invalidated == []
+    assert invalidated == [[pk_id], [pk_id]]
+
+    await manager.update({"env": 3}, conds=[Report.id == pk_id])
+    assert invalidated[-1] == [pk_id]
+
+
+async def test_create_commit_deferred_in_unit_of_work(manager, session_maker):
+    with pytest.raises(RuntimeError):
+        async with unit_of_work():
+            await manager.create(object=ReportCreate(), commit=True)
+            raise RuntimeError("rollback")
+    assert await _count(session_maker) == 0
+
+    await manager.create(object=ReportCreate(), commit=True)
+    assert await _count(session_maker) == 1
+
+
+async def test_middleware_commits_before_response(manager, session_maker, report_row):
+    async def app(scope, receive, send):
+        await manager.add(report_row())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    counts = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            counts.append(await _count(session_maker))
+
+    await UnitOfWorkMiddleware(app)({"type": "http"}, None, send)
+    assert counts == [1]